@@ -9,8 +9,22 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up by get_asgi_application()
+from core.stream import EventStream  # noqa: E402
+
+events_application = EventStream()
+
+
+async def application(scope, receive, send):
+    """Serve the event stream natively, everything else through Django"""
+    if scope['type'] == 'http' and scope['path'] == settings.EVENTS_PATH:
+        await events_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+from datetime import timedelta
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -45,6 +46,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MemoryProfileMiddleware',
+    'core.middleware.SlowQueryMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -89,6 +93,142 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+RECIPE_STATS_CACHE_TIMEOUT = 300
+RECIPE_COUNT_CACHE_TIMEOUT = 24 * 60 * 60
+# Tables estimated to hold more rows than this are not counted exactly
+ESTIMATED_COUNT_THRESHOLD = 10000
+# Bounds how long a rename racing a render can leave a stale fragment
+RECIPE_FRAGMENT_CACHE_TIMEOUT = 60 * 60
+SINGLE_FLIGHT_STALE_TIMEOUT = 300
+SINGLE_FLIGHT_LOCK_TIMEOUT = 30
+SINGLE_FLIGHT_WAIT = 5
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+RECIPE_IMPORT_CHUNK_SIZE = 500
+UPSERT_MAX_NAMES = 500
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 25
+AUTOCOMPLETE_FUZZY_MIN_LENGTH = 3
+AUTOCOMPLETE_CACHE_TIMEOUT = 60
+RECIPE_INDEX_MAX_USERS = 200
+# Seconds an index is trusted when the cache is not shared by processes
+RECIPE_INDEX_LOCAL_TTL = 60
+PANTRY_MAX_INGREDIENTS = 500
+PANTRY_MAX_RESULTS = 100
+SIMILAR_RECIPES_STORED = 20
+SIMILAR_MAX_POSTING = 5000
+SIMILAR_BUILD_CHUNK_SIZE = 500
+SIMILAR_REFRESH_DELAY = 60
+SHOPPING_LIST_MAX_RECIPES = 100
+
+
+# Batch requests
+
+BATCH_ALLOWED_PREFIXES = ('/api/user/', '/api/recipe/')
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 4
+
+
+# Change feed
+
+SYNC_PAGE_SIZE = 500
+SYNC_TOMBSTONE_RETENTION_DAYS = 30
+# Seconds a transaction may take to commit without clients missing it
+SYNC_COMMIT_LOOKBACK = 10
+
+
+# Background tasks
+
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_BACKOFF = 10
+TASK_RETRY_BACKOFF_MAX = 3600
+TASK_LOCK_TIMEOUT = 600
+# Running tasks refresh their lock this often, well within the timeout
+TASK_HEARTBEAT_INTERVAL = 60
+# Finished tasks are deleted by purge_tasks after this many days
+TASK_RETENTION_DAYS = 7
+
+PURGE_BATCH_SIZE = 500
+PURGE_BATCHES_PER_TASK = 20
+
+
+# API tokens
+# Tokens expire after AUTH_TOKEN_TTL without use. Use extends them, but
+# at most once per AUTH_TOKEN_RENEW_INTERVAL to spare a write per request.
+
+AUTH_TOKEN_TTL = timedelta(
+    days=int(os.environ.get('AUTH_TOKEN_TTL_DAYS', 30))
+)
+AUTH_TOKEN_RENEW_INTERVAL = timedelta(hours=1)
+AUTH_TOKEN_MAX_PER_USER = 20
+PURGE_TOKENS_BATCH_SIZE = 1000
+
+
+# Slow query log
+# Set SLOW_QUERY_THRESHOLD_MS to an empty string to disable it.
+
+SLOW_QUERY_THRESHOLD_MS = (
+    float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))
+    if os.environ.get('SLOW_QUERY_THRESHOLD_MS', '200') else None
+)
+SLOW_QUERY_LOG = os.environ.get(
+    'SLOW_QUERY_LOG',
+    '/vol/web/logs/slow_queries.log'
+)
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 5
+
+
+# Event stream
+# Server-Sent Events of library changes, served by app/asgi.py, so the
+# app must run under an ASGI server such as uvicorn; runserver does not
+# serve them. The default backend only reaches streams in the process
+# that made the change; ChangeFeedBackend polls the change feed to reach
+# all of them.
+
+EVENTS_PATH = '/api/events/'
+EVENTS_BACKEND = os.environ.get(
+    'EVENTS_BACKEND',
+    'core.events.LocalBackend'
+)
+EVENTS_QUEUE_SIZE = 100
+EVENTS_MAX_STREAMS_PER_USER = 5
+EVENTS_HEARTBEAT_SECONDS = 25
+EVENTS_RETRY_MS = 5000
+EVENTS_POLL_INTERVAL = 1.0
+EVENTS_POLL_BATCH_SIZE = 1000
+# Seconds a transaction may take to commit without its events being lost
+EVENTS_POLL_LOOKBACK = 10
+
+
+# Memory profiling
+# Traces allocations with tracemalloc, which slows every allocation, so
+# it stays off unless MEMORY_PROFILING=1. Snapshots and per-route
+# histograms are served to staff under /api/diagnostics/memory/.
+
+MEMORY_PROFILING = bool(int(os.environ.get('MEMORY_PROFILING', 0)))
+MEMORY_PROFILE_FRAMES = 1
+MEMORY_PROFILE_THRESHOLD_KB = 16 * 1024
+MEMORY_PROFILE_TOP_SITES = 10
+# Share of requests that snapshot allocations first, so a flagged one
+# can be diffed against its own start
+MEMORY_PROFILE_SAMPLE_RATE = 0.1
+MEMORY_PROFILE_MAX_SNAPSHOTS = 4
+MEMORY_PROFILE_BUCKETS_KB = (64, 256, 1024, 4096, 16384, 65536)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext as _
 from core import models
+from core.paginator import EstimatedCountPaginator
 
 
 class UserAdmin(BaseUserAdmin):
@@ -31,7 +32,53 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+class AccountPurgeAdmin(admin.ModelAdmin):
+    list_display = ['email', 'stage', 'rows_deleted', 'requested', 'finished']
+    readonly_fields = [
+        'user', 'email', 'stage', 'rows_deleted', 'requested', 'finished'
+    ]
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Admin for per-user tables that grow without bound"""
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    ordering = ('-id',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class TagAdmin(LargeTableAdmin):
+    list_display = ['name', 'user', 'usage_count']
+    search_fields = ['^name']
+
+
+class IngredientAdmin(LargeTableAdmin):
+    list_display = ['name', 'user', 'usage_count']
+    search_fields = ['^name']
+
+
+class RecipeAdmin(LargeTableAdmin):
+    list_display = ['title', 'user', 'time_minutes', 'price']
+    search_fields = ['^title']
+    autocomplete_fields = ['tags', 'ingredients']
+
+    def save_model(self, request, obj, form, change):
+        """Save changes as a new version, so API clients see them"""
+        if change:
+            obj.save_next_version()
+        else:
+            super().save_model(request, obj, form, change)
+
+
+class AuthTokenAdmin(LargeTableAdmin):
+    list_display = ['user', 'name', 'created', 'expires']
+    fields = ['user', 'name', 'expires']
+
+
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Tag)
-admin.site.register(models.Ingredient)
-admin.site.register(models.Recipe)
+admin.site.register(models.Tag, TagAdmin)
+admin.site.register(models.Ingredient, IngredientAdmin)
+admin.site.register(models.Recipe, RecipeAdmin)
+admin.site.register(models.AccountPurge, AccountPurgeAdmin)
+admin.site.register(models.AuthToken, AuthTokenAdmin)
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from core.models import AuthToken
+
+
+class ExpiringTokenAuthentication(TokenAuthentication):
+    """Token authentication whose tokens lapse after a period of disuse"""
+    model = AuthToken
+
+    def authenticate_credentials(self, key):
+        """Accept live tokens, pushing their expiry forward now and then"""
+        try:
+            token = AuthToken.objects.select_related('user').get(key=key)
+        except AuthToken.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+
+        now = timezone.now()
+        if token.expires <= now:
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+
+        # Renewal is a conditional write so that a burst of requests, even
+        # concurrent ones, moves the expiry at most once per interval.
+        renew_before = now + settings.AUTH_TOKEN_TTL - \
+            settings.AUTH_TOKEN_RENEW_INTERVAL
+        if token.expires <= renew_before:
+            token.expires = now + settings.AUTH_TOKEN_TTL
+            AuthToken.objects.filter(
+                pk=token.pk,
+                expires__lte=renew_before
+            ).update(expires=token.expires)
+
+        return (token.user, token)
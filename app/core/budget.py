@@ -0,0 +1,73 @@
+from contextlib import ContextDecorator
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a block runs more queries than its budget"""
+
+
+def format_queries(queries):
+    """Return captured queries as a numbered listing"""
+    return '\n'.join(
+        f'{index}. {query["sql"]}'
+        for index, query in enumerate(queries, start=1)
+    )
+
+
+def budget_for(match, method):
+    """Return the query budget declared by the view a request resolved to"""
+    func = getattr(match, 'func', None)
+    budgets = getattr(getattr(func, 'cls', None), 'query_budgets', None)
+    if not budgets:
+        return None
+    method = method.lower()
+    actions = getattr(func, 'actions', None) or {}
+    return budgets.get(actions.get(method, method))
+
+
+class QueryBudget(ContextDecorator):
+    """Fail a block or function that runs more queries than its budget"""
+
+    def __init__(self, budget, using=DEFAULT_DB_ALIAS):
+        self.budget = budget
+        self.using = using
+
+    def __enter__(self):
+        self.context = CaptureQueriesContext(connections[self.using])
+        self.context.__enter__()
+        return self.context
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.context.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None and len(self.context) > self.budget:
+            raise QueryBudgetExceeded(
+                f'{len(self.context)} queries executed, '
+                f'budget is {self.budget}\n'
+                f'{format_queries(self.context.captured_queries)}'
+            )
+
+
+class QueryBudgetMixin:
+    """TestCase mixin asserting query counts do not grow with row counts"""
+
+    def assertQueryBudget(self, budget, request, add_rows,
+                          sizes=(1, 10), using=DEFAULT_DB_ALIAS):
+        """Run request after growing fixtures to each size in sizes"""
+        counts = []
+        created = 0
+        for size in sizes:
+            add_rows(size - created)
+            created = size
+            with QueryBudget(budget, using) as context:
+                request()
+            counts.append((size, len(context), context.captured_queries))
+
+        first_size, first_count, _ = counts[0]
+        for size, count, queries in counts[1:]:
+            if count != first_count:
+                self.fail(
+                    f'Query count grows with rows: {first_count} queries '
+                    f'for {first_size} rows, {count} for {size} rows\n'
+                    f'{format_queries(queries)}'
+                )
@@ -0,0 +1,25 @@
+from core.events import change_event, publish
+from core.models import Change, Tag, Ingredient, Recipe
+
+
+OBJECT_TYPES = {
+    Recipe: 'recipe',
+    Tag: 'tag',
+    Ingredient: 'ingredient',
+}
+
+
+def record_changes(user_id, model, ids, action=Change.UPSERT):
+    """Append change feed entries for objects of one model"""
+    ids = list(ids)
+    Change.objects.bulk_create([
+        Change(
+            user_id=user_id,
+            object_type=OBJECT_TYPES[model],
+            object_id=id_,
+            action=action
+        )
+        for id_ in ids
+    ])
+    if ids:
+        publish(user_id, change_event(OBJECT_TYPES[model], action, ids))
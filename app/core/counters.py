@@ -0,0 +1,71 @@
+import threading
+from contextlib import contextmanager
+from django.db import transaction
+from django.db.models import CharField, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from core.models import Tag, Ingredient, Recipe
+
+
+USAGE_RELATIONS = {
+    Tag: (Recipe.tags.through, 'tag'),
+    Ingredient: (Recipe.ingredients.through, 'ingredient'),
+}
+
+_releasing = threading.local()
+
+
+def refresh_usage_counts(model, ids=None):
+    """Recompute usage_count from the recipe links for the given objects"""
+    through, field = USAGE_RELATIONS[model]
+    links = through.objects.filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(total=Count('pk')).values('total')
+
+    queryset = model.objects.all()
+    if ids is None:
+        return queryset.update(usage_count=Coalesce(Subquery(links), 0))
+
+    ids = list(ids)
+    if not ids:
+        return 0
+    queryset = queryset.filter(pk__in=ids)
+    with transaction.atomic(savepoint=False):
+        # Lock the rows first: the count below then runs after concurrent
+        # link changes to the same objects have committed, and sees them.
+        list(queryset.select_for_update().order_by('pk').values_list(
+            'pk', flat=True
+        ))
+        return queryset.update(usage_count=Coalesce(Subquery(links), 0))
+
+
+def linked_usage_ids(recipes):
+    """Return {model: ids} of objects linked to recipes, in one query"""
+    models = {model._meta.model_name: model for model in USAGE_RELATIONS}
+    querysets = [
+        through.objects.filter(recipe__in=recipes).annotate(
+            kind=Value(model._meta.model_name, output_field=CharField())
+        ).order_by().values_list('kind', f'{field}_id')
+        for model, (through, field) in USAGE_RELATIONS.items()
+    ]
+    usage_ids = {model: set() for model in USAGE_RELATIONS}
+    for kind, id_ in querysets[0].union(*querysets[1:], all=True):
+        usage_ids[models[kind]].add(id_)
+    return usage_ids
+
+
+def is_releasing_usage():
+    """Return True while a bulk delete updates usage counts itself"""
+    return getattr(_releasing, 'depth', 0) > 0
+
+
+@contextmanager
+def releasing_usage(recipes):
+    """Update usage counts once for all recipes deleted in the block"""
+    usage_ids = linked_usage_ids(recipes)
+    _releasing.depth = getattr(_releasing, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _releasing.depth -= 1
+    for model, ids in usage_ids.items():
+        refresh_usage_counts(model, ids)
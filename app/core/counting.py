@@ -0,0 +1,33 @@
+import json
+from django.db import connections
+
+
+def table_estimate(queryset):
+    """Return the planner's row estimate for a model's whole table"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    # reltuples is negative for tables that were never analyzed
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def query_estimate(queryset):
+    """Return the planner's row estimate for a queryset"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import threading
+from datetime import timedelta
+from functools import lru_cache
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from core.models import Change
+
+
+logger = logging.getLogger(__name__)
+
+# Queued in place of events a slow stream could not keep up with
+RESYNC = {'type': 'resync'}
+
+
+class Subscription:
+    """Bounded queue of events for one open stream"""
+
+    def __init__(self, loop, size):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+
+    def push(self, event):
+        """Queue an event, collapsing the backlog when the queue is full"""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The client falls back to a full sync instead of the server
+            # buffering an unbounded backlog for it.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            self.overflowed = True
+
+    async def get(self):
+        event = await self.queue.get()
+        if event is RESYNC:
+            self.overflowed = False
+        return event
+
+
+class Broker:
+    """In-process fan-out of events to the streams of each user"""
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+        self._task = None
+
+    def subscribe(self, user_id):
+        """Return a subscription for user_id, or None at the stream limit"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            streams = self._subscriptions.setdefault(user_id, set())
+            if len(streams) >= settings.EVENTS_MAX_STREAMS_PER_USER:
+                return None
+            subscription = Subscription(loop, settings.EVENTS_QUEUE_SIZE)
+            streams.add(subscription)
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(get_backend().run(self))
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            streams = self._subscriptions.get(user_id, set())
+            streams.discard(subscription)
+            if not streams:
+                self._subscriptions.pop(user_id, None)
+
+    def user_ids(self):
+        """Return the users with at least one open stream"""
+        with self._lock:
+            return list(self._subscriptions)
+
+    def deliver(self, user_id, event):
+        """Pass an event to every stream of user_id, from any thread"""
+        with self._lock:
+            streams = list(self._subscriptions.get(user_id, ()))
+        for subscription in streams:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    subscription.push, event
+                )
+            except RuntimeError:
+                # The loop of the stream has been closed
+                self.unsubscribe(user_id, subscription)
+
+
+broker = Broker()
+
+
+class LocalBackend:
+    """Deliver events only to streams served by the publishing process"""
+
+    def publish(self, user_id, event):
+        broker.deliver(user_id, event)
+
+    async def run(self, broker):
+        pass
+
+
+class ChangeFeedBackend:
+    """Deliver events read from the change feed, reaching every process
+
+    One query per EVENTS_POLL_INTERVAL per process covers all its open
+    streams, however many there are.
+    """
+
+    def __init__(self):
+        # Rows at or below this id are never read again
+        self.settled = 0
+        # Rows above the settled id delivered within the lookback window
+        self.delivered = {}
+
+    def publish(self, user_id, event):
+        pass
+
+    async def run(self, broker):
+        last = await sync_to_async(self.latest)()
+        while True:
+            await asyncio.sleep(settings.EVENTS_POLL_INTERVAL)
+            user_ids = broker.user_ids()
+            if not user_ids:
+                continue
+            try:
+                rows = await sync_to_async(self.read)(user_ids, last)
+            except Exception:
+                logger.exception('Cannot read the change feed')
+                continue
+            if rows:
+                last = max(last, rows[-1][0])
+            for user_id, event in group_changes(rows):
+                broker.deliver(user_id, event)
+
+    def latest(self):
+        close_old_connections()
+        try:
+            return Change.objects.order_by('-id').values_list(
+                'id', flat=True
+            ).first() or 0
+        finally:
+            close_old_connections()
+
+    def read(self, user_ids, last):
+        """Return undelivered feed rows of user_ids, oldest first
+
+        Ids are taken before transactions commit, so rows written in the
+        last EVENTS_POLL_LOOKBACK seconds are read again in case a lower
+        id became visible after a higher one was read.
+        """
+        since = timezone.now() - timedelta(
+            seconds=settings.EVENTS_POLL_LOOKBACK
+        )
+        # Rows older than the lookback are not read again, so neither
+        # they nor any lower ids need to be excluded.
+        expired = [
+            id_ for id_, created in self.delivered.items() if created < since
+        ]
+        if expired:
+            self.settled = max(self.settled, max(expired))
+        self.delivered = {
+            id_: created for id_, created in self.delivered.items()
+            if id_ > self.settled and created >= since
+        }
+
+        close_old_connections()
+        try:
+            rows = list(Change.objects.filter(
+                Q(id__gt=last) | Q(id__gt=self.settled, created__gte=since),
+                user_id__in=user_ids
+            ).exclude(
+                id__in=list(self.delivered)
+            ).order_by('id').values_list(
+                'id', 'user_id', 'object_type', 'action', 'object_id',
+                'created'
+            )[:settings.EVENTS_POLL_BATCH_SIZE])
+        finally:
+            close_old_connections()
+
+        for row in rows:
+            self.delivered[row[0]] = row[-1]
+        return [row[:-1] for row in rows]
+
+
+def group_changes(rows):
+    """Return one event per user, type and action of feed rows"""
+    events = {}
+    for _, user_id, object_type, action, object_id in rows:
+        events.setdefault((user_id, object_type, action), []).append(
+            object_id
+        )
+    return [
+        (user_id, change_event(object_type, action, ids))
+        for (user_id, object_type, action), ids in events.items()
+    ]
+
+
+def change_event(object_type, action, ids):
+    return {'type': object_type, 'action': action, 'ids': list(ids)}
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    """Return the backend configured in EVENTS_BACKEND"""
+    return import_string(settings.EVENTS_BACKEND)()
+
+
+def publish(user_id, event):
+    """Send an event to the user's streams once the transaction commits"""
+    backend = get_backend()
+    transaction.on_commit(lambda: backend.publish(user_id, event))
@@ -0,0 +1,63 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from core.models import Change
+
+
+class Command(BaseCommand):
+    """Django command to compact the change feed"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            default=settings.SYNC_TOMBSTONE_RETENTION_DAYS,
+            help='Keep tombstones for this many days'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Number of entries examined per delete'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # Entries followed by a newer one for the same object are never
+        # needed: any cursor before them also reaches the newer entry.
+        newer = Change.objects.filter(
+            object_type=OuterRef('object_type'),
+            object_id=OuterRef('object_id'),
+            id__gt=OuterRef('id')
+        )
+        superseded = 0
+        last_id = 0
+        while True:
+            ids = list(Change.objects.filter(id__gt=last_id).order_by(
+                'id'
+            ).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            stale = Change.objects.filter(id__in=ids).annotate(
+                superseded=Exists(newer)
+            ).filter(superseded=True).values_list('id', flat=True)
+            superseded += Change.objects.filter(
+                id__in=list(stale)
+            ).delete()[0]
+            last_id = ids[-1]
+
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        tombstones = 0
+        while True:
+            ids = list(Change.objects.filter(
+                action=Change.DELETE,
+                created__lt=cutoff
+            ).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            tombstones += Change.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {superseded} superseded entries '
+            f'and {tombstones} tombstones.'
+        ))
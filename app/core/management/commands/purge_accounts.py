@@ -0,0 +1,46 @@
+import time
+from django.core.management.base import BaseCommand
+from core.models import AccountPurge
+from core.purge import purge_account
+
+
+class Command(BaseCommand):
+    """Django command to delete data of accounts marked for deletion"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of rows deleted per transaction'
+        )
+        parser.add_argument(
+            '--max-batches', type=int, default=None,
+            help='Stop after this many batches; a later run resumes'
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep polling for new purge requests'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=5.0,
+            help='Seconds to wait between polls with --loop'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            pending = AccountPurge.objects.filter(
+                finished__isnull=True
+            ).order_by('requested')
+            for purge in pending:
+                done = purge_account(
+                    purge,
+                    batch_size=options['batch_size'],
+                    max_batches=options['max_batches']
+                )
+                state = 'purged' if done else f'paused at {purge.stage}'
+                self.stdout.write(
+                    f'{purge.email}: {state}, '
+                    f'{purge.rows_deleted} rows deleted'
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
@@ -0,0 +1,37 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core.models import Task
+
+
+class Command(BaseCommand):
+    """Django command to delete finished background tasks"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.TASK_RETENTION_DAYS,
+            help='Keep finished tasks for this many days'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of tasks deleted per statement'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        deleted = 0
+        while True:
+            ids = list(Task.objects.filter(
+                status__in=(Task.DONE, Task.FAILED),
+                finished__lt=cutoff
+            ).order_by().values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted += Task.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {deleted} finished tasks.'
+        ))
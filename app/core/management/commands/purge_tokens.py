@@ -0,0 +1,41 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core.models import AuthToken
+
+
+class Command(BaseCommand):
+    """Django command to delete expired auth tokens"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=settings.PURGE_TOKENS_BATCH_SIZE,
+            help='Number of tokens deleted per statement'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0.0,
+            help='Seconds to pause between batches'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        cutoff = timezone.now()
+
+        # Short deletes by primary key, found through the expiry index,
+        # so that no statement holds locks on a large range of rows.
+        deleted = 0
+        while True:
+            ids = list(AuthToken.objects.filter(
+                expires__lte=cutoff
+            ).order_by('expires').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted += AuthToken.objects.filter(id__in=ids).delete()[0]
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {deleted} expired tokens.'
+        ))
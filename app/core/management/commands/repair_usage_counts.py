@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.counters import refresh_usage_counts, USAGE_RELATIONS
+
+
+class Command(BaseCommand):
+    """Django command to recompute tag and ingredient usage counts"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows recomputed per transaction'
+        )
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Only repair counts for this user id (repeatable)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model in USAGE_RELATIONS:
+            queryset = model.objects.order_by('pk')
+            if options['users']:
+                queryset = queryset.filter(user_id__in=options['users'])
+
+            repaired = 0
+            last_pk = 0
+            while True:
+                ids = list(queryset.filter(pk__gt=last_pk).values_list(
+                    'pk', flat=True
+                )[:batch_size])
+                if not ids:
+                    break
+                with transaction.atomic():
+                    repaired += refresh_usage_counts(model, ids)
+                last_pk = ids[-1]
+
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: {repaired} repaired'
+            )
+        self.stdout.write(self.style.SUCCESS('Usage counts repaired.'))
@@ -0,0 +1,118 @@
+import os
+import socket
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.db import connections
+from core import queue
+
+
+class WorkerStats:
+    """Throughput and latency counters shared by a worker's threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.done = 0
+        self.failed = 0
+        self.wait = 0.0
+        self.runtime = 0.0
+
+    def record(self, ok, wait, runtime):
+        with self.lock:
+            if ok:
+                self.done += 1
+            else:
+                self.failed += 1
+            self.wait += wait
+            self.runtime += runtime
+
+    def summary(self):
+        with self.lock:
+            total = self.done + self.failed
+            elapsed = time.monotonic() - self.started
+            return (
+                f'{self.done} done, {self.failed} failed, '
+                f'{total / elapsed if elapsed else 0:.2f} tasks/s, '
+                f'avg wait {self.wait / total if total else 0:.3f}s, '
+                f'avg run {self.runtime / total if total else 0:.3f}s'
+            )
+
+
+class Command(BaseCommand):
+    """Django command to run queued background tasks"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Number of tasks run at the same time'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait when the queue is empty'
+        )
+        parser.add_argument(
+            '--stats-interval', type=float, default=60.0,
+            help='Seconds between stats lines'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit when no task is due'
+        )
+
+    def handle(self, *args, **options):
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.options = options
+        self.stats = WorkerStats()
+        self.stopping = threading.Event()
+        self.stdout.write(f'Worker {self.worker_id} started')
+
+        concurrency = max(options['concurrency'], 1)
+        if concurrency == 1:
+            self.work(self.worker_id)
+        else:
+            threads = [
+                threading.Thread(
+                    target=self.work_in_thread,
+                    args=(f'{self.worker_id}:{i}',),
+                    daemon=True
+                )
+                for i in range(concurrency)
+            ]
+            for thread in threads:
+                thread.start()
+            try:
+                for thread in threads:
+                    while thread.is_alive():
+                        thread.join(timeout=1)
+            except KeyboardInterrupt:
+                self.stopping.set()
+
+        self.stdout.write(self.style.SUCCESS(self.stats.summary()))
+
+    def work_in_thread(self, worker_id):
+        try:
+            self.work(worker_id)
+        finally:
+            connections.close_all()
+
+    def work(self, worker_id):
+        """Claim and run tasks until stopped"""
+        last_stats = time.monotonic()
+        while not self.stopping.is_set():
+            queue.requeue_stale()
+            claimed = queue.claim(worker_id)
+            if not claimed:
+                if self.options['once']:
+                    return
+                time.sleep(self.options['poll_interval'])
+            for task_obj in claimed:
+                wait = (task_obj.started - task_obj.run_at).total_seconds()
+                started = time.monotonic()
+                ok = queue.run(task_obj)
+                self.stats.record(ok, wait, time.monotonic() - started)
+
+            if time.monotonic() - last_stats >= \
+                    self.options['stats_interval']:
+                last_stats = time.monotonic()
+                self.stdout.write(f'[{worker_id}] {self.stats.summary()}')
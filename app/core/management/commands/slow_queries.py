@@ -0,0 +1,83 @@
+import json
+import os
+from collections import Counter
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """Django command to summarize the slow query log"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--log', default=settings.SLOW_QUERY_LOG,
+            help='Path of the slow query log'
+        )
+        parser.add_argument(
+            '--top', type=int, default=20,
+            help='Number of query fingerprints to show'
+        )
+        parser.add_argument(
+            '--sort', choices=('total', 'count', 'max'), default='total',
+            help='Rank fingerprints by total time, count or worst time'
+        )
+
+    def read_entries(self, path):
+        """Yield log entries from the log and its rotated backups"""
+        paths = [path] + [
+            f'{path}.{index}'
+            for index in range(1, settings.SLOW_QUERY_LOG_BACKUPS + 1)
+        ]
+        for name in paths:
+            if not os.path.exists(name):
+                continue
+            with open(name) as log:
+                for line in log:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['log']):
+            raise CommandError(f'No slow query log at {options["log"]}')
+
+        groups = {}
+        for entry in self.read_entries(options['log']):
+            group = groups.setdefault(entry['fingerprint'], {
+                'sql': entry['sql'],
+                'count': 0,
+                'total': 0.0,
+                'max': 0.0,
+                'routes': Counter(),
+                'call_sites': Counter(),
+            })
+            group['count'] += 1
+            group['total'] += entry['duration_ms']
+            group['max'] = max(group['max'], entry['duration_ms'])
+            group['routes'][
+                f'{entry.get("method")} {entry.get("route")}'
+            ] += 1
+            group['call_sites'][entry.get('call_site')] += 1
+
+        if not groups:
+            self.stdout.write('No slow queries logged.')
+            return
+
+        ranked = sorted(
+            groups.items(),
+            key=lambda item: item[1][options['sort']],
+            reverse=True
+        )[:options['top']]
+        for key, group in ranked:
+            route, route_hits = group['routes'].most_common(1)[0]
+            site, site_hits = group['call_sites'].most_common(1)[0]
+            self.stdout.write(self.style.SUCCESS(
+                f'{key}  count={group["count"]}  '
+                f'total={group["total"]:.1f}ms  '
+                f'avg={group["total"] / group["count"]:.1f}ms  '
+                f'max={group["max"]:.1f}ms'
+            ))
+            self.stdout.write(f'  route: {route} ({route_hits})')
+            self.stdout.write(f'  call site: {site} ({site_hits})')
+            self.stdout.write(f'  sql: {group["sql"][:500]}')
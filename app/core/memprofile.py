@@ -0,0 +1,226 @@
+import logging
+import resource
+import sys
+import threading
+import tracemalloc
+from collections import OrderedDict, deque
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+logger = logging.getLogger(__name__)
+
+# ru_maxrss is in kilobytes on Linux but in bytes on macOS
+RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+PAGE_SIZE = resource.getpagesize()
+
+# Allocations made by the profiler itself or while importing modules
+IGNORED_TRACES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+_routes = {}
+_flagged = deque(maxlen=50)
+_snapshots = OrderedDict()
+_lock = threading.Lock()
+
+
+class TracingDisabled(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = _('Memory profiling is not enabled.')
+    default_code = 'tracing_disabled'
+
+
+def start():
+    """Start tracing allocations, keeping MEMORY_PROFILE_FRAMES frames"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(settings.MEMORY_PROFILE_FRAMES)
+
+
+def peak_rss():
+    """Return the highest resident set size of the process in bytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT
+
+
+def current_rss():
+    """Return the resident set size of the process in bytes, if known"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def bucket_for(size):
+    """Return the histogram bucket label for an allocation size"""
+    for bound in settings.MEMORY_PROFILE_BUCKETS_KB:
+        if size <= bound * 1024:
+            return f'<={bound}KB'
+    return f'>{settings.MEMORY_PROFILE_BUCKETS_KB[-1]}KB'
+
+
+def growth_sites(baseline, snapshot, limit):
+    """Return the source lines whose memory changed most since baseline"""
+    stats = snapshot.filter_traces(IGNORED_TRACES).compare_to(
+        baseline.filter_traces(IGNORED_TRACES),
+        'lineno'
+    )
+    return [site_data(stat) for stat in stats[:limit]]
+
+
+def site_data(stat):
+    frame = stat.traceback[0]
+    data = {
+        'site': f'{frame.filename}:{frame.lineno}',
+        'size': stat.size,
+        'count': stat.count,
+    }
+    if isinstance(stat, tracemalloc.StatisticDiff):
+        data['size_diff'] = stat.size_diff
+        data['count_diff'] = stat.count_diff
+    return data
+
+
+class RequestMemory:
+    """Memory traced and resident while one request is handled
+
+    Counters are per process, so with threaded workers a request is also
+    charged for what concurrent requests allocate. A baseline snapshot is
+    only taken when asked for, as it copies every live trace.
+    """
+
+    def __init__(self, baseline=False):
+        self.baseline = tracemalloc.take_snapshot() if baseline else None
+        # tracemalloc.reset_peak() only exists from Python 3.9, before
+        # that the growth of traced memory over the request is recorded.
+        reset_peak = getattr(tracemalloc, 'reset_peak', None)
+        if reset_peak is not None:
+            reset_peak()
+        self.measures_peak = reset_peak is not None
+        self.traced = tracemalloc.get_traced_memory()[0]
+        self.rss = current_rss()
+
+    def finish(self):
+        """Return the bytes allocated and the RSS once the request is done"""
+        current, peak = tracemalloc.get_traced_memory()
+        end = peak if self.measures_peak else current
+        return max(end - self.traced, 0), current_rss()
+
+
+def record_request(route, allocated, rss, rss_before):
+    """Add a request to the memory histogram of its route"""
+    with _lock:
+        stats = _routes.setdefault(route, {
+            'requests': 0,
+            'max_allocated': 0,
+            'max_rss': None,
+            'rss_raised': 0,
+            'histogram': {},
+        })
+        stats['requests'] += 1
+        stats['max_allocated'] = max(stats['max_allocated'], allocated)
+        if rss is not None:
+            stats['max_rss'] = max(stats['max_rss'] or 0, rss)
+            if rss_before is not None and rss > rss_before:
+                stats['rss_raised'] += 1
+        bucket = bucket_for(allocated)
+        stats['histogram'][bucket] = stats['histogram'].get(bucket, 0) + 1
+
+
+def flag_request(route, allocated, baseline=None):
+    """Log a request that allocated past the threshold
+
+    Requests with a baseline snapshot also get the sites whose memory
+    changed most while they ran, the others have no sites.
+    """
+    sites = None
+    if baseline is not None:
+        sites = growth_sites(
+            baseline,
+            tracemalloc.take_snapshot(),
+            settings.MEMORY_PROFILE_TOP_SITES
+        )
+    with _lock:
+        _flagged.append({
+            'time': timezone.now(),
+            'route': route,
+            'allocated': allocated,
+            'sites': sites,
+        })
+    if sites is None:
+        logger.warning('%s allocated %d bytes', route, allocated)
+        return
+    logger.warning(
+        '%s allocated %d bytes, top sites: %s',
+        route, allocated,
+        ', '.join(f'{site["site"]} ({site["size_diff"]:+d})' for site in sites)
+    )
+
+
+def route_stats():
+    """Return the memory histograms of all routes seen so far"""
+    with _lock:
+        return {
+            route: {**stats, 'histogram': dict(stats['histogram'])}
+            for route, stats in _routes.items()
+        }
+
+
+def flagged_requests():
+    with _lock:
+        return list(_flagged)
+
+
+def reset():
+    """Forget route histograms, flagged requests and snapshots"""
+    with _lock:
+        _routes.clear()
+        _flagged.clear()
+        _snapshots.clear()
+
+
+def take_snapshot(name):
+    """Store a named allocation snapshot, dropping the oldest if needed"""
+    if not tracemalloc.is_tracing():
+        raise TracingDisabled()
+    snapshot = tracemalloc.take_snapshot().filter_traces(IGNORED_TRACES)
+    with _lock:
+        _snapshots.pop(name, None)
+        _snapshots[name] = (timezone.now(), snapshot)
+        while len(_snapshots) > settings.MEMORY_PROFILE_MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return snapshot
+
+
+def snapshot_list():
+    """Return names, times and sizes of the stored snapshots"""
+    with _lock:
+        snapshots = list(_snapshots.items())
+    return [
+        {
+            'name': name,
+            'taken': taken,
+            'size': sum(trace.size for trace in snapshot.traces),
+        }
+        for name, (taken, snapshot) in snapshots
+    ]
+
+
+def diff_snapshots(old, new, limit):
+    """Return the sites whose memory changed most from old to new"""
+    with _lock:
+        snapshots = {
+            name: _snapshots[name][1]
+            for name in (old, new) if name in _snapshots
+        }
+    missing = [name for name in (old, new) if name not in snapshots]
+    if missing:
+        raise KeyError(missing[0])
+    stats = snapshots[new].compare_to(snapshots[old], 'lineno')
+    return [site_data(stat) for stat in stats[:limit]]
@@ -0,0 +1,89 @@
+import logging
+import random
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from core import memprofile
+from core.budget import budget_for
+from core.slowlog import SlowQueryRecorder
+
+
+logger = logging.getLogger(__name__)
+
+
+class SlowQueryMiddleware:
+    """Log database queries slower than SLOW_QUERY_THRESHOLD_MS"""
+
+    def __init__(self, get_response):
+        if settings.SLOW_QUERY_THRESHOLD_MS is None:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = SlowQueryRecorder(
+            request,
+            settings.SLOW_QUERY_THRESHOLD_MS
+        )
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(recorder)
+                )
+            return self.get_response(request)
+
+
+class QueryBudgetMiddleware:
+    """Warn in DEBUG when a request exceeds its view's query budget"""
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(count))
+            response = self.get_response(request)
+
+        budget = budget_for(
+            getattr(request, 'resolver_match', None),
+            request.method
+        )
+        if budget is not None and len(queries) > budget:
+            logger.warning(
+                '%s %s ran %d queries, budget is %d',
+                request.method, request.path, len(queries), budget
+            )
+        return response
+
+
+class MemoryProfileMiddleware:
+    """Record per-route allocations while MEMORY_PROFILING is enabled"""
+
+    def __init__(self, get_response):
+        if not settings.MEMORY_PROFILING:
+            raise MiddlewareNotUsed()
+        memprofile.start()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sampled = random.random() < settings.MEMORY_PROFILE_SAMPLE_RATE
+        usage = memprofile.RequestMemory(baseline=sampled)
+        response = self.get_response(request)
+        allocated, rss = usage.finish()
+
+        # Unresolved paths share one entry to keep the table bounded
+        match = getattr(request, 'resolver_match', None)
+        route = f'{request.method} {match.route if match else "unmatched"}'
+        memprofile.record_request(route, allocated, rss, usage.rss)
+        if allocated >= settings.MEMORY_PROFILE_THRESHOLD_KB * 1024:
+            memprofile.flag_request(route, allocated, usage.baseline)
+        return response
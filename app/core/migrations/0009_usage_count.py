@@ -0,0 +1,53 @@
+# Generated by Django 3.0.14 on 2026-10-19 05:38
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_usage_counts(apps, schema_editor):
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, through, field in (
+        ('Tag', Recipe.tags.through, 'tag'),
+        ('Ingredient', Recipe.ingredients.through, 'ingredient'),
+    ):
+        links = through.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total')
+        apps.get_model('core', model_name).objects.update(
+            usage_count=Coalesce(Subquery(links), 0)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_auto_20200503_0929'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='usage_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='usage_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-usage_count'], name='core_ingredient_usage_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-usage_count'], name='core_tag_usage_idx'),
+        ),
+        migrations.RunPython(
+            backfill_usage_counts,
+            migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.0.14 on 2026-10-19 05:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def seed_change_feed(apps, schema_editor):
+    """Record every existing object so feeds can start from scratch"""
+    Change = apps.get_model('core', 'Change')
+    for object_type, model_name in (
+        ('tag', 'Tag'),
+        ('ingredient', 'Ingredient'),
+        ('recipe', 'Recipe'),
+    ):
+        rows = apps.get_model('core', model_name).objects.order_by(
+            'pk'
+        ).values_list('pk', 'user_id')
+        batch = []
+        for pk, user_id in rows.iterator(chunk_size=2000):
+            batch.append(Change(
+                user_id=user_id,
+                object_type=object_type,
+                object_id=pk,
+                action='upsert'
+            ))
+            if len(batch) == 2000:
+                Change.objects.bulk_create(batch)
+                batch = []
+        Change.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_usage_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('object_type', models.CharField(max_length=20)),
+                ('object_id', models.IntegerField()),
+                ('action', models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete')], max_length=6)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['user', 'id'], name='core_change_user_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['object_type', 'object_id', 'id'], name='core_change_object_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['action', 'created'], name='core_change_action_idx'),
+        ),
+        migrations.RunPython(seed_change_feed, migrations.RunPython.noop),
+    ]
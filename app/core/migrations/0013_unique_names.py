@@ -0,0 +1,116 @@
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+BATCH_SIZE = 1000
+
+
+def normalize_name(name):
+    return ' '.join(name.split()).casefold()
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Fill normalized names and merge objects that share one"""
+    Recipe = apps.get_model('core', 'Recipe')
+    Change = apps.get_model('core', 'Change')
+    for model_name, through, field in (
+        ('Tag', Recipe.tags.through, 'tag_id'),
+        ('Ingredient', Recipe.ingredients.through, 'ingredient_id'),
+    ):
+        model = apps.get_model('core', model_name)
+
+        batch = []
+        for obj in model.objects.only('id', 'name').iterator():
+            obj.normalized_name = normalize_name(obj.name)
+            batch.append(obj)
+            if len(batch) == BATCH_SIZE:
+                model.objects.bulk_update(batch, ['normalized_name'])
+                batch = []
+        model.objects.bulk_update(batch, ['normalized_name'])
+
+        groups = model.objects.values(
+            'user_id', 'normalized_name'
+        ).annotate(
+            total=Count('id'),
+            keep=Min('id')
+        ).filter(total__gt=1)
+        for group in groups.iterator():
+            duplicates = list(model.objects.filter(
+                user_id=group['user_id'],
+                normalized_name=group['normalized_name']
+            ).exclude(id=group['keep']).values_list('id', flat=True))
+
+            linked = set(through.objects.filter(
+                **{f'{field}__in': duplicates}
+            ).values_list('recipe_id', flat=True))
+            already = set(through.objects.filter(
+                **{field: group['keep'], 'recipe_id__in': linked}
+            ).values_list('recipe_id', flat=True))
+            through.objects.bulk_create([
+                through(recipe_id=recipe_id, **{field: group['keep']})
+                for recipe_id in linked - already
+            ])
+            through.objects.filter(**{f'{field}__in': duplicates}).delete()
+            model.objects.filter(id__in=duplicates).delete()
+            model.objects.filter(id=group['keep']).update(
+                usage_count=through.objects.filter(
+                    **{field: group['keep']}
+                ).count()
+            )
+
+            Change.objects.bulk_create([
+                Change(
+                    user_id=group['user_id'],
+                    object_type=model_name.lower(),
+                    object_id=id_,
+                    action='delete'
+                )
+                for id_ in duplicates
+            ] + [
+                Change(
+                    user_id=group['user_id'],
+                    object_type='recipe',
+                    object_id=recipe_id,
+                    action='upsert'
+                )
+                for recipe_id in sorted(linked)
+            ])
+
+
+class Migration(migrations.Migration):
+    # The merge commits on its own before the constraints alter the same
+    # tables; PostgreSQL refuses ALTER TABLE while the deletes still have
+    # pending foreign key trigger events in the same transaction.
+    atomic = False
+
+    dependencies = [
+        ('core', '0012_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='normalized_name',
+            field=models.CharField(default='', editable=False, max_length=235),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='normalized_name',
+            field=models.CharField(default='', editable=False, max_length=235),
+            preserve_default=False,
+        ),
+        migrations.RunPython(
+            merge_duplicate_names,
+            migrations.RunPython.noop,
+            atomic=True
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'normalized_name'), name='core_ingredient_unique_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'normalized_name'), name='core_tag_unique_name'),
+        ),
+    ]
@@ -1,11 +1,22 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager,\
     PermissionsMixin
 from django.conf import settings
+from django.utils import timezone
+import binascii
 import uuid
 import os
 
 
+# casefold() turns some characters into up to three, like 'ß' into 'ss'
+NORMALIZED_NAME_MAX_LENGTH = 3 * 235
+
+
+def normalize_name(name):
+    """Return the case and whitespace insensitive form of a name"""
+    return ' '.join(name.split()).casefold()
+
+
 def get_image_url_path(instance, filename):
     ext = filename.split('.')[-1]
     filename = f'{uuid.uuid4()}.{ext}'
@@ -52,6 +63,29 @@ class Tag(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
+    normalized_name = models.CharField(
+        max_length=NORMALIZED_NAME_MAX_LENGTH,
+        editable=False
+    )
+    usage_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-usage_count'],
+                name='core_tag_usage_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'normalized_name'],
+                name='core_tag_unique_name'
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_name(self.name)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -64,11 +98,45 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
+    normalized_name = models.CharField(
+        max_length=NORMALIZED_NAME_MAX_LENGTH,
+        editable=False
+    )
+    usage_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-usage_count'],
+                name='core_ingredient_usage_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'normalized_name'],
+                name='core_ingredient_unique_name'
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_name(self.name)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def delete(self):
+        """Delete recipes, updating usage counts once for all of them"""
+        # Imported here as the counters are built on these models
+        from core.counters import releasing_usage
+        with transaction.atomic():
+            with releasing_usage(self.values('pk')):
+                return super().delete()
+
+
 class Recipe(models.Model):
     """Recipe model"""
     title = models.CharField(max_length=235)
@@ -82,6 +150,222 @@ class Recipe(models.Model):
     ingredients = models.ManyToManyField(Ingredient)
     tags = models.ManyToManyField(Tag)
     image = models.ImageField(null=True, upload_to=get_image_url_path)
+    # Bumped by every update, guarding against lost concurrent updates
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        # One per list ordering, ending in id for keyset pagination
+        indexes = [
+            models.Index(
+                fields=['user', 'id'],
+                name='core_recipe_user_id_idx'
+            ),
+            models.Index(
+                fields=['user', 'title', 'id'],
+                name='core_recipe_title_idx'
+            ),
+            models.Index(
+                fields=['user', 'price', 'id'],
+                name='core_recipe_price_idx'
+            ),
+            models.Index(
+                fields=['user', 'time_minutes', 'id'],
+                name='core_recipe_time_idx'
+            ),
+        ]
+
+    def save_next_version(self, expected=None):
+        """Save as the next version, unless the stored one isn't expected"""
+        with transaction.atomic():
+            current = Recipe.objects.select_for_update().values_list(
+                'version', flat=True
+            ).get(pk=self.pk)
+            if expected is not None and current != expected:
+                return False
+            self.version = current + 1
+            self.save()
+        return True
 
     def __str__(self):
         return self.title
+
+
+class AuthTokenManager(models.Manager):
+
+    def issue(self, user, name=''):
+        """Create a token for user, dropping their oldest beyond the limit"""
+        token = self.create(user=user, name=name)
+        stale = self.filter(user=user).order_by('-id').values_list(
+            'id', flat=True
+        )[settings.AUTH_TOKEN_MAX_PER_USER:]
+        if stale:
+            self.filter(id__in=list(stale)).delete()
+        return token
+
+
+def generate_token_key():
+    return binascii.hexlify(os.urandom(20)).decode()
+
+
+def token_expiry():
+    return timezone.now() + settings.AUTH_TOKEN_TTL
+
+
+class AuthToken(models.Model):
+    """API token of one user device, valid until it goes unused too long"""
+    key = models.CharField(
+        max_length=40,
+        unique=True,
+        default=generate_token_key
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='auth_tokens'
+    )
+    name = models.CharField(max_length=100, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    expires = models.DateTimeField(default=token_expiry, db_index=True)
+
+    objects = AuthTokenManager()
+
+    def __str__(self):
+        return f'{self.user_id} {self.name}'.strip()
+
+
+class Change(models.Model):
+    """Entry in the change feed of a user's library"""
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    ACTIONS = (
+        (UPSERT, 'Upsert'),
+        (DELETE, 'Delete'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    object_type = models.CharField(max_length=20)
+    object_id = models.IntegerField()
+    action = models.CharField(max_length=6, choices=ACTIONS)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'id'],
+                name='core_change_user_seq_idx'
+            ),
+            models.Index(
+                fields=['object_type', 'object_id', 'id'],
+                name='core_change_object_idx'
+            ),
+            models.Index(
+                fields=['action', 'created'],
+                name='core_change_action_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.action} {self.object_type} {self.object_id}'
+
+
+class AccountPurge(models.Model):
+    """Progress of a background account deletion"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='purge'
+    )
+    email = models.EmailField(max_length=254)
+    stage = models.CharField(max_length=30, blank=True)
+    rows_deleted = models.BigIntegerField(default=0)
+    requested = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.email
+
+
+class Task(models.Model):
+    """Unit of background work picked up by `run_worker`"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=100)
+    payload = models.TextField(default='{}')
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['status', 'run_at'],
+                name='core_task_status_run_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
+
+
+class SimilarRecipe(models.Model):
+    """Precomputed neighbour of a recipe by shared tags and ingredients"""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='core_similar_recipe_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id} ~ {self.similar_id} ({self.score:.3f})'
+
+
+class SimilarityBuild(models.Model):
+    """Point in the change feed up to which similar recipes are current"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='similarity_build'
+    )
+    last_change = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.user_id} @ {self.last_change}'
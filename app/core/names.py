@@ -0,0 +1,38 @@
+from core.changes import record_changes
+from core.models import normalize_name
+
+
+def upsert_names(model, user, names):
+    """Return user's objects by normalized name and the ones created"""
+    wanted = {}
+    for name in names:
+        key = normalize_name(name)
+        if key:
+            wanted.setdefault(key, ' '.join(name.split()))
+
+    found = {
+        obj.normalized_name: obj
+        for obj in model.objects.filter(
+            user=user,
+            normalized_name__in=wanted
+        )
+    }
+    missing = wanted.keys() - found.keys()
+    created = {}
+    if missing:
+        # INSERT ... ON CONFLICT DO NOTHING, so concurrent upserts of the
+        # same name cannot fail or create a duplicate.
+        model.objects.bulk_create([
+            model(user=user, name=wanted[key], normalized_name=key)
+            for key in missing
+        ], ignore_conflicts=True)
+        created = {
+            obj.normalized_name: obj
+            for obj in model.objects.filter(
+                user=user,
+                normalized_name__in=missing
+            )
+        }
+        record_changes(user.id, model, [obj.pk for obj in created.values()])
+        found.update(created)
+    return found, created
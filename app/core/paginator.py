@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from core.counting import table_estimate
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that estimates the size of large unfiltered tables"""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = table_estimate(queryset)
+            if estimate is not None and \
+                    estimate >= settings.ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
@@ -0,0 +1,88 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from core.models import AccountPurge, AuthToken, Change, Tag, Ingredient, \
+    Recipe, SimilarRecipe
+from core.queue import enqueue
+from core.signals import deleting_user
+
+
+# Children are removed before their parents so that no single delete has
+# to cascade through a large set of rows.
+PURGE_STAGES = (
+    ('recipe_tags', lambda user_id: Recipe.tags.through.objects.filter(
+        recipe__user_id=user_id
+    )),
+    ('recipe_ingredients', lambda user_id: (
+        Recipe.ingredients.through.objects.filter(recipe__user_id=user_id)
+    )),
+    ('similar_recipes', lambda user_id: SimilarRecipe.objects.filter(
+        recipe__user_id=user_id
+    )),
+    ('recipes', lambda user_id: Recipe.objects.filter(user_id=user_id)),
+    ('tags', lambda user_id: Tag.objects.filter(user_id=user_id)),
+    ('ingredients', lambda user_id: Ingredient.objects.filter(
+        user_id=user_id
+    )),
+    ('changes', lambda user_id: Change.objects.filter(user_id=user_id)),
+    ('tokens', lambda user_id: AuthToken.objects.filter(user_id=user_id)),
+)
+
+
+def request_purge(user):
+    """Deactivate user at once and schedule removal of their data"""
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        AuthToken.objects.filter(user=user).delete()
+        purge, created = AccountPurge.objects.get_or_create(
+            user=user,
+            defaults={'email': user.email}
+        )
+        if created:
+            enqueue('core.purge_account', purge_id=purge.pk)
+    return purge
+
+
+def purge_account(purge, batch_size=500, max_batches=None):
+    """Delete a purged account's rows in batches, return True when done"""
+    if purge.finished:
+        return True
+
+    user_id = purge.user_id
+    if user_id is None:
+        # The user was removed some other way
+        purge.finished = timezone.now()
+        purge.save(update_fields=['finished', 'updated'])
+        return True
+
+    batches = 0
+    with deleting_user(user_id):
+        for stage, rows in PURGE_STAGES:
+            queryset = rows(user_id)
+            model = queryset.model
+            while True:
+                if max_batches is not None and batches >= max_batches:
+                    return False
+                ids = list(queryset.order_by().values_list(
+                    'pk', flat=True
+                )[:batch_size])
+                if not ids:
+                    break
+                with transaction.atomic():
+                    deleted, _ = model.objects.filter(pk__in=ids).delete()
+                    purge.stage = stage
+                    purge.rows_deleted += deleted
+                    purge.save(update_fields=[
+                        'stage', 'rows_deleted', 'updated'
+                    ])
+                batches += 1
+
+        with transaction.atomic():
+            get_user_model().objects.filter(pk=user_id).delete()
+            purge.user = None
+            purge.stage = 'user'
+            purge.rows_deleted += 1
+            purge.finished = timezone.now()
+            purge.save()
+    return True
@@ -0,0 +1,166 @@
+import json
+import logging
+import threading
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from core.models import Task
+
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def task(name):
+    """Register a function to be run by the worker under name"""
+    def register(func):
+        _registry[name] = func
+        return func
+    return register
+
+
+def enqueue(name, run_at=None, max_attempts=None, **payload):
+    """Queue a registered task; it commits with the current transaction"""
+    return Task.objects.create(
+        name=name,
+        payload=json.dumps(payload),
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or settings.TASK_MAX_ATTEMPTS,
+    )
+
+
+def requeue_stale():
+    """Return tasks held by workers that stopped responding to the queue"""
+    cutoff = timezone.now() - timedelta(seconds=settings.TASK_LOCK_TIMEOUT)
+    return Task.objects.filter(
+        status=Task.RUNNING,
+        locked_at__lt=cutoff
+    ).update(status=Task.QUEUED, locked_by='', locked_at=None)
+
+
+def claim(worker_id, limit=1):
+    """Lock up to limit due tasks for worker_id and return them"""
+    now = timezone.now()
+    due = Task.objects.filter(
+        status=Task.QUEUED,
+        run_at__lte=now
+    ).order_by('run_at', 'id')
+    running = {
+        'status': Task.RUNNING,
+        'locked_by': worker_id,
+        'locked_at': now,
+        'started': now,
+        'attempts': F('attempts') + 1,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(due.select_for_update(skip_locked=True).values_list(
+                'id', flat=True
+            )[:limit])
+            Task.objects.filter(id__in=ids).update(**running)
+    else:
+        # Without SKIP LOCKED, claim each candidate with a conditional
+        # update so that only one worker wins it.
+        ids = [
+            id_ for id_ in due.values_list('id', flat=True)[:limit]
+            if Task.objects.filter(
+                id=id_,
+                status=Task.QUEUED
+            ).update(**running)
+        ]
+    return list(Task.objects.filter(id__in=ids).order_by('run_at', 'id'))
+
+
+class Heartbeat:
+    """Refresh the lock of a running task so it is not taken as stale"""
+
+    def __init__(self, task_obj, interval):
+        self.task_obj = task_obj
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.beat, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def beat(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    Task.objects.filter(
+                        pk=self.task_obj.pk,
+                        status=Task.RUNNING,
+                        locked_by=self.task_obj.locked_by
+                    ).update(locked_at=timezone.now())
+                except Exception:
+                    logger.exception(
+                        'Cannot refresh lock of task %s', self.task_obj.pk
+                    )
+        finally:
+            # The thread has its own connection, which nothing else closes
+            connection.close()
+
+
+def retry_delay(attempts):
+    """Return the backoff before retrying after a number of attempts"""
+    delay = settings.TASK_RETRY_BACKOFF * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(delay, settings.TASK_RETRY_BACKOFF_MAX))
+
+
+def run(task_obj):
+    """Execute a claimed task and record its outcome
+
+    The outcome is only written while the task is still locked by this
+    worker; if its lock expired and another worker took it over, that
+    worker's result is kept instead.
+    """
+    worker_id = task_obj.locked_by
+    func = _registry.get(task_obj.name)
+    try:
+        if func is None:
+            raise LookupError(f'Unknown task {task_obj.name}')
+        with Heartbeat(task_obj, settings.TASK_HEARTBEAT_INTERVAL):
+            func(**json.loads(task_obj.payload))
+    except Exception:
+        logger.exception('Task %s (%s) failed', task_obj.name, task_obj.pk)
+        task_obj.last_error = traceback.format_exc()
+        if func is not None and task_obj.attempts < task_obj.max_attempts:
+            task_obj.status = Task.QUEUED
+            task_obj.run_at = timezone.now() + retry_delay(task_obj.attempts)
+        else:
+            task_obj.status = Task.FAILED
+            task_obj.finished = timezone.now()
+    else:
+        task_obj.status = Task.DONE
+        task_obj.finished = timezone.now()
+    task_obj.locked_by = ''
+    task_obj.locked_at = None
+    updated = Task.objects.filter(
+        pk=task_obj.pk,
+        status=Task.RUNNING,
+        locked_by=worker_id
+    ).update(
+        status=task_obj.status,
+        run_at=task_obj.run_at,
+        finished=task_obj.finished,
+        last_error=task_obj.last_error,
+        locked_by='',
+        locked_at=None
+    )
+    if not updated:
+        logger.warning(
+            'Task %s (%s) was taken over by another worker, '
+            'its outcome is dropped', task_obj.name, task_obj.pk
+        )
+        return False
+    return task_obj.status == Task.DONE
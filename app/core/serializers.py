@@ -0,0 +1,63 @@
+import re
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+
+
+HEADER_NAME = re.compile(r'^[A-Za-z0-9-]+$')
+
+# Set from the batch request itself for every item
+RESERVED_HEADERS = (
+    'authorization', 'content-length', 'content-type', 'cookie', 'host',
+)
+
+
+class SubRequestSerializer(serializers.Serializer):
+    """Serializer for a single request inside a batch"""
+    method = serializers.ChoiceField(
+        choices=('GET', 'POST', 'PUT', 'PATCH', 'DELETE'),
+        default='GET'
+    )
+    path = serializers.CharField()
+    body = serializers.JSONField(required=False)
+    headers = serializers.DictField(
+        child=serializers.CharField(),
+        required=False
+    )
+
+    def validate_path(self, value):
+        """Only allow routes of the user and recipe APIs"""
+        if not value.startswith(settings.BATCH_ALLOWED_PREFIXES):
+            msg = _('Path is not allowed in a batch')
+            raise serializers.ValidationError(msg)
+        return value
+
+    def validate_headers(self, value):
+        """Only allow header names that cannot replace the batch's own"""
+        for name in value:
+            if not HEADER_NAME.match(name) or \
+                    name.lower() in RESERVED_HEADERS:
+                msg = _('Header %(name)s cannot be sent in a batch')
+                raise serializers.ValidationError(msg % {'name': name})
+        return value
+
+
+class BatchSerializer(serializers.Serializer):
+    """Serializer for a batch of API requests"""
+    requests = serializers.ListField(
+        child=SubRequestSerializer(),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_REQUESTS
+    )
+
+
+class MemorySnapshotSerializer(serializers.Serializer):
+    """Serializer for taking a named allocation snapshot"""
+    name = serializers.SlugField(max_length=50)
+
+
+class MemoryDiffSerializer(serializers.Serializer):
+    """Serializer for the snapshots to compare and how many sites to show"""
+    old = serializers.SlugField(max_length=50)
+    new = serializers.SlugField(max_length=50)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=25)
@@ -0,0 +1,143 @@
+import threading
+from contextlib import contextmanager
+from django.contrib.auth import get_user_model
+from django.db.models.signals import pre_delete, post_delete, post_save, \
+    m2m_changed
+from django.dispatch import receiver
+from core.changes import record_changes
+from core.counters import is_releasing_usage, linked_usage_ids, \
+    refresh_usage_counts
+from core.models import Change, Tag, Ingredient, Recipe
+
+
+RECIPE_RELATIONS = {Tag: 'tags', Ingredient: 'ingredients'}
+
+_deleting = threading.local()
+
+
+def is_user_deleted(user_id):
+    """Return True while the user's own deletion cascades"""
+    return user_id in getattr(_deleting, 'user_ids', ())
+
+
+@contextmanager
+def deleting_user(user_id):
+    """Skip bookkeeping for rows removed along with their user"""
+    if not hasattr(_deleting, 'user_ids'):
+        _deleting.user_ids = set()
+    added = user_id not in _deleting.user_ids
+    _deleting.user_ids.add(user_id)
+    try:
+        yield
+    finally:
+        if added:
+            _deleting.user_ids.discard(user_id)
+
+
+@receiver(pre_delete, sender=get_user_model())
+def mark_user_deleting(sender, instance, **kwargs):
+    """Stop recording changes for rows removed with their user"""
+    if not hasattr(_deleting, 'user_ids'):
+        _deleting.user_ids = set()
+    _deleting.user_ids.add(instance.pk)
+
+
+@receiver(post_delete, sender=get_user_model())
+def unmark_user_deleting(sender, instance, **kwargs):
+    getattr(_deleting, 'user_ids', set()).discard(instance.pk)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def maintain_usage_counts(sender, instance, action, reverse, model,
+                          pk_set, **kwargs):
+    """Keep usage counts in step with recipe links"""
+    if reverse:
+        # instance is the tag or ingredient whose recipes changed
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            refresh_usage_counts(type(instance), [instance.pk])
+        return
+
+    if action == 'pre_clear':
+        instance._cleared_usage_ids = list(
+            getattr(instance, RECIPE_RELATIONS[model]).values_list(
+                'pk', flat=True
+            )
+        )
+    elif action == 'post_clear':
+        refresh_usage_counts(model, instance.__dict__.pop(
+            '_cleared_usage_ids', []
+        ))
+    elif action in ('post_add', 'post_remove'):
+        refresh_usage_counts(model, pk_set)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def record_link_changes(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    """Record relinked recipes in the change feed"""
+    if not reverse:
+        if action == 'post_clear' or (
+                action in ('post_add', 'post_remove') and pk_set):
+            record_changes(instance.user_id, Recipe, [instance.pk])
+        return
+
+    if action == 'pre_clear':
+        instance._cleared_recipe_ids = list(
+            instance.recipe_set.values_list('pk', flat=True)
+        )
+    elif action == 'post_clear':
+        record_changes(instance.user_id, Recipe, instance.__dict__.pop(
+            '_cleared_recipe_ids', []
+        ))
+    elif action in ('post_add', 'post_remove'):
+        record_changes(instance.user_id, Recipe, pk_set)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def record_save(sender, instance, raw=False, **kwargs):
+    """Record created and updated objects in the change feed"""
+    if not raw:
+        record_changes(instance.user_id, sender, [instance.pk])
+
+
+@receiver(pre_delete, sender=Recipe)
+def collect_usage_on_delete(sender, instance, **kwargs):
+    """Remember linked objects before the recipe links are removed"""
+    if is_user_deleted(instance.user_id) or is_releasing_usage():
+        return
+    instance._deleted_usage_ids = linked_usage_ids([instance.pk])
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def collect_recipes_on_delete(sender, instance, **kwargs):
+    """Remember recipes that lose a link when the object is deleted"""
+    if is_user_deleted(instance.user_id):
+        return
+    instance._linked_recipe_ids = list(
+        instance.recipe_set.values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def release_usage_on_delete(sender, instance, **kwargs):
+    """Decrease usage counts of objects linked to a deleted recipe"""
+    usage_ids = instance.__dict__.pop('_deleted_usage_ids', {})
+    for model, ids in usage_ids.items():
+        refresh_usage_counts(model, ids)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def record_delete(sender, instance, **kwargs):
+    """Record a tombstone, and relinked recipes, for deleted objects"""
+    recipe_ids = instance.__dict__.pop('_linked_recipe_ids', [])
+    if is_user_deleted(instance.user_id):
+        return
+    record_changes(instance.user_id, sender, [instance.pk], Change.DELETE)
+    record_changes(instance.user_id, Recipe, recipe_ids)
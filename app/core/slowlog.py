@@ -0,0 +1,114 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import traceback
+from logging.handlers import RotatingFileHandler
+from django.conf import settings
+from django.utils import timezone
+
+
+logger = logging.getLogger('slow_queries')
+logger.propagate = False
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+VALUE_LIST = re.compile(r'\((?:\s*(?:\?|%s)\s*,)+\s*(?:\?|%s)\s*\)')
+WHITESPACE = re.compile(r'\s+')
+SAVEPOINT_NAME = re.compile(r'"s\d+_x\d+"')
+
+# Frames from these files wrap every query and never explain one
+INSTRUMENTATION = {
+    os.path.abspath(__file__),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'middleware.py'),
+}
+
+
+def normalize_sql(sql):
+    """Return sql with literals and value lists replaced by placeholders"""
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER.sub('?', sql)
+    sql = SAVEPOINT_NAME.sub('?', sql)
+    sql = VALUE_LIST.sub('(...)', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    """Return a short stable id for queries that differ only in values"""
+    return hashlib.md5(normalize_sql(sql).encode()).hexdigest()[:12]
+
+
+def call_site():
+    """Return the innermost application frame of the current stack"""
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if filename in INSTRUMENTATION or 'site-packages' in filename or \
+                not filename.startswith(settings.BASE_DIR):
+            continue
+        path = os.path.relpath(filename, settings.BASE_DIR)
+        return f'{path}:{frame.lineno} in {frame.name}'
+    return None
+
+
+def _configure_handler():
+    """Attach a rotating file handler for the configured log path"""
+    path = settings.SLOW_QUERY_LOG
+    for handler in logger.handlers:
+        if getattr(handler, 'baseFilename', None) == os.path.abspath(path):
+            return True
+        logger.removeHandler(handler)
+        handler.close()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = RotatingFileHandler(
+            path,
+            maxBytes=settings.SLOW_QUERY_LOG_MAX_BYTES,
+            backupCount=settings.SLOW_QUERY_LOG_BACKUPS,
+            delay=True
+        )
+    except OSError:
+        logging.getLogger(__name__).exception(
+            'Cannot write slow query log to %s', path
+        )
+        return False
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return True
+
+
+class SlowQueryRecorder:
+    """Database execute wrapper recording queries over a threshold"""
+
+    def __init__(self, request, threshold_ms):
+        self.request = request
+        self.threshold_ms = threshold_ms
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            if duration >= self.threshold_ms:
+                self.record(sql, duration, context)
+
+    def record(self, sql, duration, context):
+        if not _configure_handler():
+            return
+        match = getattr(self.request, 'resolver_match', None)
+        user = getattr(self.request, 'user', None)
+        logger.info(json.dumps({
+            'time': timezone.now().isoformat(),
+            'duration_ms': round(duration, 2),
+            'fingerprint': fingerprint(sql),
+            'sql': normalize_sql(sql),
+            'route': match.route if match else self.request.path,
+            'view': match.view_name if match else None,
+            'method': self.request.method,
+            'user_id': user.pk if user and user.is_authenticated else None,
+            'database': context['connection'].alias,
+            'call_site': call_site(),
+        }))
@@ -0,0 +1,129 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework import exceptions
+from core.authentication import ExpiringTokenAuthentication
+from core.events import broker
+
+
+def token_from_scope(scope):
+    """Return the token of the Authorization header or `token` parameter"""
+    # EventSource in browsers cannot set headers, hence the parameter
+    for name, value in scope.get('headers', ()):
+        if name == b'authorization':
+            keyword, _, key = value.decode('latin1').partition(' ')
+            if keyword == 'Token' and key:
+                return key.strip()
+    query = parse_qs(scope.get('query_string', b'').decode('latin1'))
+    return query.get('token', [None])[0]
+
+
+def authenticate(key):
+    """Return the active user owning key, or None"""
+    close_old_connections()
+    try:
+        user, _ = ExpiringTokenAuthentication().authenticate_credentials(
+            key
+        )
+        return user
+    except exceptions.AuthenticationFailed:
+        return None
+    finally:
+        close_old_connections()
+
+
+def format_event(event):
+    """Return an event in the text/event-stream format"""
+    name = 'resync' if event['type'] == 'resync' else 'change'
+    return f'event: {name}\ndata: {json.dumps(event)}\n\n'.encode()
+
+
+class EventStream:
+    """ASGI app streaming a user's library changes as Server-Sent Events
+
+    Each open stream is a coroutine waiting on a bounded queue, so idle
+    connections cost no thread and no database connection.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope['method'] != 'GET':
+            await self.reject(send, 405, 'Method not allowed.')
+            return
+        key = token_from_scope(scope)
+        user = await sync_to_async(authenticate)(key) if key else None
+        if user is None:
+            await self.reject(send, 401, 'Invalid or missing token.')
+            return
+
+        subscription = broker.subscribe(user.id)
+        if subscription is None:
+            await self.reject(send, 429, 'Too many open streams.')
+            return
+        try:
+            await self.stream(subscription, receive, send)
+        finally:
+            broker.unsubscribe(user.id, subscription)
+
+    async def stream(self, subscription, receive, send):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await self.write(send, f'retry: {settings.EVENTS_RETRY_MS}\n\n')
+
+        disconnected = asyncio.ensure_future(self.wait_disconnect(receive))
+        try:
+            while True:
+                event = asyncio.ensure_future(subscription.get())
+                done, _ = await asyncio.wait(
+                    {event, disconnected},
+                    timeout=settings.EVENTS_HEARTBEAT_SECONDS,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if event not in done:
+                    event.cancel()
+                if disconnected in done:
+                    break
+                if event in done:
+                    await send({
+                        'type': 'http.response.body',
+                        'body': format_event(event.result()),
+                        'more_body': True,
+                    })
+                else:
+                    # Keeps proxies from closing the idle connection
+                    await self.write(send, ': ping\n\n')
+        finally:
+            disconnected.cancel()
+
+    async def wait_disconnect(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    async def write(self, send, text):
+        await send({
+            'type': 'http.response.body',
+            'body': text.encode(),
+            'more_body': True,
+        })
+
+    async def reject(self, send, status, detail):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': json.dumps({'detail': detail}).encode(),
+        })
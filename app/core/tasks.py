@@ -0,0 +1,17 @@
+from django.conf import settings
+from core.models import AccountPurge
+from core.queue import task, enqueue
+from core.purge import purge_account
+
+
+@task('core.purge_account')
+def purge_account_task(purge_id):
+    """Delete a slice of a purged account, queueing the rest"""
+    purge = AccountPurge.objects.get(pk=purge_id)
+    done = purge_account(
+        purge,
+        batch_size=settings.PURGE_BATCH_SIZE,
+        max_batches=settings.PURGE_BATCHES_PER_TASK
+    )
+    if not done:
+        enqueue('core.purge_account', purge_id=purge_id)
@@ -1,6 +1,9 @@
+from django.contrib import admin
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from unittest.mock import patch
+from core.models import Tag, Ingredient, Recipe
 
 
 class AdminSiteTest(TestCase):
@@ -39,3 +42,63 @@ class AdminSiteTest(TestCase):
         res = self.client.get(url)
 
         self.assertEqual(res.status_code, 200)
+
+    def test_recipe_changelist(self):
+        """Test recipe changelist joins users instead of querying per row"""
+        for i in range(5):
+            Recipe.objects.create(
+                user=self.user, title=f'Recipe {i}', price=5, time_minutes=4
+            )
+        url = reverse('admin:core_recipe_changelist')
+
+        with self.assertNumQueries(4):
+            res = self.client.get(url)
+
+        self.assertContains(res, 'Recipe 4')
+
+    def test_tag_and_ingredient_changelists(self):
+        """Test tag and ingredient changelists load"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        Ingredient.objects.create(user=self.user, name='Salt')
+
+        res = self.client.get(reverse('admin:core_tag_changelist'))
+        self.assertContains(res, 'Vegan')
+        res = self.client.get(reverse('admin:core_ingredient_changelist'))
+        self.assertContains(res, 'Salt')
+
+    def test_recipe_change_page_uses_autocomplete(self):
+        """Test recipe change form does not render every tag"""
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup', price=5, time_minutes=4
+        )
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Linked'))
+        Tag.objects.create(user=self.user, name='Unlinked')
+
+        url = reverse('admin:core_recipe_change', args=[recipe.id])
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, 'Linked')
+        self.assertNotContains(res, 'Unlinked')
+
+    def test_recipe_change_bumps_version(self):
+        """Test saving a recipe in the admin moves it to a new version"""
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup', price=5, time_minutes=4
+        )
+        recipe.title = 'Stew'
+
+        admin.site._registry[Recipe].save_model(None, recipe, None, True)
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Stew')
+        self.assertEqual(recipe.version, 2)
+
+    @patch('core.paginator.table_estimate', return_value=123456)
+    def test_changelist_estimated_count(self, estimate):
+        """Test large tables show an estimated count"""
+        url = reverse('admin:core_recipe_changelist')
+        res = self.client.get(url)
+
+        self.assertContains(res, '123456')
+        estimate.assert_called_once()
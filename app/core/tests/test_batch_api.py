@@ -0,0 +1,172 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import Recipe, Tag
+
+
+BATCH_URL = reverse('core:batch')
+
+
+class PublicBatchApiTest(TestCase):
+    """Test unauthenticated batch api access"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_auth_required(self):
+        """Test auth is required for batches"""
+        res = self.client.post(
+            BATCH_URL,
+            {'requests': [{'path': '/api/user/me/'}]},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateBatchApiTest(TestCase):
+    """Test authenticated batch api access"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@app.com',
+            'testpass',
+            name='Test name'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_batch_startup_reads(self):
+        """Test several reads are answered in one response"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.post(BATCH_URL, {'requests': [
+            {'path': '/api/user/me/'},
+            {'path': '/api/recipe/tags/'},
+            {'path': '/api/recipe/ingredients/'},
+            {'path': '/api/recipe/recipe/?expand=tags'},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['status'] for item in res.data],
+            [200, 200, 200, 200]
+        )
+        self.assertEqual(res.data[0]['body']['email'], self.user.email)
+        self.assertEqual(res.data[1]['body'][0]['name'], 'Vegan')
+        self.assertEqual(res.data[2]['body'], [])
+
+    def test_batch_write_then_read(self):
+        """Test reads after a write see the written data"""
+        res = self.client.post(BATCH_URL, {'requests': [
+            {'path': '/api/recipe/tags/'},
+            {
+                'method': 'POST',
+                'path': '/api/recipe/tags/',
+                'body': {'name': 'Dessert'}
+            },
+            {'path': '/api/recipe/tags/'},
+        ]}, format='json')
+
+        self.assertEqual(
+            [item['status'] for item in res.data],
+            [200, 201, 200]
+        )
+        self.assertEqual(res.data[0]['body'], [])
+        self.assertEqual(res.data[2]['body'][0]['name'], 'Dessert')
+
+    def test_batch_item_errors(self):
+        """Test failing sub-requests report their own status"""
+        res = self.client.post(BATCH_URL, {'requests': [
+            {'path': '/api/recipe/recipe/999/'},
+            {'method': 'POST', 'path': '/api/recipe/tags/', 'body': {}},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['status'] for item in res.data],
+            [404, 400]
+        )
+
+    def test_batch_item_exception(self):
+        """Test an item raising in its view fails alone"""
+        with self.assertLogs('core.views', 'ERROR'):
+            res = self.client.post(BATCH_URL, {'requests': [
+                {'path': '/api/recipe/recipe/?tags=x'},
+                {'path': '/api/recipe/tags/'},
+            ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['status'] for item in res.data],
+            [500, 200]
+        )
+
+    def test_batch_headers_per_item(self):
+        """Test headers of the batch and of other items are not applied"""
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=1
+        )
+        path = f'/api/recipe/recipe/{recipe.id}/'
+
+        res = self.client.post(BATCH_URL, {'requests': [
+            {'method': 'PATCH', 'path': path, 'body': {'title': 'Stew'}},
+            {
+                'method': 'PATCH',
+                'path': path,
+                'body': {'title': 'Broth'},
+                'headers': {'If-Match': '"1"'},
+            },
+        ]}, format='json', HTTP_IF_MATCH='"99"')
+
+        self.assertEqual(
+            [item['status'] for item in res.data],
+            [200, 412]
+        )
+
+    def test_batch_rejects_reserved_headers(self):
+        """Test items cannot replace the batch's authentication"""
+        res = self.client.post(BATCH_URL, {'requests': [
+            {'path': '/api/user/me/', 'headers': {'Authorization': 'x'}},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_rejects_other_routes(self):
+        """Test only user and recipe routes can be batched"""
+        res = self.client.post(BATCH_URL, {'requests': [
+            {'path': '/api/batch/'},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ConcurrentBatchApiTest(TransactionTestCase):
+    """Test reads outside a transaction run on worker threads"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@app.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_concurrent_reads(self):
+        """Test concurrent reads return the same payloads as serial ones"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.post(BATCH_URL, {'requests': [
+            {'path': '/api/recipe/tags/'},
+            {'path': '/api/recipe/ingredients/'},
+            {'path': '/api/recipe/tags/'},
+        ]}, format='json')
+
+        self.assertEqual(
+            [item['status'] for item in res.data],
+            [200, 200, 200]
+        )
+        self.assertEqual(res.data[0], res.data[2])
+        self.assertEqual(res.data[0]['body'][0]['name'], 'Vegan')
@@ -0,0 +1,54 @@
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core.budget import QueryBudget, QueryBudgetExceeded
+from core.models import Tag
+from recipe.views import TagViewSet
+
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class QueryBudgetTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@app.com', 'pass'
+        )
+
+    def test_within_budget(self):
+        """Test a block within its budget passes"""
+        with QueryBudget(1) as context:
+            list(Tag.objects.all())
+
+        self.assertEqual(len(context), 1)
+
+    def test_over_budget(self):
+        """Test a block over its budget fails listing the queries"""
+        with self.assertRaisesRegex(QueryBudgetExceeded, 'budget is 1'):
+            with QueryBudget(1):
+                list(Tag.objects.all())
+                list(Tag.objects.all())
+
+    def test_decorator(self):
+        """Test the budget can decorate a function"""
+        @QueryBudget(0)
+        def load():
+            return list(Tag.objects.all())
+
+        with self.assertRaises(QueryBudgetExceeded):
+            load()
+
+    @override_settings(DEBUG=True)
+    def test_middleware_warns_over_budget(self):
+        """Test DEBUG requests over their route budget are logged"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        with patch.dict(TagViewSet.query_budgets, {'list': 0}):
+            with self.assertLogs('core.middleware', 'WARNING') as logs:
+                client.get(TAGS_URL)
+
+        self.assertIn('budget is 0', logs.output[0])
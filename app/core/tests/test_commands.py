@@ -1,7 +1,12 @@
+from datetime import timedelta
+from io import StringIO
 from unittest.mock import patch
 from django.core.management import call_command
 from django.db.utils import OperationalError
 from django.test import TestCase
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from core.models import AuthToken, Tag, Recipe, Change
 
 
 class CommandTests(TestCase):
@@ -20,3 +25,48 @@ class CommandTests(TestCase):
             gi.side_effect = [OperationalError] * 5 + [True]
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
+
+    def test_repair_usage_counts(self):
+        """Test usage counts are recomputed from recipe links"""
+        user = get_user_model().objects.create_user('user@app.com', 'pass')
+        tag = Tag.objects.create(user=user, name='Vegan')
+        recipe = Recipe.objects.create(
+            user=user, title='Soup', price=5.00, time_minutes=4
+        )
+        recipe.tags.add(tag)
+        Tag.objects.update(usage_count=42)
+
+        call_command('repair_usage_counts', batch_size=1, stdout=StringIO())
+
+        tag.refresh_from_db()
+        self.assertEqual(tag.usage_count, 1)
+
+    def test_compact_changes(self):
+        """Test superseded entries and old tombstones are removed"""
+        user = get_user_model().objects.create_user('user@app.com', 'pass')
+        tag = Tag.objects.create(user=user, name='Vegan')
+        tag.name = 'Vegetarian'
+        tag.save()
+        old = Tag.objects.create(user=user, name='Old')
+        old.delete()
+        Change.objects.filter(action=Change.DELETE).update(
+            created=timezone.now() - timedelta(days=365)
+        )
+
+        call_command('compact_changes', stdout=StringIO())
+
+        self.assertEqual(
+            list(Change.objects.values_list('object_id', 'action')),
+            [(tag.id, Change.UPSERT)]
+        )
+
+    def test_purge_tokens(self):
+        """Test expired tokens are deleted in batches, live ones kept"""
+        user = get_user_model().objects.create_user('user@app.com', 'pass')
+        for _ in range(3):
+            AuthToken.objects.create(user=user, expires=timezone.now())
+        live = AuthToken.objects.create(user=user)
+
+        call_command('purge_tokens', batch_size=2, stdout=StringIO())
+
+        self.assertEqual(list(AuthToken.objects.all()), [live])
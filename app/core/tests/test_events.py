@@ -0,0 +1,199 @@
+import asyncio
+from datetime import timedelta
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TransactionTestCase, \
+    override_settings
+from django.utils import timezone
+from core import events
+from core.models import AuthToken, Change, Tag
+from core.stream import EventStream
+
+
+def run_stream(scope, deliver=None, ticks=5):
+    """Run the event stream until the client disconnects, return output"""
+    sent = []
+
+    async def main():
+        disconnect = asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        task = asyncio.ensure_future(EventStream()(scope, receive, send))
+        for _ in range(ticks):
+            await asyncio.sleep(0.01)
+        if deliver:
+            deliver()
+            await asyncio.sleep(0.01)
+        disconnect.set()
+        await asyncio.wait_for(task, 1)
+
+    asyncio.run(main())
+    return sent
+
+
+def http_scope(token=None):
+    headers = []
+    if token:
+        headers.append((b'authorization', f'Token {token}'.encode()))
+    return {
+        'type': 'http',
+        'method': 'GET',
+        'path': '/api/events/',
+        'query_string': b'',
+        'headers': headers,
+    }
+
+
+class BrokerTests(SimpleTestCase):
+
+    def test_delivers_to_user_streams(self):
+        """Test events reach the streams of their user only"""
+        async def main():
+            broker = events.Broker()
+            mine = broker.subscribe(1)
+            other = broker.subscribe(2)
+            broker.deliver(1, {'type': 'tag'})
+            await asyncio.sleep(0)
+            return await mine.get(), other.queue.qsize()
+
+        with patch.object(events.LocalBackend, 'run'):
+            self.assertEqual(asyncio.run(main()), ({'type': 'tag'}, 0))
+
+    def test_overflow_collapses_to_resync(self):
+        """Test a stream that falls behind is told to sync instead"""
+        subscription = events.Subscription(None, 2)
+        for id_ in range(5):
+            subscription.push({'type': 'tag', 'ids': [id_]})
+
+        self.assertEqual(subscription.queue.qsize(), 1)
+        self.assertIs(asyncio.run(subscription.get()), events.RESYNC)
+        self.assertFalse(subscription.overflowed)
+
+    @override_settings(EVENTS_MAX_STREAMS_PER_USER=1)
+    def test_stream_limit(self):
+        """Test a user cannot open streams past the limit"""
+        async def main():
+            broker = events.Broker()
+            return broker.subscribe(1), broker.subscribe(1)
+
+        first, second = asyncio.run(main())
+
+        self.assertIsNotNone(first)
+        self.assertIsNone(second)
+
+    def test_group_changes(self):
+        """Test feed rows become one event per user, type and action"""
+        rows = [
+            (1, 7, 'tag', 'upsert', 3),
+            (2, 7, 'tag', 'upsert', 4),
+            (3, 8, 'recipe', 'delete', 5),
+        ]
+
+        self.assertEqual(events.group_changes(rows), [
+            (7, {'type': 'tag', 'action': 'upsert', 'ids': [3, 4]}),
+            (8, {'type': 'recipe', 'action': 'delete', 'ids': [5]}),
+        ])
+
+
+class EventStreamTests(TransactionTestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@app.com',
+            'testpass'
+        )
+        self.token = AuthToken.objects.issue(self.user)
+
+    def test_changes_published_on_commit(self):
+        """Test saved objects are published once committed"""
+        with patch.object(events.LocalBackend, 'publish') as publish:
+            tag = Tag.objects.create(user=self.user, name='Vegan')
+
+        publish.assert_called_once_with(
+            self.user.id,
+            {'type': 'tag', 'action': 'upsert', 'ids': [tag.id]}
+        )
+
+    def test_change_feed_backend_reads_new_rows(self):
+        """Test the polling backend picks up rows after its position"""
+        backend = events.ChangeFeedBackend()
+        last = backend.latest()
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+
+        rows = backend.read([self.user.id], last)
+
+        self.assertEqual(
+            events.group_changes(rows),
+            [(self.user.id, events.change_event('tag', 'upsert', [tag.id]))]
+        )
+
+    def test_change_feed_backend_reads_late_commits(self):
+        """Test rows that become visible below the position are read once"""
+        backend = events.ChangeFeedBackend()
+        last = backend.latest()
+        Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Quick')
+        late = Change.objects.filter(id__gt=last).order_by('id').first()
+        Change.objects.filter(pk=late.pk).delete()
+
+        rows = backend.read([self.user.id], last)
+        self.assertNotIn(late.id, [row[0] for row in rows])
+
+        # As if the transaction writing it had only committed now
+        late.save()
+        rows = backend.read([self.user.id], rows[-1][0])
+        self.assertEqual([row[0] for row in rows], [late.id])
+        self.assertEqual(backend.read([self.user.id], late.id + 1), [])
+
+    def test_change_feed_backend_settles_old_rows(self):
+        """Test rows past the lookback are no longer tracked or read"""
+        backend = events.ChangeFeedBackend()
+        last = backend.latest()
+        Tag.objects.create(user=self.user, name='Vegan')
+        rows = backend.read([self.user.id], last)
+
+        later = timezone.now() + timedelta(hours=1)
+        with patch('core.events.timezone.now', return_value=later):
+            self.assertEqual(backend.read([self.user.id], rows[-1][0]), [])
+
+        self.assertEqual(backend.settled, rows[-1][0])
+        self.assertEqual(backend.delivered, {})
+
+    def test_token_required(self):
+        """Test streams are refused without a valid token"""
+        sent = run_stream(http_scope('invalid'))
+
+        self.assertEqual(sent[0]['status'], 401)
+
+    def test_streams_changes(self):
+        """Test changes of the user are pushed as events"""
+        sent = run_stream(
+            http_scope(self.token.key),
+            lambda: events.broker.deliver(
+                self.user.id,
+                {'type': 'tag', 'action': 'upsert', 'ids': [1]}
+            )
+        )
+
+        self.assertEqual(sent[0]['status'], 200)
+        body = b''.join(message.get('body', b'') for message in sent[1:])
+        self.assertIn(
+            b'event: change\ndata: {"type": "tag", "action": "upsert", '
+            b'"ids": [1]}\n\n',
+            body
+        )
+        self.assertEqual(events.broker.user_ids(), [])
+
+    @override_settings(EVENTS_HEARTBEAT_SECONDS=0.01)
+    def test_heartbeats(self):
+        """Test idle streams are kept alive with comments"""
+        sent = run_stream(http_scope(self.token.key))
+
+        body = b''.join(message.get('body', b'') for message in sent[1:])
+        self.assertIn(b': ping\n\n', body)
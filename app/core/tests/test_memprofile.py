@@ -0,0 +1,160 @@
+import tracemalloc
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core import memprofile
+from core.middleware import MemoryProfileMiddleware
+
+
+MEMORY_URL = reverse('core:memory')
+SNAPSHOTS_URL = reverse('core:memory-snapshots')
+DIFF_URL = reverse('core:memory-diff')
+
+
+class MemoryProfileTestCase(TestCase):
+
+    def setUp(self):
+        self.was_tracing = tracemalloc.is_tracing()
+        memprofile.reset()
+
+    def tearDown(self):
+        memprofile.reset()
+        if not self.was_tracing:
+            tracemalloc.stop()
+
+
+class MemoryProfileMiddlewareTests(MemoryProfileTestCase):
+
+    def allocate(self, request):
+        request.held = [bytearray(1024) for _ in range(256)]
+        return HttpResponse()
+
+    def test_disabled_by_default(self):
+        """Test the middleware drops out when profiling is off"""
+        with override_settings(MEMORY_PROFILING=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                MemoryProfileMiddleware(self.allocate)
+
+    @override_settings(MEMORY_PROFILING=True)
+    def test_records_route_histogram(self):
+        """Test requests are counted in the histogram of their route"""
+        middleware = MemoryProfileMiddleware(self.allocate)
+
+        middleware(RequestFactory().get('/nowhere/'))
+
+        stats = memprofile.route_stats()['GET unmatched']
+        self.assertEqual(stats['requests'], 1)
+        self.assertGreaterEqual(stats['max_allocated'], 256 * 1024)
+        if memprofile.current_rss() is not None:
+            self.assertGreater(stats['max_rss'], 0)
+        self.assertEqual(sum(stats['histogram'].values()), 1)
+        self.assertEqual(memprofile.flagged_requests(), [])
+
+    @override_settings(
+        MEMORY_PROFILING=True,
+        MEMORY_PROFILE_THRESHOLD_KB=64,
+        MEMORY_PROFILE_SAMPLE_RATE=1
+    )
+    def test_flags_large_requests(self):
+        """Test flagged requests list the sites that grew while they ran"""
+        middleware = MemoryProfileMiddleware(self.allocate)
+
+        with self.assertLogs('core.memprofile', 'WARNING'):
+            middleware(RequestFactory().get('/nowhere/'))
+
+        flagged, = memprofile.flagged_requests()
+        self.assertEqual(flagged['route'], 'GET unmatched')
+        top = flagged['sites'][0]
+        self.assertIn('test_memprofile.py', top['site'])
+        self.assertGreaterEqual(top['size_diff'], 256 * 1024)
+
+    @override_settings(
+        MEMORY_PROFILING=True,
+        MEMORY_PROFILE_THRESHOLD_KB=64,
+        MEMORY_PROFILE_SAMPLE_RATE=0
+    )
+    def test_unsampled_requests_flagged_without_sites(self):
+        """Test requests without a baseline are flagged but not diffed"""
+        middleware = MemoryProfileMiddleware(self.allocate)
+
+        with self.assertLogs('core.memprofile', 'WARNING'):
+            middleware(RequestFactory().get('/nowhere/'))
+
+        flagged, = memprofile.flagged_requests()
+        self.assertIsNone(flagged['sites'])
+
+    @override_settings(MEMORY_PROFILE_BUCKETS_KB=(64, 1024))
+    def test_bucket_for(self):
+        """Test sizes are put in the smallest bucket that holds them"""
+        self.assertEqual(memprofile.bucket_for(1024), '<=64KB')
+        self.assertEqual(memprofile.bucket_for(65 * 1024), '<=1024KB')
+        self.assertEqual(memprofile.bucket_for(2 ** 30), '>1024KB')
+
+
+class MemoryApiTests(MemoryProfileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'staff@app.com',
+            'testpass'
+        )
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_authenticate(self.user)
+
+    def test_staff_required(self):
+        """Test diagnostics are hidden from other users"""
+        self.user.is_staff = False
+        self.user.save()
+
+        res = self.client.get(MEMORY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_snapshot_requires_tracing(self):
+        """Test snapshots are refused while profiling is off"""
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        res = self.client.post(SNAPSHOTS_URL, {'name': 'before'})
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+
+    def test_snapshot_diff(self):
+        """Test two snapshots are compared by allocation site"""
+        memprofile.start()
+        self.client.post(SNAPSHOTS_URL, {'name': 'before'})
+        held = [bytearray(1024) for _ in range(256)]
+        res = self.client.post(SNAPSHOTS_URL, {'name': 'after'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        res = self.client.get(DIFF_URL, {'old': 'before', 'new': 'after'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertGreaterEqual(
+            max(site['size_diff'] for site in res.data),
+            len(held) * 1024
+        )
+
+    def test_diff_unknown_snapshot(self):
+        """Test comparing against a missing snapshot is not found"""
+        res = self.client.get(DIFF_URL, {'old': 'before', 'new': 'after'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_memory_overview(self):
+        """Test the overview lists routes, snapshots and flagged requests"""
+        memprofile.record_request('GET api/recipe/', 2048, 4096, 4096)
+
+        res = self.client.get(MEMORY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['routes']['GET api/recipe/']['requests'], 1)
+        self.assertIn('peak_rss', res.data)
+        self.assertIn('rss', res.data)
@@ -1,5 +1,7 @@
 from core import models
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from unittest.mock import patch
 
@@ -83,3 +85,64 @@ class ModelTestCase(TestCase):
 
         expected = f'uploads/recipe/{uuid_}.jpg'
         self.assertEqual(expected, uuid_filename)
+
+    def test_usage_count_follows_recipe_links(self):
+        """Test usage counts track tags and ingredients on recipes"""
+        user = sample_user()
+        tag = models.Tag.objects.create(user=user, name='Vegan')
+        salt = models.Ingredient.objects.create(user=user, name='Salt')
+        recipe = models.Recipe.objects.create(
+            user=user, title='Soup', price=5.00, time_minutes=4
+        )
+        other = models.Recipe.objects.create(
+            user=user, title='Salad', price=5.00, time_minutes=4
+        )
+
+        recipe.tags.add(tag)
+        recipe.ingredients.add(salt)
+        tag.recipe_set.add(other)
+        tag.refresh_from_db()
+        salt.refresh_from_db()
+        self.assertEqual(tag.usage_count, 2)
+        self.assertEqual(salt.usage_count, 1)
+
+        recipe.tags.clear()
+        tag.refresh_from_db()
+        self.assertEqual(tag.usage_count, 1)
+
+        recipe.delete()
+        other.tags.remove(tag)
+        tag.refresh_from_db()
+        salt.refresh_from_db()
+        self.assertEqual(tag.usage_count, 0)
+        self.assertEqual(salt.usage_count, 0)
+
+    def test_bulk_delete_releases_usage_once(self):
+        """Test deleting many recipes reads their links in one query"""
+        user = sample_user()
+        tag = models.Tag.objects.create(user=user, name='Vegan')
+        salt = models.Ingredient.objects.create(user=user, name='Salt')
+        for title in ('Soup', 'Salad', 'Stew'):
+            recipe = models.Recipe.objects.create(
+                user=user, title=title, price=5.00, time_minutes=4
+            )
+            recipe.tags.add(tag)
+            recipe.ingredients.add(salt)
+        keep = models.Recipe.objects.create(
+            user=user, title='Toast', price=5.00, time_minutes=4
+        )
+        keep.tags.add(tag)
+
+        with CaptureQueriesContext(connection) as queries:
+            models.Recipe.objects.exclude(pk=keep.pk).delete()
+
+        link_reads = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('SELECT') and
+            'core_recipe_ingredients' in query['sql']
+        ]
+        self.assertEqual(len(link_reads), 1)
+        tag.refresh_from_db()
+        salt.refresh_from_db()
+        self.assertEqual(tag.usage_count, 1)
+        self.assertEqual(salt.usage_count, 0)
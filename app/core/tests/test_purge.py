@@ -0,0 +1,88 @@
+from io import StringIO
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from core.models import AccountPurge, Change, Tag, Ingredient, Recipe
+from core.purge import request_purge, purge_account
+
+
+def sample_library(user, size=3):
+    """Create a small library of linked recipes for user"""
+    tag = Tag.objects.create(user=user, name='Vegan')
+    ingredient = Ingredient.objects.create(user=user, name='Salt')
+    for i in range(size):
+        recipe = Recipe.objects.create(
+            user=user, title=f'Recipe {i}', price=5.00, time_minutes=4
+        )
+        recipe.tags.add(tag)
+        recipe.ingredients.add(ingredient)
+
+
+class PurgeTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@app.com', 'pass'
+        )
+        self.other = get_user_model().objects.create_user(
+            'other@app.com', 'pass'
+        )
+        sample_library(self.user)
+        sample_library(self.other)
+
+    def test_purge_account(self):
+        """Test purging removes only the user's rows"""
+        purge = request_purge(self.user)
+
+        self.assertTrue(purge_account(purge, batch_size=2))
+
+        purge.refresh_from_db()
+        self.assertIsNotNone(purge.finished)
+        self.assertIsNone(purge.user)
+        self.assertFalse(
+            get_user_model().objects.filter(pk=self.user.pk).exists()
+        )
+        self.assertEqual(Recipe.objects.count(), 3)
+        self.assertEqual(Tag.objects.count(), 1)
+        self.assertFalse(Change.objects.filter(user=self.user).exists())
+
+    def test_purge_skips_per_row_bookkeeping(self):
+        """Test purged rows do not each invalidate the user's caches"""
+        purge = request_purge(self.user)
+
+        with patch('recipe.signals.bump_library_version') as bump, \
+                patch('recipe.signals.adjust_recipe_count') as adjust, \
+                patch('recipe.signals.schedule_refresh') as refresh, \
+                patch('recipe.signals.invalidate_recipes') as invalidate:
+            purge_account(purge, batch_size=2)
+
+        bump.assert_called_once_with(self.user.pk)
+        adjust.assert_not_called()
+        refresh.assert_not_called()
+        invalidate.assert_not_called()
+
+    def test_purge_account_resumes(self):
+        """Test a paused purge continues where it stopped"""
+        purge = request_purge(self.user)
+
+        self.assertFalse(purge_account(purge, batch_size=2, max_batches=3))
+        purge.refresh_from_db()
+        self.assertEqual(purge.stage, 'recipe_ingredients')
+        self.assertEqual(purge.rows_deleted, 5)
+
+        self.assertTrue(purge_account(purge, batch_size=2))
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 0)
+
+    def test_purge_accounts_command(self):
+        """Test the command processes pending purges"""
+        request_purge(self.user)
+
+        call_command('purge_accounts', stdout=StringIO())
+
+        self.assertFalse(
+            AccountPurge.objects.filter(finished__isnull=True).exists()
+        )
+        self.assertEqual(
+            Tag.objects.get(user=self.other).usage_count, 3
+        )
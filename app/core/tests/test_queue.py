@@ -0,0 +1,168 @@
+import time
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from core import queue
+from core.models import AccountPurge, Task
+
+
+calls = []
+
+
+@queue.task('tests.record')
+def record_task(value):
+    calls.append(value)
+
+
+@queue.task('tests.slow')
+def slow_task():
+    locked_at = Task.objects.get(name='tests.slow').locked_at
+    time.sleep(0.2)
+    calls.append(Task.objects.get(name='tests.slow').locked_at > locked_at)
+
+
+@queue.task('tests.fail')
+def fail_task():
+    raise RuntimeError('boom')
+
+
+class QueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def run_worker(self):
+        call_command('run_worker', once=True, stdout=StringIO())
+
+    def run_failing_worker(self):
+        with self.assertLogs('core.queue', level='ERROR'):
+            self.run_worker()
+
+    def test_run_task(self):
+        """Test the worker runs queued tasks with their payload"""
+        task_obj = queue.enqueue('tests.record', value=42)
+
+        self.run_worker()
+
+        task_obj.refresh_from_db()
+        self.assertEqual(calls, [42])
+        self.assertEqual(task_obj.status, Task.DONE)
+        self.assertEqual(task_obj.attempts, 1)
+
+    def test_future_task_not_run(self):
+        """Test tasks are not run before they are due"""
+        queue.enqueue(
+            'tests.record',
+            run_at=timezone.now() + timezone.timedelta(hours=1),
+            value=1
+        )
+
+        self.run_worker()
+
+        self.assertEqual(calls, [])
+
+    def test_retry_with_backoff(self):
+        """Test failing tasks are retried later until attempts run out"""
+        task_obj = queue.enqueue('tests.fail', max_attempts=2)
+
+        self.run_failing_worker()
+        task_obj.refresh_from_db()
+        self.assertEqual(task_obj.status, Task.QUEUED)
+        self.assertGreater(task_obj.run_at, timezone.now())
+        self.assertIn('boom', task_obj.last_error)
+
+        Task.objects.update(run_at=timezone.now())
+        self.run_failing_worker()
+        task_obj.refresh_from_db()
+        self.assertEqual(task_obj.status, Task.FAILED)
+        self.assertEqual(task_obj.attempts, 2)
+
+    def test_unknown_task_fails(self):
+        """Test tasks without a registered function fail at once"""
+        task_obj = queue.enqueue('tests.missing')
+
+        self.run_failing_worker()
+
+        task_obj.refresh_from_db()
+        self.assertEqual(task_obj.status, Task.FAILED)
+
+    def test_claim_is_exclusive(self):
+        """Test a claimed task is not handed to another worker"""
+        queue.enqueue('tests.record', value=1)
+
+        self.assertEqual(len(queue.claim('worker-1')), 1)
+        self.assertEqual(queue.claim('worker-2'), [])
+
+    def test_requeue_stale(self):
+        """Test tasks of unresponsive workers are queued again"""
+        task_obj = queue.enqueue('tests.record', value=1)
+        queue.claim('worker-1')
+        Task.objects.update(
+            locked_at=timezone.now() - timezone.timedelta(days=1)
+        )
+
+        self.assertEqual(queue.requeue_stale(), 1)
+        task_obj.refresh_from_db()
+        self.assertEqual(task_obj.status, Task.QUEUED)
+
+    def test_outcome_kept_for_lock_holder(self):
+        """Test a worker that lost its lock does not overwrite the task"""
+        queue.enqueue('tests.record', value=1)
+        stale, = queue.claim('worker-1')
+        Task.objects.update(status=Task.RUNNING, locked_by='worker-2')
+
+        with self.assertLogs('core.queue', level='WARNING'):
+            self.assertFalse(queue.run(stale))
+
+        task_obj = Task.objects.get()
+        self.assertEqual(task_obj.status, Task.RUNNING)
+        self.assertEqual(task_obj.locked_by, 'worker-2')
+
+    def test_purge_finished_tasks(self):
+        """Test finished tasks past the retention are deleted"""
+        old = timezone.now() - timezone.timedelta(days=30)
+        for status in (Task.DONE, Task.FAILED):
+            Task.objects.create(
+                name='tests.record', status=status, finished=old
+            )
+        recent = Task.objects.create(
+            name='tests.record', status=Task.DONE, finished=timezone.now()
+        )
+        queued = queue.enqueue('tests.record', value=1)
+
+        call_command('purge_tasks', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(
+            set(Task.objects.values_list('id', flat=True)),
+            {recent.id, queued.id}
+        )
+
+    def test_account_purge_task(self):
+        """Test deleting a user queues the purge of their account"""
+        user = get_user_model().objects.create_user('user@app.com', 'pass')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        client.delete(reverse('user:me'))
+        self.run_worker()
+
+        self.assertIsNotNone(AccountPurge.objects.get().finished)
+
+
+class QueueHeartbeatTests(TransactionTestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    @override_settings(TASK_HEARTBEAT_INTERVAL=0.05)
+    def test_running_task_keeps_lock_fresh(self):
+        """Test a long task refreshes its lock instead of going stale"""
+        queue.enqueue('tests.slow')
+
+        call_command('run_worker', once=True, stdout=StringIO())
+
+        self.assertEqual(calls, [True])
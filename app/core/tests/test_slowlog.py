@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core.slowlog import fingerprint, normalize_sql
+
+
+TAGS_URL = reverse('recipe:tag-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class SlowQueryLogTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log = os.path.join(self.tmp.name, 'logs', 'slow.log')
+        self.user = get_user_model().objects.create_user(
+            'user@app.com', 'pass'
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read_log(self):
+        with open(self.log) as log:
+            return [json.loads(line) for line in log]
+
+    def test_fingerprint_ignores_values(self):
+        """Test queries differing only in values share a fingerprint"""
+        first = "SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'a'"
+        second = "SELECT *  FROM t WHERE id IN (4, 5) AND name = 'it''s'"
+        self.assertEqual(fingerprint(first), fingerprint(second))
+        self.assertEqual(
+            normalize_sql(second),
+            'SELECT * FROM t WHERE id IN (...) AND name = ?'
+        )
+
+    def test_slow_queries_logged_with_route_and_user(self):
+        """Test queries over the threshold are attributed to the request"""
+        with override_settings(
+            SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_LOG=self.log
+        ):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            client.get(RECIPES_URL)
+
+        entries = self.read_log()
+        self.assertTrue(entries)
+        self.assertTrue(all(e['user_id'] == self.user.id for e in entries))
+        self.assertEqual(entries[0]['view'], 'recipe:recipe-list')
+        self.assertEqual(entries[0]['method'], 'GET')
+        self.assertTrue(any(
+            e['call_site'] and e['call_site'].startswith('recipe/')
+            for e in entries
+        ))
+
+    def test_fast_queries_not_logged(self):
+        """Test queries under the threshold are not written"""
+        with override_settings(
+            SLOW_QUERY_THRESHOLD_MS=60000, SLOW_QUERY_LOG=self.log
+        ):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            client.get(TAGS_URL)
+
+        self.assertFalse(os.path.exists(self.log))
+
+    def test_report_groups_by_fingerprint(self):
+        """Test the report aggregates entries per fingerprint"""
+        os.makedirs(os.path.dirname(self.log))
+        with open(self.log, 'w') as log:
+            for duration in (300, 500):
+                log.write(json.dumps({
+                    'fingerprint': 'abc',
+                    'sql': 'SELECT ?',
+                    'duration_ms': duration,
+                    'method': 'GET',
+                    'route': 'api/recipe/',
+                    'call_site': 'recipe/views.py:1 in list',
+                }) + '\n')
+
+        out = StringIO()
+        call_command('slow_queries', log=self.log, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('count=2', output)
+        self.assertIn('max=500.0ms', output)
+        self.assertIn('GET api/recipe/ (2)', output)
@@ -0,0 +1,25 @@
+from django.urls import path
+from core import views
+
+
+app_name = 'core'
+
+
+urlpatterns = [
+    path('batch/', views.BatchView.as_view(), name='batch'),
+    path(
+        'diagnostics/memory/',
+        views.MemoryView.as_view(),
+        name='memory'
+    ),
+    path(
+        'diagnostics/memory/snapshots/',
+        views.MemorySnapshotView.as_view(),
+        name='memory-snapshots'
+    ),
+    path(
+        'diagnostics/memory/diff/',
+        views.MemoryDiffView.as_view(),
+        name='memory-diff'
+    ),
+]
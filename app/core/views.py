@@ -0,0 +1,199 @@
+import json
+import logging
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connection, connections
+from django.urls import resolve, Resolver404
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from core.authentication import ExpiringTokenAuthentication
+from core import memprofile
+from core.serializers import BatchSerializer, MemoryDiffSerializer, \
+    MemorySnapshotSerializer
+
+
+logger = logging.getLogger(__name__)
+
+# Headers of the batch passed on to every sub-request; others, such as
+# If-Match, only apply to the item that sends them.
+FORWARDED_HEADERS = ('HTTP_AUTHORIZATION', 'HTTP_HOST')
+
+
+class BatchView(APIView):
+    """Execute several API requests in a single round-trip"""
+    authentication_classes = (ExpiringTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        """Run sub-requests in order, reads concurrently where possible"""
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['requests']
+
+        results = [None] * len(items)
+        reads = []
+        query_cache = {}
+        for index, item in enumerate(items):
+            if item['method'] == 'GET':
+                reads.append(index)
+                continue
+            self._run_reads(request, items, reads, results, query_cache)
+            reads = []
+            # Writes may change what later reads see
+            query_cache.clear()
+            results[index] = self._dispatch(request, item)
+        self._run_reads(request, items, reads, results, query_cache)
+
+        return Response(results, status=status.HTTP_200_OK)
+
+    def _run_reads(self, request, items, indexes, results, query_cache):
+        """Run independent reads, sharing results for identical ones"""
+        pending = {}
+        for index in indexes:
+            key = self._read_key(items[index])
+            if key not in query_cache and key not in pending:
+                pending[key] = items[index]
+
+        workers = min(settings.BATCH_MAX_WORKERS, len(pending))
+        # Worker threads use their own connections, which cannot see
+        # rows written by an open transaction on this one.
+        if workers > 1 and not connection.in_atomic_block:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                responses = executor.map(
+                    lambda item: self._dispatch_in_thread(request, item),
+                    pending.values()
+                )
+                query_cache.update(zip(pending, responses))
+        else:
+            for key, item in pending.items():
+                query_cache[key] = self._dispatch(request, item)
+
+        for index in indexes:
+            results[index] = query_cache[self._read_key(items[index])]
+
+    def _read_key(self, item):
+        return item['path'], tuple(sorted(item.get('headers', {}).items()))
+
+    def _dispatch_in_thread(self, request, item):
+        try:
+            return self._dispatch(request, item)
+        finally:
+            connections.close_all()
+
+    def _dispatch(self, request, item):
+        """Resolve and call the view for a sub-request"""
+        path, _, query_string = item['path'].partition('?')
+        try:
+            match = resolve(path)
+        except Resolver404:
+            return {
+                'status': status.HTTP_404_NOT_FOUND,
+                'body': {'detail': 'Not found.'}
+            }
+
+        try:
+            response = match.func(
+                self._build_request(request, item, path, query_string),
+                *match.args,
+                **match.kwargs
+            )
+        except Exception:
+            # One broken item must not fail the others
+            logger.exception('Batch item %s %s failed', item['method'], path)
+            return {
+                'status': status.HTTP_500_INTERNAL_SERVER_ERROR,
+                'body': {'detail': 'A server error occurred.'}
+            }
+        if hasattr(response, 'render'):
+            response.render()
+        body = getattr(response, 'data', None)
+        if body is None and response.content:
+            body = json.loads(response.content)
+        return {'status': response.status_code, 'body': body}
+
+    def _build_request(self, request, item, path, query_string):
+        """Build a sub-request that reuses the batch's authentication"""
+        content = b''
+        if 'body' in item:
+            content = json.dumps(item['body']).encode()
+        environ = {
+            key: value for key, value in request.META.items()
+            if key in FORWARDED_HEADERS or key.startswith('SERVER_')
+        }
+        for name, value in item.get('headers', {}).items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        environ.update({
+            'REQUEST_METHOD': item['method'],
+            'PATH_INFO': path,
+            'QUERY_STRING': query_string,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(content)),
+            'wsgi.input': BytesIO(content),
+            'wsgi.url_scheme': request.scheme,
+        })
+        sub_request = WSGIRequest(environ)
+        sub_request._force_auth_user = request.user
+        sub_request._force_auth_token = request.auth
+        return sub_request
+
+
+class MemoryView(APIView):
+    """Show memory use of this worker process per route"""
+    authentication_classes = (ExpiringTokenAuthentication,)
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        current, peak = tracemalloc.get_traced_memory()
+        return Response({
+            'tracing': tracemalloc.is_tracing(),
+            'traced': {'current': current, 'peak': peak},
+            'peak_rss': memprofile.peak_rss(),
+            'rss': memprofile.current_rss(),
+            'routes': memprofile.route_stats(),
+            'flagged': memprofile.flagged_requests(),
+            'snapshots': memprofile.snapshot_list(),
+        })
+
+    def delete(self, request):
+        memprofile.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MemorySnapshotView(APIView):
+    """Take a named allocation snapshot for later comparison"""
+    authentication_classes = (ExpiringTokenAuthentication,)
+    permission_classes = (IsAdminUser,)
+
+    def post(self, request):
+        serializer = MemorySnapshotSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        name = serializer.validated_data['name']
+        memprofile.take_snapshot(name)
+        return Response(
+            {'snapshots': memprofile.snapshot_list()},
+            status=status.HTTP_201_CREATED
+        )
+
+
+class MemoryDiffView(APIView):
+    """Compare two snapshots by allocation site"""
+    authentication_classes = (ExpiringTokenAuthentication,)
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        serializer = MemoryDiffSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        try:
+            sites = memprofile.diff_snapshots(
+                params['old'], params['new'], params['limit']
+            )
+        except KeyError as exc:
+            raise NotFound(f'No snapshot named {exc.args[0]}.')
+        return Response(sites)
@@ -0,0 +1,268 @@
+import hashlib
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+LIBRARY_VERSION_KEY = 'recipe:library:{user_id}'
+STATS_KEY = 'recipe:stats:{user_id}:{version}:v2'
+RECIPE_COUNT_KEY = 'recipe:count:{user_id}'
+INDEX_VERSION_KEY = 'recipe:index:{user_id}'
+RECIPE_KEY = 'recipe:repr:{recipe_id}:{version}:{variant}:v3'
+SUGGEST_KEY = 'recipe:suggest:{user_id}:{version}:{kind}:{limit}:{digest}:v2'
+FLIGHT_LOCK_KEY = '{key}:lock'
+FLIGHT_COUNTER_KEY = 'recipe:flight:{outcome}'
+FLIGHT_OUTCOMES = ('computed', 'stale', 'waited', 'timeout')
+
+# Keys being computed by a thread of this process
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def library_version(user_id):
+    """Return the current cache version of a user's library"""
+    key = LIBRARY_VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a version lost to eviction is never reused
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_library_version(user_id):
+    """Invalidate every cached value derived from a user's library"""
+    key = LIBRARY_VERSION_KEY.format(user_id=user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        library_version(user_id)
+
+
+def index_version(user_id):
+    """Return the current version of a user's recipe links"""
+    key = INDEX_VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_index_version(user_id):
+    """Mark in-memory recipe indexes of a user stale; return the version"""
+    key = INDEX_VERSION_KEY.format(user_id=user_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        return index_version(user_id)
+
+
+def _count_flight(outcome):
+    key = FLIGHT_COUNTER_KEY.format(outcome=outcome)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def single_flight_counters():
+    """Return how often callers computed, or were spared computing, a value"""
+    keys = {
+        FLIGHT_COUNTER_KEY.format(outcome=outcome): outcome
+        for outcome in FLIGHT_OUTCOMES
+    }
+    counts = cache.get_many(keys)
+    return {outcome: counts.get(key, 0) for key, outcome in keys.items()}
+
+
+def _store_flight(key, value, timeout):
+    cache.set(
+        key,
+        (value, time.time() + timeout),
+        timeout + settings.SINGLE_FLIGHT_STALE_TIMEOUT
+    )
+
+
+def _lead_flight(key, entry, compute, timeout):
+    """Compute key under the cache lock, or wait for the process holding it"""
+    lock_key = FLIGHT_LOCK_KEY.format(key=key)
+    if cache.add(lock_key, 1, settings.SINGLE_FLIGHT_LOCK_TIMEOUT):
+        try:
+            value = compute()
+            _store_flight(key, value, timeout)
+        finally:
+            cache.delete(lock_key)
+        _count_flight('computed')
+        return value
+
+    if entry is not None:
+        _count_flight('stale')
+        return entry[0]
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            _count_flight('waited')
+            return entry[0]
+
+    _count_flight('timeout')
+    value = compute()
+    _store_flight(key, value, timeout)
+    return value
+
+
+def single_flight(key, compute, timeout):
+    """Return the cached value of key, computed by one caller at a time
+
+    Values are kept SINGLE_FLIGHT_STALE_TIMEOUT seconds past their
+    timeout. While one caller, in this or another process, recomputes an
+    expired value the others get the stale one; when there is none they
+    wait up to SINGLE_FLIGHT_WAIT seconds before computing it themselves.
+    """
+    entry = cache.get(key)
+    if entry is not None and entry[1] > time.time():
+        return entry[0]
+
+    with _flights_lock:
+        event = _flights.get(key)
+        leader = event is None
+        if leader:
+            event = _flights[key] = threading.Event()
+
+    if leader:
+        try:
+            return _lead_flight(key, entry, compute, timeout)
+        finally:
+            with _flights_lock:
+                del _flights[key]
+            event.set()
+
+    if entry is not None:
+        _count_flight('stale')
+        return entry[0]
+    event.wait(settings.SINGLE_FLIGHT_WAIT)
+    entry = cache.get(key)
+    if entry is not None:
+        _count_flight('waited')
+        return entry[0]
+    _count_flight('timeout')
+    return compute()
+
+
+def get_library_stats(user, compute):
+    """Return cached library stats for user, computing them on a miss"""
+    key = STATS_KEY.format(
+        user_id=user.id,
+        version=library_version(user.id)
+    )
+    return single_flight(
+        key,
+        lambda: compute(user),
+        settings.RECIPE_STATS_CACHE_TIMEOUT
+    )
+
+
+def get_suggestions(user, kind, query, limit, compute):
+    """Return cached name suggestions for user, computing them on a miss"""
+    key = SUGGEST_KEY.format(
+        user_id=user.id,
+        version=library_version(user.id),
+        kind=kind,
+        limit=limit,
+        digest=hashlib.md5(query.encode()).hexdigest()
+    )
+    return single_flight(key, compute, settings.AUTOCOMPLETE_CACHE_TIMEOUT)
+
+
+# Every representation of a recipe that may be cached
+RECIPE_VARIANTS = (
+    'detail',
+    'list',
+    'list:tags',
+    'list:ingredients',
+    'list:ingredients,tags',
+)
+
+
+def recipe_variant(name, expand=()):
+    """Return the cache variant of a representation"""
+    if not expand:
+        return name
+    return f'{name}:{",".join(sorted(expand))}'
+
+
+def recipe_key(recipe_id, version, variant):
+    return RECIPE_KEY.format(
+        recipe_id=recipe_id, version=version, variant=variant
+    )
+
+
+def get_recipe_fragments(recipes, variant):
+    """Return {recipe id: cached representation} in one multi-get
+
+    Recipes are given as (id, version) pairs, so a fragment rendered from
+    a row read before an update committed is never found again.
+    """
+    keys = {
+        recipe_key(recipe_id, version, variant): recipe_id
+        for recipe_id, version in recipes
+    }
+    return {
+        keys[key]: fragment
+        for key, fragment in cache.get_many(keys).items()
+    }
+
+
+def set_recipe_fragments(fragments, variant):
+    """Cache {(recipe id, version): representation} for one variant"""
+    cache.set_many({
+        recipe_key(recipe_id, version, variant): fragment
+        for (recipe_id, version), fragment in fragments.items()
+    }, settings.RECIPE_FRAGMENT_CACHE_TIMEOUT)
+
+
+def invalidate_recipes(recipes):
+    """Drop cached representations of (id, version) pairs, again after commit
+
+    Only changes that keep the version, like renaming a linked tag, need
+    this. The second delete removes fragments rendered by other requests
+    from rows read before the transaction committed.
+    """
+    keys = [
+        recipe_key(recipe_id, version, variant)
+        for recipe_id, version in set(recipes)
+        for variant in RECIPE_VARIANTS
+    ]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_recipe_count(user_id):
+    """Return the cached number of recipes a user has, if known"""
+    return cache.get(RECIPE_COUNT_KEY.format(user_id=user_id))
+
+
+def set_recipe_count(user_id, count):
+    """Cache the exact number of recipes a user has"""
+    cache.set(
+        RECIPE_COUNT_KEY.format(user_id=user_id),
+        count,
+        settings.RECIPE_COUNT_CACHE_TIMEOUT
+    )
+
+
+def adjust_recipe_count(user_id, delta):
+    """Adjust a cached recipe count once the transaction commits"""
+    def adjust():
+        try:
+            cache.incr(RECIPE_COUNT_KEY.format(user_id=user_id), delta)
+        except ValueError:
+            # Not cached; the next exact count seeds it again
+            pass
+    transaction.on_commit(adjust)
@@ -0,0 +1,188 @@
+import codecs
+import csv
+import json
+from django.db import connection, transaction, DatabaseError
+from core.changes import record_changes
+from core.counters import refresh_usage_counts
+from core.models import Tag, Ingredient, Recipe, normalize_name
+from core.names import upsert_names
+from recipe.cache import adjust_recipe_count, bump_library_version
+from recipe.index import update_index
+from recipe.similarity import schedule_refresh
+from recipe.serializers import RecipeImportRowSerializer
+
+
+FORMATS = ('csv', 'ndjson')
+CSV_LIST_SEPARATOR = '|'
+LINK_FIELDS = (
+    ('tags', Tag, Recipe.tags.through, 'tag_id'),
+    ('ingredients', Ingredient, Recipe.ingredients.through, 'ingredient_id'),
+)
+
+
+def guess_format(filename):
+    """Return the import format implied by a file name"""
+    if filename.lower().endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return 'csv'
+
+
+class UnreadableFile(Exception):
+    """Raised when a file cannot be decoded or parsed past a row"""
+
+    def __init__(self, number, reason):
+        super().__init__(f'Row {number}: {reason}')
+        self.number = number
+        self.reason = reason
+
+
+def read_rows(stream, fmt):
+    """Yield (row number, data, error) for each row of a byte stream"""
+    lines = codecs.iterdecode(stream, 'utf-8')
+    if fmt == 'csv':
+        yield from _read_csv(lines)
+    else:
+        yield from _read_ndjson(lines)
+
+
+def _read_csv(lines):
+    reader = csv.DictReader(lines)
+    number = 0
+    while True:
+        number += 1
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except UnicodeDecodeError:
+            raise UnreadableFile(number, 'File is not valid UTF-8.')
+        except csv.Error as exc:
+            raise UnreadableFile(number, f'Malformed CSV: {exc}')
+        for field, *_ in LINK_FIELDS:
+            names = row.get(field) or ''
+            row[field] = [
+                name for name in names.split(CSV_LIST_SEPARATOR)
+                if name.strip()
+            ]
+        yield number, row, None
+
+
+def _read_ndjson(lines):
+    number = 0
+    while True:
+        number += 1
+        try:
+            line = next(lines)
+        except StopIteration:
+            return
+        except UnicodeDecodeError:
+            raise UnreadableFile(number, 'File is not valid UTF-8.')
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield number, None, {'non_field_errors': [str(exc)]}
+            continue
+        if not isinstance(row, dict):
+            yield number, None, {'non_field_errors': ['Expected an object']}
+            continue
+        yield number, row, None
+
+
+class RecipeImporter:
+    """Import recipe rows for a user in chunked transactions"""
+
+    def __init__(self, user, chunk_size=500, max_errors=100, on_error=None):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.on_error = on_error
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def run(self, rows):
+        """Import (row number, data, error) rows and return a report"""
+        chunk = []
+        try:
+            for number, data, error in rows:
+                if error is None:
+                    serializer = RecipeImportRowSerializer(data=data)
+                    if serializer.is_valid():
+                        chunk.append((number, serializer.validated_data))
+                    else:
+                        error = serializer.errors
+                if error is not None:
+                    self._add_error(number, error)
+                if len(chunk) >= self.chunk_size:
+                    self._import_chunk(chunk)
+                    chunk = []
+            if chunk:
+                self._import_chunk(chunk)
+        finally:
+            # Chunks committed before an unreadable row stay imported
+            if self.created:
+                bump_library_version(self.user.id)
+                update_index(self.user.id)
+                schedule_refresh(self.user.id)
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+    def _add_error(self, number, error):
+        self.failed += 1
+        if self.on_error is not None:
+            self.on_error(number, error)
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': number, 'errors': error})
+
+    def _import_chunk(self, chunk):
+        try:
+            with transaction.atomic():
+                self._insert_chunk([data for _, data in chunk])
+        except DatabaseError as exc:
+            for number, _ in chunk:
+                self._add_error(number, {'non_field_errors': [str(exc)]})
+        else:
+            self.created += len(chunk)
+
+    def _insert_chunk(self, rows):
+        recipes = [
+            Recipe(
+                user=self.user,
+                title=data['title'],
+                time_minutes=data['time_minutes'],
+                price=data['price'],
+                link=data['link'],
+            )
+            for data in rows
+        ]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+            adjust_recipe_count(self.user.id, len(recipes))
+        else:
+            for recipe in recipes:
+                recipe.save()
+        record_changes(self.user.id, Recipe, [r.pk for r in recipes])
+
+        for field, model, through, column in LINK_FIELDS:
+            names = [data[field] for data in rows]
+            objects, _ = upsert_names(
+                model,
+                self.user,
+                {name for row_names in names for name in row_names}
+            )
+            links = {
+                (recipe.pk, objects[normalize_name(name)].pk)
+                for recipe, row_names in zip(recipes, names)
+                for name in row_names
+                if normalize_name(name)
+            }
+            through.objects.bulk_create([
+                through(recipe_id=recipe_id, **{column: object_id})
+                for recipe_id, object_id in links
+            ], ignore_conflicts=True)
+            refresh_usage_counts(model, [obj.pk for obj in objects.values()])
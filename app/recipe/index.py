@@ -0,0 +1,247 @@
+import heapq
+import threading
+import time
+from collections import Counter, OrderedDict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from core.models import Recipe
+from recipe.cache import bump_index_version, index_version
+
+
+INDEX_FIELDS = {
+    'tags': (Recipe.tags.through, 'tag_id'),
+    'ingredients': (Recipe.ingredients.through, 'ingredient_id'),
+}
+
+# The shared per-user indexes only serve pantry ranking
+SHARED_FIELDS = ('ingredients',)
+
+# Caches whose version keys other processes cannot see or bump
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+class RecipeIndex:
+    """Tag and ingredient sets of one user's recipes, held in memory
+
+    links maps each field to {recipe id: set of object ids} and postings
+    is its inverse, {object id: set of recipe ids}, so lookups cost in
+    proportion to the recipes sharing an object rather than library size.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.built = time.monotonic()
+        self.links = {field: {} for field in INDEX_FIELDS}
+        self.postings = {field: {} for field in INDEX_FIELDS}
+        # Objects left out of a partial index for being too common
+        self.skipped = {field: set() for field in INDEX_FIELDS}
+
+    @classmethod
+    def build(cls, user_id, version):
+        """Load the ingredient links of all of a user's recipes"""
+        index = cls(version)
+        for field in SHARED_FIELDS:
+            through, column = INDEX_FIELDS[field]
+            rows = through.objects.filter(
+                recipe__user_id=user_id
+            ).values_list('recipe_id', column)
+            for recipe_id, object_id in rows.iterator():
+                index._link(field, recipe_id, object_id)
+        return index
+
+    @classmethod
+    def build_around(cls, user_id, recipe_ids, max_posting):
+        """Load what finding neighbours of some recipes needs
+
+        That is the recipes, every recipe sharing an object linked to at
+        most max_posting recipes with them, and all links of those, so
+        memory follows the neighbourhood rather than the library.
+        """
+        index = cls(version=None)
+        recipes = set(recipe_ids)
+        for field, (through, column) in INDEX_FIELDS.items():
+            object_ids = set()
+            for chunk in chunked(recipes):
+                object_ids.update(through.objects.filter(
+                    recipe_id__in=chunk,
+                    recipe__user_id=user_id
+                ).values_list(column, flat=True))
+            for chunk in chunked(object_ids):
+                counts = through.objects.filter(
+                    **{f'{column}__in': chunk}
+                ).values(column).annotate(recipes=Count('id'))
+                index.skipped[field].update(
+                    row[column] for row in counts
+                    if row['recipes'] > max_posting
+                )
+            for chunk in chunked(object_ids - index.skipped[field]):
+                recipes.update(through.objects.filter(
+                    **{f'{column}__in': chunk}
+                ).values_list('recipe_id', flat=True))
+
+        for field, (through, column) in INDEX_FIELDS.items():
+            for chunk in chunked(recipes):
+                rows = through.objects.filter(
+                    recipe_id__in=chunk
+                ).values_list('recipe_id', column)
+                for recipe_id, object_id in rows:
+                    index._link(field, recipe_id, object_id)
+        return index
+
+    def _link(self, field, recipe_id, object_id):
+        self.links[field].setdefault(recipe_id, set()).add(object_id)
+        self.postings[field].setdefault(object_id, set()).add(recipe_id)
+
+    def add(self, field, recipe_id, object_ids):
+        """Record new links of a recipe"""
+        for object_id in object_ids:
+            self._link(field, recipe_id, object_id)
+
+    def remove(self, field, recipe_id, object_ids):
+        """Forget removed links of a recipe"""
+        linked = self.links[field].get(recipe_id, set())
+        for object_id in object_ids:
+            linked.discard(object_id)
+            recipes = self.postings[field].get(object_id)
+            if recipes is not None:
+                recipes.discard(recipe_id)
+                if not recipes:
+                    del self.postings[field][object_id]
+        if not linked:
+            self.links[field].pop(recipe_id, None)
+
+    def discard_recipe(self, recipe_id):
+        """Forget every link of a deleted recipe"""
+        for field in INDEX_FIELDS:
+            self.remove(
+                field, recipe_id, list(self.links[field].get(recipe_id, ()))
+            )
+
+    def size(self, recipe_id):
+        """Return the number of tags and ingredients of a recipe"""
+        return sum(
+            len(links.get(recipe_id, ())) for links in self.links.values()
+        )
+
+    def recipe_ids(self):
+        """Return the ids of recipes with at least one link"""
+        return set().union(*(links.keys() for links in self.links.values()))
+
+    def neighbours(self, recipe_id, max_posting=None):
+        """Return {recipe id: shared tags and ingredients} for a recipe
+
+        Objects linked to more than max_posting recipes are skipped: they
+        say little about likeness and would make every lookup scan most
+        of the library.
+        """
+        shared = Counter()
+        for field, links in self.links.items():
+            postings = self.postings[field]
+            for object_id in links.get(recipe_id, ()):
+                if object_id in self.skipped[field]:
+                    continue
+                recipes = postings.get(object_id, ())
+                if max_posting is None or len(recipes) <= max_posting:
+                    shared.update(recipes)
+        shared.pop(recipe_id, None)
+        return shared
+
+    def similar(self, recipe_id, limit, max_posting=None):
+        """Return (recipe id, Jaccard score) of the most alike recipes"""
+        size = self.size(recipe_id)
+        return heapq.nlargest(limit, (
+            (other, count / (size + self.size(other) - count))
+            for other, count in self.neighbours(
+                recipe_id, max_posting
+            ).items()
+        ), key=lambda row: (row[1], row[0]))
+
+    def rank_pantry(self, ingredient_ids, limit):
+        """Return (recipe id, matched, missing) of best covered recipes
+
+        Recipes missing fewest ingredients come first, then those with
+        the larger share of their ingredients in the pantry.
+        """
+        postings = self.postings['ingredients']
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(postings.get(ingredient_id, ()))
+
+        links = self.links['ingredients']
+        return heapq.nsmallest(limit, (
+            (recipe_id, count, len(links[recipe_id]) - count)
+            for recipe_id, count in matched.items()
+        ), key=lambda row: (
+            row[2], -row[1] / (row[1] + row[2]), -row[0]
+        ))
+
+
+def chunked(ids, size=500):
+    """Yield lists of at most size ids, keeping IN clauses short"""
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def index_ttl():
+    """Return how long an index may be used, or None while it is kept fresh
+
+    With a cache local to the process, changes made by workers and other
+    processes never bump the version this one sees.
+    """
+    if settings.CACHES['default']['BACKEND'] in LOCAL_CACHES:
+        return settings.RECIPE_INDEX_LOCAL_TTL
+    return None
+
+
+def get_index(user_id):
+    """Return the current index of a user's recipes, building it if needed"""
+    version = index_version(user_id)
+    ttl = index_ttl()
+    with _lock:
+        index = _indexes.get(user_id)
+        if index is not None and index.version == version and \
+                (ttl is None or time.monotonic() - index.built < ttl):
+            _indexes.move_to_end(user_id)
+            return index
+
+    index = RecipeIndex.build(user_id, version)
+    with _lock:
+        _indexes[user_id] = index
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > settings.RECIPE_INDEX_MAX_USERS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def update_index(user_id, apply=None):
+    """Apply a change to a user's index once the transaction commits
+
+    Without apply, or when another process changed the links since the
+    index was built, the index is dropped and rebuilt on next use.
+    """
+    def commit():
+        with _lock:
+            index = _indexes.get(user_id)
+            version = bump_index_version(user_id)
+            if index is None:
+                return
+            if apply is not None and version == index.version + 1:
+                apply(index)
+                index.version = version
+            else:
+                del _indexes[user_id]
+    transaction.on_commit(commit)
+
+
+def clear_indexes():
+    """Drop every in-memory index"""
+    with _lock:
+        _indexes.clear()
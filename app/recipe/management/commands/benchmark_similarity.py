@@ -0,0 +1,74 @@
+import random
+import resource
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipe.index import RecipeIndex
+
+
+class Command(BaseCommand):
+    """Django command to time similar recipe lookups on synthetic data"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, nargs='+',
+            default=[10000, 100000, 1000000],
+            help='Library sizes to benchmark'
+        )
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--ingredients', type=int, default=5000)
+        parser.add_argument(
+            '--links', type=int, default=10,
+            help='Tags plus ingredients per recipe'
+        )
+        parser.add_argument(
+            '--samples', type=int, default=200,
+            help='Lookups timed per library size'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def build(self, rng, recipes, options):
+        """Return an index with popularity skewed like real pantries"""
+        index = RecipeIndex(version=None)
+        tags = range(options['tags'])
+        ingredients = range(options['ingredients'])
+        tag_weights = [1 / (rank + 1) for rank in tags]
+        ingredient_weights = [1 / (rank + 1) for rank in ingredients]
+        for recipe_id in range(recipes):
+            count = max(2, options['links'] // 4)
+            index.add('tags', recipe_id, set(rng.choices(
+                tags, tag_weights, k=count
+            )))
+            index.add('ingredients', recipe_id, set(rng.choices(
+                ingredients, ingredient_weights,
+                k=options['links'] - count
+            )))
+        return index
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        for recipes in sorted(options['recipes']):
+            started = time.perf_counter()
+            index = self.build(rng, recipes, options)
+            build_seconds = time.perf_counter() - started
+            # Kilobytes on Linux; sizes run in order so the peak is this one
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+            timings = []
+            for recipe_id in rng.sample(range(recipes), options['samples']):
+                started = time.perf_counter()
+                index.similar(
+                    recipe_id,
+                    settings.SIMILAR_RECIPES_STORED,
+                    settings.SIMILAR_MAX_POSTING
+                )
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            del index
+
+            self.stdout.write(
+                f'{recipes} recipes: built in {build_seconds:.1f}s, '
+                f'peak RSS {peak / 1024:.0f} MiB, lookup '
+                f'p50 {timings[len(timings) // 2]:.2f}ms '
+                f'p99 {timings[int(len(timings) * 0.99)]:.2f}ms'
+            )
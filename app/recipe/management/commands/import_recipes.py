@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from recipe.importer import FORMATS, RecipeImporter, UnreadableFile, \
+    guess_format, read_rows
+
+
+class Command(BaseCommand):
+    """Django command to import recipes from a CSV or NDJSON file"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import')
+        parser.add_argument(
+            '--user', required=True,
+            help='Email of the user who will own the recipes'
+        )
+        parser.add_argument('--format', choices=FORMATS)
+        parser.add_argument(
+            '--chunk-size', type=int,
+            default=settings.RECIPE_IMPORT_CHUNK_SIZE,
+            help='Number of recipes inserted per transaction'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with email {options["user"]}')
+
+        fmt = options['format'] or guess_format(options['path'])
+        importer = RecipeImporter(
+            user,
+            chunk_size=options['chunk_size'],
+            max_errors=0,
+            on_error=self.report_error
+        )
+        with open(options['path'], 'rb') as stream:
+            try:
+                report = importer.run(read_rows(stream, fmt))
+            except UnreadableFile as exc:
+                raise CommandError(
+                    f'{exc} {importer.created} recipes before it were '
+                    f'imported.'
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {report["created"]} recipes, '
+            f'{report["failed"]} rows failed.'
+        ))
+
+    def report_error(self, number, error):
+        self.stderr.write(f'Row {number}: {error}')
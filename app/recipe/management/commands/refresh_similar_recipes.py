@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from recipe.similarity import refresh_similar
+
+
+class Command(BaseCommand):
+    """Django command to bring stored similar recipes up to date"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Email of the only user to refresh'
+        )
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Recompute every recipe instead of changed ones'
+        )
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.filter(is_active=True)
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f'No user with email {options["user"]}')
+
+        refreshed = 0
+        for user_id in users.values_list('id', flat=True).iterator():
+            refreshed += refresh_similar(user_id, full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed similar recipes of {refreshed} recipes.'
+        ))
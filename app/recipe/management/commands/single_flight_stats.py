@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from recipe.cache import single_flight_counters
+
+
+class Command(BaseCommand):
+    """Django command to show how often cache misses were coalesced"""
+
+    def handle(self, *args, **options):
+        for outcome, count in single_flight_counters().items():
+            self.stdout.write(f'{outcome}: {count}')
@@ -0,0 +1,180 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework import exceptions
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from core.counting import query_estimate
+
+
+class ApproximateCountPagination(LimitOffsetPagination):
+    """Limit/offset pagination that estimates the total of large lists
+
+    Lists are only paginated when `limit` is given. Filtered lists and
+    lists estimated below ESTIMATED_COUNT_THRESHOLD are counted exactly.
+    """
+    max_limit = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.count, self.count_exact = self.get_count_estimate(
+            queryset, request, view
+        )
+        self.offset = self.get_offset(request)
+        self.request = request
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+
+        if self.count_exact:
+            if self.count == 0 or self.offset > self.count:
+                return []
+            return list(queryset[self.offset:self.offset + self.limit])
+
+        # An estimate may be too low, so the rows decide whether there is
+        # a next page rather than the total.
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        rows = rows[:self.limit]
+        seen = self.offset + len(rows) + int(self.has_next)
+        self.count = max(self.count, seen)
+        return rows
+
+    def get_next_link(self):
+        if self.count_exact:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(
+            url, self.offset_query_param, self.offset + self.limit
+        )
+
+    def get_count_estimate(self, queryset, request, view):
+        """Return the total and whether it is exact"""
+        filtered = any(
+            request.query_params.get(param) not in (None, '', '0')
+            for param in getattr(view, 'filter_params', ())
+        )
+        if not filtered:
+            estimate = None
+            if hasattr(view, 'estimate_count'):
+                estimate = view.estimate_count()
+            if estimate is None:
+                estimate = query_estimate(queryset)
+            if estimate is not None and \
+                    estimate >= settings.ESTIMATED_COUNT_THRESHOLD:
+                return estimate, False
+
+        count = self.get_count(queryset)
+        if not filtered and hasattr(view, 'exact_count_seen'):
+            view.exact_count_seen(count)
+        return count, True
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('count_exact', self.count_exact),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class KeysetPagination(BasePagination):
+    """Pagination continuing after the last row of the previous page
+
+    The queryset must be ordered by one field and then by id in the same
+    direction. The cursor holds both values of the last row, so every
+    page is a range scan of a (user, field, id) index however deep it is.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    other_ordering_message = 'Cursor was issued for another ordering.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = queryset.query.order_by[0]
+        self.field = self.ordering.lstrip('-')
+        self.descending = self.ordering.startswith('-')
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            value, last_id = self.decode_cursor(cursor, queryset.model)
+            queryset = queryset.filter(self.after(value, last_id))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def after(self, value, last_id):
+        """Return the filter for rows following (value, last_id)"""
+        op, bound = ('lt', 'lte') if self.descending else ('gt', 'gte')
+        if self.field == 'id':
+            return Q(**{f'id__{op}': last_id})
+        # The redundant bound lets the planner use the index range
+        return Q(**{f'{self.field}__{bound}': value}) & (
+            Q(**{f'{self.field}__{op}': value}) |
+            Q(**{self.field: value, f'id__{op}': last_id})
+        )
+
+    def encode_cursor(self, obj):
+        value = getattr(obj, self.field)
+        raw = json.dumps([self.ordering, str(value), obj.id])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, cursor, model):
+        """Return the (value, id) of a cursor issued for this ordering"""
+        try:
+            ordering, value, last_id = json.loads(
+                base64.urlsafe_b64decode(cursor.encode()).decode()
+            )
+        except (binascii.Error, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        # Read the other way, the same position selects the wrong rows
+        if ordering != self.ordering:
+            raise exceptions.ValidationError(
+                {self.cursor_query_param: self.other_ordering_message}
+            )
+        try:
+            return model._meta.get_field(self.field).to_python(value), \
+                int(last_id)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.last)
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from core.models import normalize_name
+
+
+def suggest_names(model, user, query, limit):
+    """Return up to limit of user's names starting with or resembling query
+
+    Prefix matches come first, most used first. Short of limit, names
+    containing query follow, ranked by trigram similarity on Postgres.
+    """
+    key = normalize_name(query)
+    if not key:
+        return []
+    queryset = model.objects.filter(user=user)
+    matches = list(queryset.filter(
+        normalized_name__startswith=key
+    ).order_by('-usage_count', 'normalized_name').values('id', 'name')[:limit])
+
+    if len(matches) < limit and \
+            len(key) >= settings.AUTOCOMPLETE_FUZZY_MIN_LENGTH:
+        # Names are stored normalized, so a case sensitive LIKE matches
+        # and can use the gin_trgm_ops index on Postgres.
+        others = queryset.exclude(normalized_name__startswith=key).filter(
+            normalized_name__contains=key
+        )
+        if connections[queryset.db].vendor == 'postgresql':
+            others = others.annotate(
+                similarity=TrigramSimilarity('normalized_name', key)
+            ).order_by('-similarity', '-usage_count')
+        else:
+            others = others.order_by('-usage_count', 'normalized_name')
+        matches += others.values('id', 'name')[:limit - len(matches)]
+    return matches
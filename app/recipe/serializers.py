@@ -1,7 +1,63 @@
-from rest_framework import serializers
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import CharField, F, Value
+from django.db.models.signals import m2m_changed, post_save, pre_save
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+from rest_framework.relations import MANY_RELATION_KWARGS
 from core.models import Tag, Ingredient, Recipe
 
 
+RECIPE_LINKS = {
+    'tags': (Recipe.tags.through, 'tag_id', Tag),
+    'ingredients': (Recipe.ingredients.through, 'ingredient_id', Ingredient),
+}
+
+
+class VersionConflict(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = _('Recipe was changed by another request.')
+    default_code = 'version_conflict'
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Many related field resolving all primary keys in one query"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        queryset = child.get_queryset()
+        pks = []
+        for item in data:
+            try:
+                pks.append(queryset.model._meta.pk.to_python(item))
+            except (TypeError, ValidationError):
+                child.fail('incorrect_type', data_type=type(item).__name__)
+        objects = queryset.in_bulk(pks)
+        for pk in pks:
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key field whose many=True form validates in one query"""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+
 class TagSerializer(serializers.ModelSerializer):
     """Serializer for tag object"""
 
@@ -20,13 +76,45 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class NameListSerializer(serializers.Serializer):
+    """Serializer for a list of tag or ingredient names"""
+    names = serializers.ListField(
+        child=serializers.CharField(max_length=235),
+        allow_empty=False,
+        max_length=settings.UPSERT_MAX_NAMES
+    )
+
+
+class PantrySerializer(serializers.Serializer):
+    """Serializer for the ingredient ids to rank recipes against"""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=settings.PANTRY_MAX_INGREDIENTS
+    )
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.PANTRY_MAX_RESULTS,
+        default=20
+    )
+
+
+class ShoppingListSerializer(serializers.Serializer):
+    """Serializer for the recipe ids to build a shopping list from"""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=settings.SHOPPING_LIST_MAX_RECIPES
+    )
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializer for Recipe model"""
-    ingredients = serializers.PrimaryKeyRelatedField(
+    ingredients = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=Ingredient.objects.all()
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
@@ -35,9 +123,132 @@ class RecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = (
             'id', 'title', 'ingredients', 'tags', 'time_minutes', 'price',
-            'link',
+            'link', 'version',
+            )
+        read_only_fields = ('id', 'version')
+
+    def get_fields(self):
+        """Inline nested objects for fields requested through `expand`"""
+        fields = super().get_fields()
+        expand = self.context.get('expand', ())
+        if 'tags' in expand:
+            fields['tags'] = TagSerializer(many=True, read_only=True)
+        if 'ingredients' in expand:
+            fields['ingredients'] = IngredientSerializer(
+                many=True,
+                read_only=True
+            )
+        return fields
+
+    def update(self, instance, validated_data):
+        """Update a recipe, writing only the fields and links that changed"""
+        expected = self.context.get('if_match')
+        if expected is None:
+            expected = instance.version
+        elif expected != instance.version:
+            raise VersionConflict()
+
+        links = {
+            field: {obj.pk for obj in validated_data.pop(field)}
+            for field in RECIPE_LINKS if field in validated_data
+        }
+        changed = [
+            attr for attr, value in validated_data.items()
+            if getattr(instance, attr) != value
+        ]
+        link_changes = self._link_changes(instance, links) if links else {}
+        if not changed and not link_changes:
+            return instance
+        for attr in changed:
+            setattr(instance, attr, validated_data[attr])
+
+        with transaction.atomic():
+            self._save_version(instance, expected, changed)
+            self._update_links(instance, link_changes)
+        return instance
+
+    def _save_version(self, instance, expected, changed):
+        """Write changed fields only if the recipe is still at expected"""
+        # QuerySet.update() bypasses the model signals that keep the
+        # change feed and caches current, so send them as save() would.
+        signal = {
+            'sender': Recipe,
+            'instance': instance,
+            'raw': False,
+            'using': instance._state.db,
+            'update_fields': frozenset(changed + ['version']),
+        }
+        pre_save.send(**signal)
+
+        # A conditional update instead of select_for_update, so concurrent
+        # writers never wait on a row lock; the loser gets a 412.
+        updated = Recipe.objects.filter(
+            pk=instance.pk,
+            version=expected
+        ).update(
+            version=F('version') + 1,
+            **{attr: getattr(instance, attr) for attr in changed}
+        )
+        if not updated:
+            raise VersionConflict()
+        instance.version = expected + 1
+        post_save.send(created=False, **signal)
+
+    def _link_changes(self, instance, links):
+        """Return removed and added ids of links, read in one query"""
+        current = {field: set() for field in links}
+        queries = [
+            through.objects.filter(recipe_id=instance.pk).annotate(
+                relation=Value(field, output_field=CharField()),
+                object_id=F(column)
+            ).values_list('relation', 'object_id')
+            for field, (through, column, _) in RECIPE_LINKS.items()
+            if field in links
+        ]
+        rows = queries[0].union(*queries[1:], all=True)
+        for field, object_id in rows:
+            current[field].add(object_id)
+
+        changes = {}
+        for field, wanted in links.items():
+            removed = current[field] - wanted
+            added = wanted - current[field]
+            if removed or added:
+                changes[field] = (removed, added)
+        return changes
+
+    def _update_links(self, instance, changes):
+        """Apply only the added and removed links"""
+        for field, (removed, added) in changes.items():
+            through, column, model = RECIPE_LINKS[field]
+            signal = {
+                'sender': through,
+                'instance': instance,
+                'reverse': False,
+                'model': model,
+                'using': instance._state.db,
+            }
+            if removed:
+                m2m_changed.send(action='pre_remove', pk_set=removed, **signal)
+                through.objects.filter(
+                    recipe_id=instance.pk,
+                    **{f'{column}__in': removed}
+                ).delete()
+                m2m_changed.send(
+                    action='post_remove', pk_set=removed, **signal
+                )
+            if added:
+                m2m_changed.send(action='pre_add', pk_set=added, **signal)
+                through.objects.bulk_create([
+                    through(recipe_id=instance.pk, **{column: object_id})
+                    for object_id in added
+                ])
+                m2m_changed.send(action='post_add', pk_set=added, **signal)
+
+            # Drop links prefetched before the update
+            getattr(instance, '_prefetched_objects_cache', {}).pop(
+                field, None
             )
-        read_only_fields = ('id',)
 
 
 class RecipeDetailSerializer(RecipeSerializer):
@@ -51,5 +262,35 @@ class RecipeImageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'version')
         read_only_field = ('id',)
+
+    def update(self, instance, validated_data):
+        """Save the image as a new version of the recipe"""
+        instance.image = validated_data['image']
+        if not instance.save_next_version(self.context.get('if_match')):
+            raise VersionConflict()
+        return instance
+
+
+class RecipeImportRowSerializer(serializers.Serializer):
+    """Serializer for one row of a recipe import"""
+    title = serializers.CharField(max_length=235)
+    time_minutes = serializers.IntegerField()
+    price = serializers.DecimalField(max_digits=5, decimal_places=2)
+    link = serializers.CharField(
+        max_length=255,
+        required=False,
+        allow_blank=True,
+        default=''
+    )
+    tags = serializers.ListField(
+        child=serializers.CharField(max_length=235),
+        required=False,
+        default=list
+    )
+    ingredients = serializers.ListField(
+        child=serializers.CharField(max_length=235),
+        required=False,
+        default=list
+    )
@@ -0,0 +1,166 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete, pre_delete, \
+    m2m_changed
+from django.dispatch import receiver
+from core.models import Tag, Ingredient, Recipe
+from core.signals import is_user_deleted
+from recipe.cache import adjust_recipe_count, bump_library_version, \
+    invalidate_recipes
+from recipe.index import update_index
+from recipe.similarity import schedule_refresh
+
+
+RECIPE_LINKS = {
+    Tag: (Recipe.tags.through, 'tag_id'),
+    Ingredient: (Recipe.ingredients.through, 'ingredient_id'),
+}
+
+
+def recipe_versions(recipe_ids):
+    """Return (id, version) pairs of the recipes, for their cache keys"""
+    return Recipe.objects.filter(
+        pk__in=list(recipe_ids)
+    ).values_list('pk', 'version')
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_on_write(sender, instance, **kwargs):
+    """Invalidate cached library data when an object changes"""
+    if not is_user_deleted(instance.user_id):
+        bump_library_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_on_link(sender, instance, action, **kwargs):
+    """Invalidate cached library data when recipe links change"""
+    if action.startswith('post_'):
+        bump_library_version(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+def count_created_recipe(sender, instance, created, **kwargs):
+    """Keep the cached recipe count of the user current"""
+    if created:
+        adjust_recipe_count(instance.user_id, 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(sender, instance, **kwargs):
+    """Keep the cached recipe count of the user current"""
+    if not is_user_deleted(instance.user_id):
+        adjust_recipe_count(instance.user_id, -1)
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def index_links(sender, instance, action, reverse, pk_set, **kwargs):
+    """Apply recipe ingredient changes to in-memory recipe indexes"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse or action == 'post_clear':
+        update_index(instance.user_id)
+        return
+
+    field = 'ingredients'
+    recipe_id = instance.pk
+    object_ids = set(pk_set)
+    if action == 'post_add':
+        update_index(
+            instance.user_id,
+            lambda index: index.add(field, recipe_id, object_ids)
+        )
+    else:
+        update_index(
+            instance.user_id,
+            lambda index: index.remove(field, recipe_id, object_ids)
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def index_deleted_recipe(sender, instance, **kwargs):
+    """Drop a deleted recipe from in-memory recipe indexes"""
+    if is_user_deleted(instance.user_id):
+        return
+    recipe_id = instance.pk
+    update_index(
+        instance.user_id,
+        lambda index: index.discard_recipe(recipe_id)
+    )
+
+
+@receiver(post_delete, sender=Ingredient)
+def index_deleted_object(sender, instance, **kwargs):
+    """Rebuild indexes whose links were removed by a cascade"""
+    if not is_user_deleted(instance.user_id):
+        update_index(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def refresh_similar_on_change(sender, instance, action='post_delete',
+                              **kwargs):
+    """Schedule a refresh of stored similar recipes"""
+    if action.startswith('post_') and not is_user_deleted(instance.user_id):
+        schedule_refresh(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    """Drop cached representations of a changed recipe"""
+    if not is_user_deleted(instance.user_id):
+        invalidate_recipes([(instance.pk, instance.version)])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_linked_recipes(sender, instance, action, reverse, pk_set,
+                              **kwargs):
+    """Drop cached representations of recipes whose links change"""
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_recipes([(instance.pk, instance.version)])
+    elif action == 'pre_clear':
+        _, field = RECIPE_LINKS[type(instance)]
+        invalidate_recipes(sender.objects.filter(
+            **{field: instance.pk}
+        ).values_list('recipe_id', 'recipe__version'))
+    elif action.startswith('post_') and pk_set:
+        invalidate_recipes(recipe_versions(pk_set))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def invalidate_renamed(sender, instance, created, raw=False, **kwargs):
+    """Drop cached representations of recipes showing a renamed object"""
+    if created or raw:
+        return
+    through, field = RECIPE_LINKS[sender]
+    invalidate_recipes(through.objects.filter(
+        **{field: instance.pk}
+    ).values_list('recipe_id', 'recipe__version'))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def invalidate_unlinked(sender, instance, **kwargs):
+    """Drop cached representations of recipes losing a deleted object"""
+    # Collected by core.signals.collect_recipes_on_delete, which runs first
+    recipe_ids = instance.__dict__.get('_linked_recipe_ids')
+    if recipe_ids:
+        invalidate_recipes(recipe_versions(recipe_ids))
+
+
+@receiver(post_delete, sender=get_user_model())
+def invalidate_deleted_user(sender, instance, **kwargs):
+    """Invalidate a removed user's cached data once, not per deleted row"""
+    bump_library_version(instance.pk)
+    update_index(instance.pk)
@@ -0,0 +1,106 @@
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from core.models import Change, Recipe, SimilarRecipe, SimilarityBuild
+from core.queue import enqueue
+from recipe.index import INDEX_FIELDS, RecipeIndex, chunked
+
+
+SCHEDULED_KEY = 'recipe:similar:scheduled:{user_id}'
+
+
+def schedule_refresh(user_id):
+    """Queue one similar recipe refresh per user per delay window"""
+    def schedule():
+        delay = settings.SIMILAR_REFRESH_DELAY
+        if cache.add(SCHEDULED_KEY.format(user_id=user_id), 1, delay):
+            enqueue(
+                'recipe.refresh_similar',
+                run_at=timezone.now() + timedelta(seconds=delay),
+                user_id=user_id
+            )
+    transaction.on_commit(schedule)
+
+
+def affected_recipes(user_id, since, until):
+    """Return recipes whose neighbours may have changed between feed ids"""
+    changed = set(Change.objects.filter(
+        user_id=user_id,
+        object_type='recipe',
+        id__gt=since,
+        id__lte=until
+    ).values_list('object_id', flat=True))
+    affected = set(changed)
+    for chunk in chunked(changed, settings.SIMILAR_BUILD_CHUNK_SIZE):
+        index = RecipeIndex.build_around(
+            user_id, chunk, settings.SIMILAR_MAX_POSTING
+        )
+        for recipe_id in chunk:
+            affected.update(index.neighbours(
+                recipe_id, settings.SIMILAR_MAX_POSTING
+            ))
+    affected.update(SimilarRecipe.objects.filter(
+        similar_id__in=changed
+    ).values_list('recipe_id', flat=True))
+    return affected
+
+
+def refresh_similar(user_id, full=False):
+    """Recompute stored neighbours of recipes changed since the last run
+
+    Returns the number of recipes whose neighbours were written.
+    """
+    if not get_user_model().objects.filter(
+        pk=user_id, is_active=True
+    ).exists():
+        return 0
+    build, _ = SimilarityBuild.objects.get_or_create(user_id=user_id)
+    until = Change.objects.filter(user_id=user_id).order_by(
+        '-id'
+    ).values_list('id', flat=True).first() or 0
+    if full or not build.last_change:
+        # Recipes without links have no neighbours to store
+        affected = set(SimilarRecipe.objects.filter(
+            recipe__user_id=user_id
+        ).values_list('recipe_id', flat=True))
+        for through, _ in INDEX_FIELDS.values():
+            affected.update(through.objects.filter(
+                recipe__user_id=user_id
+            ).values_list('recipe_id', flat=True).distinct())
+    else:
+        affected = affected_recipes(user_id, build.last_change, until)
+
+    # Each chunk loads only its own neighbourhood from the database,
+    # apart from the shared indexes, which may lag in a worker.
+    for chunk in chunked(sorted(affected), settings.SIMILAR_BUILD_CHUNK_SIZE):
+        index = RecipeIndex.build_around(
+            user_id, chunk, settings.SIMILAR_MAX_POSTING
+        )
+        rows = [
+            SimilarRecipe(recipe_id=recipe_id, similar_id=other, score=score)
+            for recipe_id in chunk
+            for other, score in index.similar(
+                recipe_id,
+                settings.SIMILAR_RECIPES_STORED,
+                settings.SIMILAR_MAX_POSTING
+            )
+        ]
+        with transaction.atomic():
+            # Recipes deleted since the index was built are left out
+            existing = set(Recipe.objects.filter(
+                user_id=user_id,
+                id__in={row.recipe_id for row in rows} |
+                {row.similar_id for row in rows}
+            ).values_list('id', flat=True))
+            SimilarRecipe.objects.filter(recipe_id__in=chunk).delete()
+            SimilarRecipe.objects.bulk_create([
+                row for row in rows
+                if row.recipe_id in existing and row.similar_id in existing
+            ])
+
+    build.last_change = until
+    build.save(update_fields=['last_change', 'updated'])
+    return len(affected)
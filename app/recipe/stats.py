@@ -0,0 +1,38 @@
+from django.db.models import Avg, Count
+from core.models import Tag, Ingredient, Recipe
+
+
+TOP_INGREDIENTS = 10
+
+
+def library_stats(user):
+    """Compute dashboard aggregates for a user's library in the database"""
+    totals = Recipe.objects.filter(user=user).aggregate(
+        recipe_count=Count('id'),
+        average_price=Avg('price'),
+        average_time_minutes=Avg('time_minutes'),
+    )
+    tags = Tag.objects.filter(user=user).values('id', 'name').annotate(
+        recipe_count=Count('recipe')
+    ).order_by('-recipe_count', 'name')
+    ingredients = Ingredient.objects.filter(user=user).values(
+        'id', 'name'
+    ).annotate(
+        recipe_count=Count('recipe')
+    ).filter(recipe_count__gt=0).order_by('-recipe_count', 'name')
+
+    average_price = totals['average_price']
+    average_time = totals['average_time_minutes']
+    return {
+        'recipe_count': totals['recipe_count'],
+        'average_price': (
+            round(float(average_price), 2)
+            if average_price is not None else None
+        ),
+        'average_time_minutes': (
+            round(float(average_time), 1)
+            if average_time is not None else None
+        ),
+        'tags': list(tags),
+        'top_ingredients': list(ingredients[:TOP_INGREDIENTS]),
+    }
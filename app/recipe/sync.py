@@ -0,0 +1,119 @@
+import base64
+import binascii
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from core.models import Change, Tag, Ingredient, Recipe
+from recipe import serializers
+
+
+FEED_TYPES = {
+    'recipe': (
+        Recipe.objects.prefetch_related('tags', 'ingredients'),
+        serializers.RecipeSerializer,
+    ),
+    'tag': (Tag.objects.all(), serializers.TagSerializer),
+    'ingredient': (Ingredient.objects.all(), serializers.IngredientSerializer),
+}
+
+
+class CursorExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = _('Cursor has expired, sync again without a cursor.')
+    default_code = 'cursor_expired'
+
+
+def encode_cursor(seq):
+    """Return an opaque cursor for a change feed position"""
+    raw = f'{seq}:{int(time.time())}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the feed position of a cursor, rejecting expired ones"""
+    try:
+        seq, issued = base64.urlsafe_b64decode(
+            cursor.encode()
+        ).decode().split(':')
+        seq, issued = int(seq), int(issued)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValidationError({'cursor': _('Invalid cursor.')})
+
+    # Tombstones older than the retention period may have been compacted
+    retention = settings.SYNC_TOMBSTONE_RETENTION_DAYS * 24 * 60 * 60
+    if issued < time.time() - retention:
+        raise CursorExpired()
+    return seq
+
+
+def settled_seq(user, seq):
+    """Return the last feed position at or before seq no commit can fill
+
+    Change ids are taken on insert, not on commit, so a change written in
+    the last SYNC_COMMIT_LOOKBACK seconds may still appear below ids that
+    were already read.
+    """
+    since = timezone.now() - timedelta(seconds=settings.SYNC_COMMIT_LOOKBACK)
+    return Change.objects.filter(
+        user=user,
+        id__lte=seq,
+        created__lt=since
+    ).order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def changes_since(user, seq, limit):
+    """Return the user's changes after seq, latest entry per object"""
+    rows = list(Change.objects.filter(
+        user=user,
+        id__gt=seq
+    ).order_by('id').values_list(
+        'id', 'object_type', 'object_id', 'action'
+    )[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest = {}
+    for row in rows:
+        latest[row[1], row[2]] = row
+
+    upserts = {}
+    for _seq, object_type, object_id, action in latest.values():
+        if action == Change.UPSERT:
+            upserts.setdefault(object_type, []).append(object_id)
+
+    data = {}
+    for object_type, ids in upserts.items():
+        queryset, serializer_class = FEED_TYPES[object_type]
+        for obj in queryset.filter(user=user, pk__in=ids):
+            data[object_type, obj.pk] = serializer_class(obj).data
+
+    changes = []
+    for change_seq, object_type, object_id, action in sorted(
+            latest.values()):
+        change = {
+            'seq': change_seq,
+            'type': object_type,
+            'id': object_id,
+            'action': action,
+        }
+        if action == Change.UPSERT:
+            if (object_type, object_id) not in data:
+                # Deleted since; its tombstone comes later in the feed
+                continue
+            change['data'] = data[object_type, object_id]
+        changes.append(change)
+
+    position = rows[-1][0] if rows else seq
+    if not has_more:
+        # Recent changes are sent again by the next sync, in case one
+        # committed late below them; applying a change twice is harmless.
+        position = settled_seq(user, position)
+    return {
+        'changes': changes,
+        'cursor': encode_cursor(position),
+        'has_more': has_more,
+    }
@@ -0,0 +1,8 @@
+from core.queue import task
+from recipe.similarity import refresh_similar
+
+
+@task('recipe.refresh_similar')
+def refresh_similar_task(user_id):
+    """Bring the stored similar recipes of a user up to date"""
+    refresh_similar(user_id)
@@ -0,0 +1,76 @@
+import threading
+import time
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from recipe.cache import FLIGHT_LOCK_KEY, single_flight, \
+    single_flight_counters
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, value='fresh', delay=0):
+        def compute():
+            self.calls += 1
+            time.sleep(delay)
+            return value
+        return compute
+
+    def test_value_cached(self):
+        """Test a fresh value is computed once"""
+        single_flight('key', self.compute(), 60)
+
+        self.assertEqual(single_flight('key', self.compute(), 60), 'fresh')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(single_flight_counters()['computed'], 1)
+
+    def test_concurrent_misses_coalesced(self):
+        """Test threads missing the same key compute it once"""
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                single_flight('key', self.compute(delay=0.2), 60)
+            ))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['fresh'] * 5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(single_flight_counters()['waited'], 4)
+
+    def test_stale_value_served_while_locked(self):
+        """Test an expired value is served while another caller refreshes"""
+        cache.set('key', ('old', time.time() - 1), 60)
+        cache.add(FLIGHT_LOCK_KEY.format(key='key'), 1, 60)
+
+        self.assertEqual(single_flight('key', self.compute(), 60), 'old')
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(single_flight_counters()['stale'], 1)
+
+    def test_waits_for_other_process(self):
+        """Test a miss waits for the value another process computes"""
+        cache.add(FLIGHT_LOCK_KEY.format(key='key'), 1, 60)
+        timer = threading.Timer(
+            0.1, lambda: cache.set('key', ('theirs', time.time() + 60), 60)
+        )
+        timer.start()
+
+        self.assertEqual(single_flight('key', self.compute(), 60), 'theirs')
+        timer.join()
+        self.assertEqual(self.calls, 0)
+
+    @override_settings(SINGLE_FLIGHT_WAIT=0.1)
+    def test_computes_after_wait_timeout(self):
+        """Test a caller computes the value itself after waiting too long"""
+        cache.add(FLIGHT_LOCK_KEY.format(key='key'), 1, 60)
+
+        self.assertEqual(single_flight('key', self.compute(), 60), 'fresh')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(single_flight_counters()['timeout'], 1)
@@ -0,0 +1,143 @@
+import base64
+import time
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import Change, Recipe, Tag
+
+
+CHANGES_URL = reverse('recipe:changes')
+
+
+def sample_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'sample recipe',
+        'time_minutes': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicChangesApiTest(TestCase):
+    """Test unauthenticated change feed access"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_auth_required(self):
+        """Test auth is required for the change feed"""
+        res = self.client.get(CHANGES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(SYNC_COMMIT_LOOKBACK=0)
+class PrivateChangesApiTest(TestCase):
+    """Test the change feed for authenticated users"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@app.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_initial_feed(self):
+        """Test the feed without a cursor returns the user's objects"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(tag)
+        other = get_user_model().objects.create_user('o@app.com', 'pass')
+        Tag.objects.create(user=other, name='Other')
+
+        res = self.client.get(CHANGES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(res.data['has_more'])
+        changes = [(c['type'], c['id']) for c in res.data['changes']]
+        self.assertEqual(changes, [('tag', tag.id), ('recipe', recipe.id)])
+        self.assertEqual(res.data['changes'][1]['data']['tags'], [tag.id])
+
+    def test_feed_since_cursor(self):
+        """Test only changes after the cursor are returned"""
+        recipe = sample_recipe(user=self.user)
+        Tag.objects.create(user=self.user, name='Old')
+        cursor = self.client.get(CHANGES_URL).data['cursor']
+
+        tag = Tag.objects.create(user=self.user, name='New')
+        recipe.tags.add(tag)
+        res = self.client.get(CHANGES_URL, {'cursor': cursor})
+
+        changes = [(c['type'], c['id']) for c in res.data['changes']]
+        self.assertEqual(changes, [('tag', tag.id), ('recipe', recipe.id)])
+
+    def test_feed_tombstones(self):
+        """Test deleted objects are reported as tombstones"""
+        recipe = sample_recipe(user=self.user)
+        cursor = self.client.get(CHANGES_URL).data['cursor']
+
+        recipe_id = recipe.id
+        recipe.delete()
+        res = self.client.get(CHANGES_URL, {'cursor': cursor})
+
+        self.assertEqual(res.data['changes'], [{
+            'seq': res.data['changes'][0]['seq'],
+            'type': 'recipe',
+            'id': recipe_id,
+            'action': 'delete',
+        }])
+
+    def test_feed_pagination(self):
+        """Test the feed is paginated by sequence"""
+        for name in ('a', 'b', 'c'):
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(CHANGES_URL, {'limit': 2})
+        self.assertTrue(res.data['has_more'])
+        self.assertEqual(len(res.data['changes']), 2)
+
+        res = self.client.get(
+            CHANGES_URL,
+            {'limit': 2, 'cursor': res.data['cursor']}
+        )
+        self.assertFalse(res.data['has_more'])
+        self.assertEqual(res.data['changes'][0]['data']['name'], 'c')
+
+    @override_settings(SYNC_COMMIT_LOOKBACK=60)
+    def test_feed_late_commit(self):
+        """Test a change committed below the cursor is still synced"""
+        Tag.objects.create(user=self.user, name='Late')
+        Tag.objects.create(user=self.user, name='Early')
+        late = Change.objects.filter(user=self.user).order_by('id').first()
+        Change.objects.filter(pk=late.pk).delete()
+        res = self.client.get(CHANGES_URL)
+        names = [c['data']['name'] for c in res.data['changes']]
+        self.assertEqual(names, ['Early'])
+
+        # As if the transaction writing it had only committed now
+        late.save()
+        res = self.client.get(CHANGES_URL, {'cursor': res.data['cursor']})
+
+        names = [c['data']['name'] for c in res.data['changes']]
+        self.assertEqual(names, ['Late', 'Early'])
+
+    def test_expired_cursor(self):
+        """Test cursors older than the tombstone retention are rejected"""
+        issued = int(time.time()) - 365 * 24 * 60 * 60
+        cursor = base64.urlsafe_b64encode(f'1:{issued}'.encode()).decode()
+
+        res = self.client.get(CHANGES_URL, {'cursor': cursor})
+
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+
+    def test_invalid_cursor(self):
+        """Test malformed cursors are rejected"""
+        res = self.client.get(CHANGES_URL, {'cursor': 'nonsense'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
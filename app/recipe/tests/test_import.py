@@ -0,0 +1,136 @@
+import csv
+import tempfile
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import Change, Recipe, Tag, Ingredient
+
+
+IMPORT_URL = reverse('recipe:recipe-import-recipes')
+
+CSV_DATA = (
+    'title,time_minutes,price,link,tags,ingredients\n'
+    'Soup,10,4.50,,Vegan|Quick,Salt|Water\n'
+    'Bad row,ten,1.00,,,\n'
+    'Salad,5,3.00,,Vegan,Salt\n'
+)
+
+NDJSON_DATA = (
+    '{"title": "Soup", "time_minutes": 10, "price": "4.50",'
+    ' "tags": ["Vegan"], "ingredients": ["Salt"]}\n'
+    'not json\n'
+    '\n'
+    '{"title": "Stew", "time_minutes": 60, "price": "9.00"}\n'
+)
+
+
+class RecipeImportApiTest(TestCase):
+    """Test importing recipes in bulk"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@app.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def upload(self, name, content, **extra):
+        data = {'file': SimpleUploadedFile(name, content.encode())}
+        data.update(extra)
+        return self.client.post(IMPORT_URL, data, format='multipart')
+
+    def test_import_csv(self):
+        """Test CSV rows are imported with their tags and ingredients"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.upload('recipes.csv', CSV_DATA)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['created'], 2)
+        self.assertEqual(res.data['failed'], 1)
+        self.assertEqual(res.data['errors'][0]['row'], 2)
+        self.assertIn('time_minutes', res.data['errors'][0]['errors'])
+
+        soup = Recipe.objects.get(user=self.user, title='Soup')
+        self.assertEqual(
+            sorted(soup.tags.values_list('name', flat=True)),
+            ['Quick', 'Vegan']
+        )
+        self.assertEqual(Tag.objects.filter(name='Vegan').count(), 1)
+        vegan = Tag.objects.get(name='Vegan')
+        salt = Ingredient.objects.get(name='Salt')
+        self.assertEqual(vegan.usage_count, 2)
+        self.assertEqual(salt.usage_count, 2)
+        self.assertTrue(Change.objects.filter(
+            object_type='recipe', object_id=soup.id
+        ).exists())
+
+    def test_import_ndjson(self):
+        """Test NDJSON rows are imported and bad lines reported"""
+        res = self.upload('recipes.ndjson', NDJSON_DATA)
+
+        self.assertEqual(res.data['created'], 2)
+        self.assertEqual(res.data['failed'], 1)
+        self.assertEqual(res.data['errors'][0]['row'], 2)
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('title', flat=True)),
+            ['Soup', 'Stew']
+        )
+
+    def test_import_chunks(self):
+        """Test imports are inserted in several chunks"""
+        rows = ''.join(
+            f'Recipe {i},10,1.00,,Tag {i % 3},\n' for i in range(7)
+        )
+        with self.settings(RECIPE_IMPORT_CHUNK_SIZE=2):
+            res = self.upload(
+                'recipes.csv',
+                'title,time_minutes,price,link,tags,ingredients\n' + rows
+            )
+
+        self.assertEqual(res.data['created'], 7)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 3)
+
+    def test_import_invalid_encoding(self):
+        """Test a file that is not UTF-8 is refused naming the row"""
+        data = {'file': SimpleUploadedFile(
+            'recipes.csv',
+            CSV_DATA.encode() + 'Crêpe,5,2.00,,,\n'.encode('latin-1')
+        )}
+
+        res = self.client.post(IMPORT_URL, data, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(res.data['file'][0].startswith('Row 4:'))
+
+    def test_import_malformed_csv(self):
+        """Test a CSV the parser rejects is refused naming the row"""
+        oversized = 'x' * (csv.field_size_limit() + 1)
+        res = self.upload('recipes.csv', CSV_DATA + f'{oversized},5,1,,,\n')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(res.data['file'][0].startswith('Row 4:'))
+
+    def test_import_requires_file(self):
+        """Test an upload is required"""
+        res = self.client.post(IMPORT_URL, {}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_command(self):
+        """Test importing a file from the command line"""
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as fil:
+            fil.write(CSV_DATA)
+            fil.flush()
+            call_command(
+                'import_recipes', fil.name, user=self.user.email,
+                stdout=StringIO(), stderr=StringIO()
+            )
+
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
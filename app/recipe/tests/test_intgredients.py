@@ -1,13 +1,18 @@
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.urls import reverse
 from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
+from core.budget import QueryBudgetMixin
 from core.models import Ingredient, Recipe
 from recipe.serializers import IngredientSerializer
+from recipe.views import IngredientViewSet
 
 
 INGREDIENT_URL = reverse('recipe:ingredient-list')
+UPSERT_URL = reverse('recipe:ingredient-upsert')
+AUTOCOMPLETE_URL = reverse('recipe:ingredient-autocomplete')
 
 
 class PublicIngredientsApiTest(TestCase):
@@ -130,3 +135,98 @@ class PrivateIngredientsApiTest(TestCase):
 
         self.assertEqual(len(res.data), 1)
         self.assertIn(serializer1.data, res.data)
+
+    def test_create_ingredient_idempotent(self):
+        """Test creating an existing name returns the existing ingredient"""
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+
+        res = self.client.post(INGREDIENT_URL, {'name': ' salt '})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['id'], ingredient.id)
+        self.assertEqual(Ingredient.objects.count(), 1)
+
+    def test_upsert_ingredients(self):
+        """Test upserting names returns ids, creating missing ones"""
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        user2 = get_user_model().objects.create_user('o@app.com', 'pass')
+        Ingredient.objects.create(user=user2, name='Pepper')
+
+        res = self.client.post(
+            UPSERT_URL,
+            {'names': ['SALT', 'Black  Pepper', 'salt', 'Pepper']},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['name'] for item in res.data],
+            ['Salt', 'Black Pepper', 'Pepper']
+        )
+        self.assertEqual(res.data[0]['id'], salt.id)
+        self.assertEqual(
+            Ingredient.objects.filter(user=self.user).count(), 3
+        )
+
+    def test_upsert_requires_names(self):
+        """Test upserting an empty list is rejected"""
+        res = self.client.post(UPSERT_URL, {'names': []}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete_ingredients(self):
+        """Test ingredient names are suggested by prefix"""
+        cache.clear()
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        Ingredient.objects.create(user=self.user, name='Kale')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'sa'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [{'id': salt.id, 'name': 'Salt'}])
+
+
+class IngredientQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """Test ingredient endpoints run a fixed number of queries"""
+
+    budgets = IngredientViewSet.query_budgets
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@app.com',
+            'password'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.names = []
+
+    def add_ingredients(self, count):
+        for _ in range(count):
+            recipe = Recipe.objects.create(
+                user=self.user, title='Soup', time_minutes=5, price=3.00
+            )
+            recipe.ingredients.add(Ingredient.objects.create(
+                user=self.user, name=f'Ingredient {recipe.id}'
+            ))
+
+    def add_names(self, count):
+        start = len(self.names)
+        self.names += [f'Name {i}' for i in range(start, start + count)]
+
+    def test_list_budget(self):
+        """Test listing ingredients does not query per ingredient"""
+        self.assertQueryBudget(
+            self.budgets['list'],
+            lambda: self.client.get(INGREDIENT_URL, {'assigned_only': 1}),
+            self.add_ingredients
+        )
+
+    def test_upsert_budget(self):
+        """Test upserting names does not query per name"""
+        self.assertQueryBudget(
+            self.budgets['upsert'],
+            lambda: self.client.post(
+                UPSERT_URL, {'names': self.names}, format='json'
+            ),
+            self.add_names
+        )
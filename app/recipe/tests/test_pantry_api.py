@@ -0,0 +1,159 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import Recipe, Ingredient
+from recipe import index
+
+
+PANTRY_URL = reverse('recipe:recipe-pantry')
+
+
+def sample_recipe(user, ingredients, **params):
+    """Create and return a sample recipe using ingredients"""
+    defaults = {
+        'title': 'sample recipe',
+        'time_minutes': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    recipe = Recipe.objects.create(user=user, **defaults)
+    recipe.ingredients.set(ingredients)
+    return recipe
+
+
+class PantryApiTest(TestCase):
+    """Test ranking recipes by pantry coverage"""
+
+    def setUp(self):
+        cache.clear()
+        index.clear_indexes()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@app.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+        self.pepper = Ingredient.objects.create(user=self.user, name='Pepper')
+        self.kale = Ingredient.objects.create(user=self.user, name='Kale')
+
+    def test_rank_by_missing_then_coverage(self):
+        """Test recipes missing fewest ingredients come first"""
+        partial = sample_recipe(
+            self.user, [self.salt, self.pepper, self.kale], title='Stew'
+        )
+        full = sample_recipe(self.user, [self.salt, self.pepper])
+        sample_recipe(self.user, [self.kale], title='Salad')
+
+        res = self.client.post(PANTRY_URL, {
+            'ingredients': [self.salt.id, self.pepper.id]
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row['recipe']['id'] for row in res.data],
+            [full.id, partial.id]
+        )
+        self.assertEqual(res.data[1]['matched'], 2)
+        self.assertEqual(res.data[1]['missing'], 1)
+        self.assertEqual(res.data[1]['coverage'], 0.667)
+
+    def test_limited_to_user(self):
+        """Test other users' recipes are never ranked"""
+        other = get_user_model().objects.create_user('o@app.com', 'pass')
+        garlic = Ingredient.objects.create(user=other, name='Garlic')
+        sample_recipe(other, [garlic])
+
+        res = self.client.post(
+            PANTRY_URL, {'ingredients': [garlic.id]}, format='json'
+        )
+
+        self.assertEqual(res.data, [])
+
+    def test_limit(self):
+        """Test the number of ranked recipes is limited"""
+        for i in range(3):
+            sample_recipe(self.user, [self.salt], title=f'Recipe {i}')
+
+        res = self.client.post(PANTRY_URL, {
+            'ingredients': [self.salt.id], 'limit': 2
+        }, format='json')
+
+        self.assertEqual(len(res.data), 2)
+
+    def test_ingredients_required(self):
+        """Test an empty pantry is rejected"""
+        res = self.client.post(PANTRY_URL, {'ingredients': []}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_INDEX_MAX_USERS=1)
+    def test_least_recently_used_index_evicted(self):
+        """Test indexes beyond the limit are evicted, oldest first"""
+        other = get_user_model().objects.create_user('o@app.com', 'pass')
+
+        index.get_index(self.user.id)
+        index.get_index(other.id)
+
+        self.assertEqual(list(index._indexes), [other.id])
+
+
+class PantryIndexUpdateTest(TransactionTestCase):
+    """Test in-memory indexes follow committed link changes"""
+
+    def setUp(self):
+        cache.clear()
+        index.clear_indexes()
+        self.user = get_user_model().objects.create_user(
+            'test@app.com',
+            'testpass'
+        )
+        self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+        self.kale = Ingredient.objects.create(user=self.user, name='Kale')
+
+    def test_links_applied_without_rebuild(self):
+        """Test link changes update the index in place"""
+        recipe = sample_recipe(self.user, [self.salt])
+        built = index.get_index(self.user.id)
+
+        recipe.ingredients.add(self.kale)
+        recipe.ingredients.remove(self.salt)
+
+        current = index.get_index(self.user.id)
+        self.assertIs(current, built)
+        self.assertEqual(current.rank_pantry([self.salt.id], 10), [])
+        self.assertEqual(
+            current.rank_pantry([self.kale.id], 10), [(recipe.id, 1, 0)]
+        )
+
+    @override_settings(RECIPE_INDEX_LOCAL_TTL=0)
+    def test_local_cache_index_expires(self):
+        """Test indexes are rebuilt once stale when the cache is local"""
+        sample_recipe(self.user, [self.salt])
+        built = index.get_index(self.user.id)
+
+        self.assertIsNot(index.get_index(self.user.id), built)
+
+    def test_deleted_recipe_dropped(self):
+        """Test deleted recipes leave the index"""
+        recipe = sample_recipe(self.user, [self.salt])
+        index.get_index(self.user.id)
+
+        recipe.delete()
+
+        self.assertEqual(
+            index.get_index(self.user.id).rank_pantry([self.salt.id], 10), []
+        )
+
+    def test_deleted_ingredient_rebuilds(self):
+        """Test links removed by a cascade trigger a rebuild"""
+        sample_recipe(self.user, [self.salt])
+        built = index.get_index(self.user.id)
+
+        self.salt.delete()
+
+        self.assertIsNot(index.get_index(self.user.id), built)
@@ -1,11 +1,21 @@
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 from PIL import Image
+from core.budget import QueryBudgetMixin
 from core.models import Recipe, Tag, Ingredient
-from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from recipe import index
+from recipe.cache import set_recipe_count
+from recipe.serializers import RecipeSerializer, RecipeDetailSerializer, \
+    VersionConflict
+from recipe.views import RecipeViewSet
+from urllib.parse import parse_qs, urlparse
 import tempfile
 import os
 
@@ -58,6 +68,7 @@ class PrivateRecipeApiTest(TestCase):
     """Test authenticated recipe access"""
 
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = get_user_model().objects.create_user(
             'test@app.com',
@@ -196,6 +207,149 @@ class PrivateRecipeApiTest(TestCase):
         self.assertEqual(recipe.time_minutes, payload['time_minutes'])
         self.assertEqual(len(tags), 0)
 
+    def test_update_applies_link_diff(self):
+        """Test updating links keeps unchanged rows and adjusts counts"""
+        recipe = sample_recipe(user=self.user)
+        kept = sample_tag(user=self.user, name='Kept')
+        dropped = sample_tag(user=self.user, name='Dropped')
+        added = sample_tag(user=self.user, name='Added')
+        recipe.tags.add(kept, dropped)
+        kept_link = Recipe.tags.through.objects.get(tag=kept)
+
+        self.client.patch(
+            detail_url(recipe.id),
+            {'tags': [kept.id, added.id]}
+        )
+
+        self.assertEqual(
+            set(recipe.tags.values_list('name', flat=True)),
+            {'Kept', 'Added'}
+        )
+        self.assertTrue(
+            Recipe.tags.through.objects.filter(pk=kept_link.pk).exists()
+        )
+        dropped.refresh_from_db()
+        added.refresh_from_db()
+        self.assertEqual(dropped.usage_count, 0)
+        self.assertEqual(added.usage_count, 1)
+
+    def test_update_unchanged_skips_writes(self):
+        """Test a PATCH repeating current values writes nothing"""
+        recipe = sample_recipe(user=self.user, title='Soup')
+        tag = sample_tag(user=self.user)
+        recipe.tags.add(tag)
+        ingredient = sample_ingredient(user=self.user)
+        recipe.ingredients.add(ingredient)
+        payload = {
+            'title': 'Soup',
+            'tags': [tag.id],
+            'ingredients': [ingredient.id],
+        }
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(detail_url(recipe.id), payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        statements = [query['sql'].split()[0] for query in queries]
+        self.assertEqual(statements.count('UPDATE'), 0)
+        self.assertEqual(statements.count('INSERT'), 0)
+        self.assertEqual(statements.count('DELETE'), 0)
+
+    def test_list_expand_tags_and_ingredients(self):
+        """Test expanding tags and ingredients on the recipe list"""
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user))
+        recipe.ingredients.add(sample_ingredient(user=self.user))
+
+        res = self.client.get(RECIPE_URL, {'expand': 'tags,ingredients'})
+
+        serializer = RecipeDetailSerializer(recipe)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [serializer.data])
+
+    def test_list_expand_invalid_field(self):
+        """Test expanding an unknown field is rejected"""
+        res = self.client.get(RECIPE_URL, {'expand': 'user'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_sideload_deduplicates(self):
+        """Test side-loaded tags are sent once per response"""
+        tag = sample_tag(user=self.user, name='Vegan')
+        recipe1 = sample_recipe(user=self.user)
+        recipe2 = sample_recipe(user=self.user)
+        recipe1.tags.add(tag)
+        recipe2.tags.add(tag)
+
+        res = self.client.get(RECIPE_URL, {'expand': 'tags', 'sideload': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['recipes']), 2)
+        self.assertEqual(res.data['recipes'][0]['tags'], [tag.id])
+        self.assertEqual(
+            res.data['tags'],
+            {tag.id: {'id': tag.id, 'name': tag.name}}
+        )
+        self.assertNotIn('ingredients', res.data)
+
+    def test_list_sideload_flag(self):
+        """Test sideload accepts true and rejects other words"""
+        sample_recipe(user=self.user).tags.add(sample_tag(user=self.user))
+
+        res = self.client.get(
+            RECIPE_URL, {'expand': 'tags', 'sideload': 'true'}
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('tags', res.data)
+
+        res = self.client.get(RECIPE_URL, {'expand': 'tags', 'sideload': 'y'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('sideload', res.data)
+
+    def test_list_paginated_exact_count(self):
+        """Test small libraries are paginated with exact counts"""
+        for _ in range(3):
+            sample_recipe(user=self.user)
+
+        res = self.client.get(RECIPE_URL, {'limit': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 3)
+        self.assertTrue(res.data['count_exact'])
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNotNone(res.data['next'])
+
+    def test_list_paginated_cached_count(self):
+        """Test large libraries report the maintained count as estimate"""
+        sample_recipe(user=self.user)
+        set_recipe_count(self.user.id, 50000)
+
+        res = self.client.get(RECIPE_URL, {'limit': 1})
+        filtered = self.client.get(RECIPE_URL, {'limit': 1, 'tags': '999'})
+
+        self.assertEqual(res.data['count'], 50000)
+        self.assertFalse(res.data['count_exact'])
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(filtered.data['count'], 0)
+        self.assertTrue(filtered.data['count_exact'])
+
+    @override_settings(ESTIMATED_COUNT_THRESHOLD=1)
+    def test_list_paginated_low_estimate(self):
+        """Test an estimate below the real total hides no rows"""
+        for _ in range(5):
+            sample_recipe(user=self.user)
+        set_recipe_count(self.user.id, 2)
+
+        middle = self.client.get(RECIPE_URL, {'limit': 2, 'offset': 2})
+        last = self.client.get(RECIPE_URL, {'limit': 2, 'offset': 4})
+
+        self.assertFalse(middle.data['count_exact'])
+        self.assertEqual(len(middle.data['results']), 2)
+        self.assertIsNotNone(middle.data['next'])
+        self.assertGreaterEqual(middle.data['count'], 5)
+        self.assertEqual(len(last.data['results']), 1)
+        self.assertIsNone(last.data['next'])
+
 
 class ImageApiTest(TestCase):
     """Test image upload apis"""
@@ -272,3 +426,470 @@ class ImageApiTest(TestCase):
         self.assertIn(serializer1.data, res.data)
         self.assertIn(serializer2.data, res.data)
         self.assertNotIn(serializer3.data, res.data)
+
+
+class RecipeOrderingApiTest(TestCase):
+    """Test ordering, range filters and keyset pagination of recipes"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@app.com',
+            'password'
+        )
+        self.client.force_authenticate(self.user)
+        self.stew = sample_recipe(
+            self.user, title='Stew', price=12.00, time_minutes=90
+        )
+        self.salad = sample_recipe(
+            self.user, title='Salad', price=6.00, time_minutes=10
+        )
+        self.toast = sample_recipe(
+            self.user, title='Toast', price=2.00, time_minutes=5
+        )
+        self.soup = sample_recipe(
+            self.user, title='Soup', price=6.00, time_minutes=30
+        )
+
+    def titles(self, data):
+        return [recipe['title'] for recipe in data]
+
+    def test_order_by_price(self):
+        """Test recipes are ordered by price, ties by id"""
+        res = self.client.get(RECIPE_URL, {'ordering': 'price'})
+
+        self.assertEqual(
+            self.titles(res.data), ['Toast', 'Salad', 'Soup', 'Stew']
+        )
+
+    def test_order_descending(self):
+        """Test a leading minus reverses the ordering"""
+        res = self.client.get(RECIPE_URL, {'ordering': '-time_minutes'})
+
+        self.assertEqual(
+            self.titles(res.data), ['Stew', 'Soup', 'Salad', 'Toast']
+        )
+
+    def test_unknown_ordering_rejected(self):
+        """Test ordering by other fields is rejected"""
+        res = self.client.get(RECIPE_URL, {'ordering': 'user'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_range_filters(self):
+        """Test recipes are filtered by cooking time and price ranges"""
+        res = self.client.get(RECIPE_URL, {
+            'max_time': 30,
+            'min_price': '3',
+            'max_price': '10.00',
+            'ordering': 'time_minutes',
+        })
+
+        self.assertEqual(self.titles(res.data), ['Salad', 'Soup'])
+
+    def test_invalid_range_rejected(self):
+        """Test non-numeric range bounds are rejected"""
+        res = self.client.get(RECIPE_URL, {'max_price': 'cheap'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_out_of_range_rejected(self):
+        """Test bounds the columns cannot hold are rejected"""
+        for params in (
+            {'max_time': '99999999999999999999'},
+            {'max_price': 'nan'},
+            {'min_price': 'Infinity'},
+            {'max_price': '999.999'},
+        ):
+            res = self.client.get(RECIPE_URL, params)
+
+            self.assertEqual(
+                res.status_code, status.HTTP_400_BAD_REQUEST, params
+            )
+
+    def test_keyset_pages(self):
+        """Test following cursors visits every recipe once, in order"""
+        titles = []
+        url = RECIPE_URL
+        params = {'ordering': 'price', 'page_size': 1}
+        while url:
+            res = self.client.get(url, params)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            titles += self.titles(res.data['results'])
+            url, params = res.data['next'], {}
+
+        self.assertEqual(titles, ['Toast', 'Salad', 'Soup', 'Stew'])
+
+    def test_keyset_descending_with_filter(self):
+        """Test keyset pages combine with descending order and filters"""
+        res = self.client.get(RECIPE_URL, {
+            'ordering': '-price', 'max_price': 10, 'page_size': 2
+        })
+        self.assertEqual(self.titles(res.data['results']), ['Soup', 'Salad'])
+
+        res = self.client.get(res.data['next'])
+        self.assertEqual(self.titles(res.data['results']), ['Toast'])
+        self.assertIsNone(res.data['next'])
+
+    def test_cursor_of_other_ordering_rejected(self):
+        """Test a cursor cannot be reused with a different ordering"""
+        res = self.client.get(
+            RECIPE_URL, {'ordering': 'price', 'page_size': 1}
+        )
+        cursor = parse_qs(urlparse(res.data['next']).query)['cursor'][0]
+
+        res = self.client.get(
+            RECIPE_URL, {'ordering': 'title', 'cursor': cursor}
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(
+            RECIPE_URL, {'ordering': '-price', 'cursor': cursor}
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('cursor', res.data)
+
+    def test_invalid_cursor_rejected(self):
+        """Test malformed cursors are rejected"""
+        res = self.client.get(RECIPE_URL, {'cursor': 'garbage'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RecipeFragmentCacheTest(TestCase):
+    """Test recipes are rendered from cached fragments until they change"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@app.com',
+            'password'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = sample_tag(self.user, 'Vegan')
+        self.recipe = sample_recipe(user=self.user, title='Soup')
+        self.recipe.tags.add(self.tag)
+        self.url = detail_url(self.recipe.id)
+
+    def test_detail_served_from_cache(self):
+        """Test an unchanged recipe is only checked for its version"""
+        first = self.client.get(self.url)
+
+        with self.assertNumQueries(1):
+            second = self.client.get(self.url)
+
+        self.assertEqual(second.data, first.data)
+
+    def test_list_served_from_cache(self):
+        """Test listed recipes are read once, fragments multi-fetched"""
+        sample_recipe(user=self.user, title='Stew')
+        first = self.client.get(RECIPE_URL, {'expand': 'tags'})
+
+        with self.assertNumQueries(1):
+            second = self.client.get(RECIPE_URL, {'expand': 'tags'})
+
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second.data[1]['tags'][0]['name'], 'Vegan')
+
+    def test_update_invalidates(self):
+        """Test a recipe update is visible at once"""
+        self.client.get(self.url)
+
+        self.client.patch(self.url, {'title': 'Stew'})
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.data['title'], 'Stew')
+
+    def test_stale_fragment_not_served_after_update(self):
+        """Test a fragment left over from an older version is not used"""
+        self.client.get(self.url)
+
+        # As if the delete ran before a stale render was stored
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            title='Stew',
+            version=F('version') + 1
+        )
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.data['title'], 'Stew')
+        self.assertEqual(res.data['version'], 2)
+
+    def test_link_change_invalidates(self):
+        """Test adding a tag to a recipe is visible at once"""
+        self.client.get(self.url)
+
+        self.recipe.tags.add(sample_tag(self.user, 'Quick'))
+        res = self.client.get(self.url)
+
+        self.assertEqual(len(res.data['tags']), 2)
+
+    def test_rename_invalidates_linked_recipes(self):
+        """Test renaming a tag refreshes every recipe showing it"""
+        self.client.get(self.url)
+        self.client.get(RECIPE_URL, {'expand': 'tags'})
+
+        self.tag.name = 'Plant based'
+        self.tag.save()
+
+        res = self.client.get(self.url)
+        self.assertEqual(res.data['tags'][0]['name'], 'Plant based')
+        res = self.client.get(RECIPE_URL, {'expand': 'tags'})
+        self.assertEqual(res.data[0]['tags'][0]['name'], 'Plant based')
+
+    def test_delete_invalidates_linked_recipes(self):
+        """Test deleting a tag removes it from cached recipes"""
+        self.client.get(self.url)
+
+        self.tag.delete()
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.data['tags'], [])
+
+    def test_cached_fragment_not_served_to_other_user(self):
+        """Test another user cannot read a cached recipe"""
+        self.client.get(self.url)
+        other = get_user_model().objects.create_user('o@app.com', 'pass')
+        self.client.force_authenticate(other)
+
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RecipeQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """Test recipe endpoints run a fixed number of queries"""
+
+    budgets = RecipeViewSet.query_budgets
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@app.com',
+            'password'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user)
+        self.tags = []
+        self.ingredients = []
+
+    def add_recipes(self, count):
+        for i in range(count):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(sample_tag(self.user, f'Tag {recipe.id}'))
+            recipe.ingredients.add(
+                sample_ingredient(self.user, f'Ingredient {recipe.id}')
+            )
+
+    def add_objects(self, count):
+        start = len(self.tags)
+        for i in range(start, start + count):
+            self.tags.append(sample_tag(self.user, f'Tag {i}'))
+            self.ingredients.append(
+                sample_ingredient(self.user, f'Ingredient {i}')
+            )
+
+    def add_links(self, count):
+        self.add_objects(count)
+        self.recipe.tags.set(self.tags)
+        self.recipe.ingredients.set(self.ingredients)
+
+    def payload(self):
+        return {
+            'title': f'Curry {len(self.tags)}',
+            'time_minutes': 20,
+            'price': 7.00,
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [ingredient.id for ingredient in self.ingredients],
+        }
+
+    def test_list_budget(self):
+        """Test listing recipes does not query per recipe"""
+        self.assertQueryBudget(
+            self.budgets['list'],
+            lambda: self.client.get(RECIPE_URL, {'limit': 50}),
+            self.add_recipes
+        )
+
+    def test_list_sideload_budget(self):
+        """Test side-loading does not query per recipe"""
+        self.assertQueryBudget(
+            self.budgets['list'],
+            lambda: self.client.get(
+                RECIPE_URL, {'expand': 'tags,ingredients', 'sideload': 1}
+            ),
+            self.add_recipes
+        )
+
+    def test_pantry_budget(self):
+        """Test ranking by pantry does not query per recipe"""
+        def request():
+            index.clear_indexes()
+            self.client.post(reverse('recipe:recipe-pantry'), {
+                'ingredients': list(Ingredient.objects.values_list(
+                    'id', flat=True
+                ))
+            }, format='json')
+
+        # One more query reads the pantry ids
+        self.assertQueryBudget(
+            self.budgets['pantry'] + 1, request, self.add_recipes
+        )
+
+    def test_shopping_list_budget(self):
+        """Test a shopping list does not query per recipe"""
+        self.assertQueryBudget(
+            self.budgets['shopping_list'],
+            lambda: self.client.post(
+                reverse('recipe:recipe-shopping-list'),
+                {'recipes': list(range(1, 20))},
+                format='json'
+            ),
+            self.add_recipes
+        )
+
+    def test_retrieve_budget(self):
+        """Test retrieving a recipe does not query per tag or ingredient"""
+        self.assertQueryBudget(
+            self.budgets['retrieve'],
+            lambda: self.client.get(detail_url(self.recipe.id)),
+            self.add_links
+        )
+
+    def test_create_budget(self):
+        """Test creating a recipe does not query per linked object"""
+        self.assertQueryBudget(
+            self.budgets['create'],
+            lambda: self.client.post(RECIPE_URL, self.payload()),
+            self.add_objects
+        )
+
+    def test_update_budget(self):
+        """Test linking new objects to a recipe does not query per link"""
+        self.assertQueryBudget(
+            self.budgets['update'],
+            lambda: self.client.put(
+                detail_url(self.recipe.id), self.payload()
+            ),
+            self.add_objects
+        )
+
+
+class RecipeVersionTest(TestCase):
+    """Test concurrent recipe updates cannot overwrite each other"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@app.com',
+            'password'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user, title='Soup')
+        self.url = detail_url(self.recipe.id)
+
+    def test_retrieve_sets_etag(self):
+        """Test a recipe is returned with its version as ETag"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.data['version'], 1)
+        self.assertEqual(res['ETag'], '"1"')
+
+    def test_update_bumps_version(self):
+        """Test each update moves the recipe to a new version"""
+        res = self.client.patch(self.url, {'title': 'Stew'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['ETag'], '"2"')
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.version, 2)
+
+    def test_link_change_bumps_version(self):
+        """Test changing only the links also moves the version"""
+        tag = sample_tag(self.user)
+
+        self.client.patch(self.url, {'tags': [tag.id]})
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.version, 2)
+
+    def test_if_match_current_version(self):
+        """Test an update based on the current version succeeds"""
+        res = self.client.patch(
+            self.url, {'title': 'Stew'}, HTTP_IF_MATCH='"1"'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_if_match_stale_version(self):
+        """Test an update based on an old version is refused"""
+        self.client.patch(self.url, {'title': 'Stew'})
+
+        res = self.client.patch(
+            self.url, {'title': 'Broth'}, HTTP_IF_MATCH='"1"'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, 'Stew')
+
+    def test_concurrent_update_refused(self):
+        """Test a writer racing a newer update does not overwrite it"""
+        tag = sample_tag(self.user)
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        self.client.patch(self.url, {'title': 'Stew'})
+
+        serializer = RecipeSerializer(
+            stale, data={'title': 'Broth', 'tags': [tag.id]}, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        with self.assertRaises(VersionConflict):
+            serializer.save()
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, 'Stew')
+        self.assertFalse(self.recipe.tags.exists())
+
+    def test_malformed_if_match_rejected(self):
+        """Test an If-Match that is not a quoted version is a bad request"""
+        res = self.client.patch(
+            self.url, {'title': 'Stew'}, HTTP_IF_MATCH='1'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('If-Match', res.data)
+
+    def upload_image(self, **extra):
+        self.addCleanup(lambda: Recipe.objects.get(
+            pk=self.recipe.pk
+        ).image.delete())
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as fil:
+            Image.new('RGB', (10, 10)).save(fil, format='JPEG')
+            fil.seek(0)
+            return self.client.post(
+                image_url(self.recipe.id),
+                {'image': fil},
+                format='multipart',
+                **extra
+            )
+
+    def test_image_upload_bumps_version(self):
+        """Test uploading an image moves the recipe to a new version"""
+        res = self.upload_image(HTTP_IF_MATCH='"1"')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['ETag'], '"2"')
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.version, 2)
+
+    def test_image_upload_stale_version(self):
+        """Test an image upload based on an old version is refused"""
+        self.client.patch(self.url, {'title': 'Stew'})
+
+        res = self.upload_image(HTTP_IF_MATCH='"1"')
+
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
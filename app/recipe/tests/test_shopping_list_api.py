@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import Recipe, Ingredient
+
+
+SHOPPING_LIST_URL = reverse('recipe:recipe-shopping-list')
+
+
+def sample_recipe(user, ingredients, **params):
+    """Create and return a sample recipe using ingredients"""
+    defaults = {
+        'title': 'sample recipe',
+        'time_minutes': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    recipe = Recipe.objects.create(user=user, **defaults)
+    recipe.ingredients.set(ingredients)
+    return recipe
+
+
+class ShoppingListApiTest(TestCase):
+    """Test building a shopping list from many recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@app.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+        self.kale = Ingredient.objects.create(user=self.user, name='Kale')
+
+    def test_ingredients_merged_across_recipes(self):
+        """Test each ingredient is listed once with its recipes"""
+        soup = sample_recipe(self.user, [self.salt, self.kale], title='Soup')
+        fries = sample_recipe(self.user, [self.salt], title='Fries')
+
+        res = self.client.post(SHOPPING_LIST_URL, {
+            'recipes': [soup.id, fries.id, soup.id]
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': self.kale.id, 'name': 'Kale', 'recipes': [soup.id]},
+            {
+                'id': self.salt.id,
+                'name': 'Salt',
+                'recipes': [soup.id, fries.id],
+            },
+        ])
+
+    def test_other_users_recipes_ignored(self):
+        """Test recipes of other users add nothing to the list"""
+        other = get_user_model().objects.create_user('o@app.com', 'pass')
+        garlic = Ingredient.objects.create(user=other, name='Garlic')
+        recipe = sample_recipe(other, [garlic])
+
+        res = self.client.post(
+            SHOPPING_LIST_URL, {'recipes': [recipe.id]}, format='json'
+        )
+
+        self.assertEqual(res.data, [])
+
+    def test_number_of_recipes_capped(self):
+        """Test lists of too many recipes are rejected"""
+        res = self.client.post(SHOPPING_LIST_URL, {
+            'recipes': list(range(settings.SHOPPING_LIST_MAX_RECIPES + 1))
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,140 @@
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import Recipe, Tag, Ingredient, SimilarRecipe
+from recipe import index
+from recipe.similarity import refresh_similar
+
+
+def similar_url(recipe_id):
+    return reverse('recipe:recipe-similar', args=(recipe_id,))
+
+
+def sample_recipe(user, links, **params):
+    """Create and return a sample recipe linked to tags and ingredients"""
+    defaults = {
+        'title': 'sample recipe',
+        'time_minutes': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    recipe = Recipe.objects.create(user=user, **defaults)
+    recipe.tags.set([obj for obj in links if isinstance(obj, Tag)])
+    recipe.ingredients.set(
+        [obj for obj in links if isinstance(obj, Ingredient)]
+    )
+    return recipe
+
+
+class SimilarRecipesApiTest(TestCase):
+    """Test recommending recipes alike in tags and ingredients"""
+
+    def setUp(self):
+        cache.clear()
+        index.clear_indexes()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@app.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+        self.kale = Ingredient.objects.create(user=self.user, name='Kale')
+        self.recipe = sample_recipe(
+            self.user, [self.vegan, self.salt, self.kale], title='Kale soup'
+        )
+        self.twin = sample_recipe(
+            self.user, [self.vegan, self.salt, self.kale], title='Kale stew'
+        )
+        self.distant = sample_recipe(self.user, [self.salt], title='Fries')
+        sample_recipe(self.user, [], title='Water')
+
+    def ids(self, res):
+        return [row['recipe']['id'] for row in res.data]
+
+    def test_similar_ranked_by_jaccard(self):
+        """Test recipes sharing more links rank higher"""
+        res = self.client.get(similar_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.ids(res), [self.twin.id, self.distant.id])
+        self.assertEqual(res.data[0]['score'], 1.0)
+        self.assertEqual(res.data[1]['score'], 0.333)
+
+    def test_similar_served_from_stored_rows(self):
+        """Test refreshed neighbours are read from the stored table"""
+        refresh_similar(self.user.id)
+        SimilarRecipe.objects.filter(similar=self.distant).update(score=2)
+
+        res = self.client.get(similar_url(self.recipe.id))
+
+        self.assertEqual(self.ids(res), [self.distant.id, self.twin.id])
+
+    def test_refresh_only_affected_recipes(self):
+        """Test later refreshes recompute only recipes near a change"""
+        lonely = sample_recipe(
+            self.user,
+            [Ingredient.objects.create(user=self.user, name='Tofu')],
+            title='Tofu'
+        )
+        self.assertEqual(refresh_similar(self.user.id), 4)
+
+        self.distant.tags.add(self.vegan)
+
+        self.assertEqual(refresh_similar(self.user.id), 3)
+        self.assertFalse(SimilarRecipe.objects.filter(recipe=lonely))
+        score = SimilarRecipe.objects.get(
+            recipe=self.recipe, similar=self.distant
+        ).score
+        self.assertAlmostEqual(score, 2 / 3)
+
+    def test_partial_index_loads_neighbourhood(self):
+        """Test refresh indexes hold only recipes near the ones asked for"""
+        lonely = sample_recipe(
+            self.user,
+            [Ingredient.objects.create(user=self.user, name='Tofu')],
+            title='Tofu'
+        )
+
+        built = index.RecipeIndex.build_around(
+            self.user.id, [self.twin.id], max_posting=2
+        )
+
+        self.assertNotIn(lonely.id, built.recipe_ids())
+        self.assertIn(self.salt.id, built.skipped['ingredients'])
+        self.assertEqual(
+            dict(built.neighbours(self.twin.id, max_posting=2)),
+            {self.recipe.id: 2}
+        )
+
+    def test_limit_capped(self):
+        """Test at most limit similar recipes are returned"""
+        res = self.client.get(similar_url(self.recipe.id), {'limit': 1})
+
+        self.assertEqual(self.ids(res), [self.twin.id])
+
+    def test_other_users_recipe_not_found(self):
+        """Test similar recipes of another user's recipe are hidden"""
+        other = get_user_model().objects.create_user('o@app.com', 'pass')
+        recipe = sample_recipe(other, [], title='Other')
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_refresh_command(self):
+        """Test the command stores neighbours for every recipe"""
+        out = StringIO()
+        call_command('refresh_similar_recipes', full=True, stdout=out)
+
+        self.assertIn('of 3 recipes', out.getvalue())
+        self.assertEqual(
+            SimilarRecipe.objects.filter(recipe=self.recipe).count(), 2
+        )
@@ -0,0 +1,86 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import Recipe, Tag, Ingredient
+
+
+STATS_URL = reverse('recipe:recipe-stats')
+
+
+def sample_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'sample recipe',
+        'time_minutes': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PrivateStatsApiTest(TestCase):
+    """Test library statistics for authenticated users"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@app.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_stats_aggregates(self):
+        """Test stats are aggregated for the user's library"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        Ingredient.objects.create(user=self.user, name='Unused')
+        recipe1 = sample_recipe(user=self.user, price=4.00, time_minutes=10)
+        recipe2 = sample_recipe(user=self.user, price=6.00, time_minutes=20)
+        recipe1.tags.add(tag)
+        recipe1.ingredients.add(salt)
+        recipe2.ingredients.add(salt)
+        other = get_user_model().objects.create_user('o@app.com', 'pass')
+        sample_recipe(user=other, price=100.00)
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 2)
+        self.assertEqual(res.data['average_price'], 5.0)
+        self.assertEqual(res.data['average_time_minutes'], 15.0)
+        self.assertEqual(
+            res.data['tags'],
+            [{'id': tag.id, 'name': 'Vegan', 'recipe_count': 1}]
+        )
+        self.assertEqual(
+            res.data['top_ingredients'],
+            [{'id': salt.id, 'name': 'Salt', 'recipe_count': 2}]
+        )
+
+    def test_stats_cached(self):
+        """Test stats are served from cache until the library changes"""
+        sample_recipe(user=self.user)
+        self.client.get(STATS_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(STATS_URL)
+        self.assertEqual(res.data['recipe_count'], 1)
+
+    def test_stats_invalidated_on_write(self):
+        """Test stats are recomputed after recipes and links change"""
+        recipe = sample_recipe(user=self.user)
+        self.client.get(STATS_URL)
+
+        tag = Tag.objects.create(user=self.user, name='Quick')
+        recipe.tags.add(tag)
+        res = self.client.get(STATS_URL)
+        self.assertEqual(res.data['tags'][0]['recipe_count'], 1)
+
+        recipe.delete()
+        res = self.client.get(STATS_URL)
+        self.assertEqual(res.data['recipe_count'], 0)
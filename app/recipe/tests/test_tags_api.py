@@ -1,13 +1,20 @@
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.conf import settings
 from django.urls import reverse
 from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
+from core.budget import QueryBudgetMixin
 from core.models import Tag, Recipe
+from recipe.cache import library_version
 from recipe.serializers import TagSerializer
+from recipe.views import TagViewSet
 
 
 TAG_URL = reverse('recipe:tag-list')
+UPSERT_URL = reverse('recipe:tag-upsert')
+AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
 
 
 class PulicTagApiTest(TestCase):
@@ -122,3 +129,198 @@ class PrivateTagAPiTest(TestCase):
 
         self.assertEqual(len(res.data), 1)
         self.assertIn(serializer1.data, res.data)
+
+    def test_tags_ordered_by_popularity(self):
+        """Test tags can be ordered by how many recipes use them"""
+        recipe1 = Recipe.objects.create(
+            title='Chicken Tikka',
+            time_minutes=10,
+            price=5.00,
+            user=self.user
+        )
+        recipe2 = Recipe.objects.create(
+            title='Chicken Masala',
+            time_minutes=10,
+            price=5.00,
+            user=self.user
+        )
+        tag1 = Tag.objects.create(user=self.user, name='Curry')
+        tag2 = Tag.objects.create(user=self.user, name='Spicy')
+        tag3 = Tag.objects.create(user=self.user, name='Unused')
+        recipe1.tags.add(tag1, tag2)
+        recipe2.tags.add(tag1)
+
+        res = self.client.get(TAG_URL, {'ordering': 'popular'})
+
+        self.assertEqual(
+            [tag['id'] for tag in res.data],
+            [tag1.id, tag2.id, tag3.id]
+        )
+
+    def test_create_tag_idempotent(self):
+        """Test creating a tag twice returns the first one"""
+        res1 = self.client.post(TAG_URL, {'name': 'Vegan'})
+        res2 = self.client.post(TAG_URL, {'name': 'VEGAN'})
+
+        self.assertEqual(res1.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res2.status_code, status.HTTP_200_OK)
+        self.assertEqual(res1.data, res2.data)
+
+    def test_upsert_tags(self):
+        """Test upserting tag names"""
+        res = self.client.post(
+            UPSERT_URL,
+            {'names': ['Vegan', 'Quick']},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(Tag.objects.values_list('normalized_name', flat=True)),
+            ['quick', 'vegan']
+        )
+
+    def test_upsert_existing_keeps_library_version(self):
+        """Test upserting only existing names leaves caches valid"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        version = library_version(self.user.id)
+
+        res = self.client.post(
+            UPSERT_URL, {'names': ['vegan']}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(library_version(self.user.id), version)
+
+    def test_long_casefolded_name(self):
+        """Test names growing when casefolded still fit their column"""
+        name = '\u00df' * 235
+        res = self.client.post(TAG_URL, {'name': name})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        field = Tag._meta.get_field('normalized_name')
+        self.assertLessEqual(
+            len(Tag.objects.get().normalized_name), field.max_length
+        )
+
+
+class TagAutocompleteTest(TestCase):
+    """Test tag name suggestions"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@app.com',
+            'password'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def names(self, res):
+        return [tag['name'] for tag in res.data]
+
+    def test_prefix_matches_most_used_first(self):
+        """Test prefix matches are returned most used first"""
+        Tag.objects.create(user=self.user, name='Chinese')
+        Tag.objects.create(user=self.user, name='Chicken', usage_count=4)
+        Tag.objects.create(user=self.user, name='Dessert')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': ' CHI'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.names(res), ['Chicken', 'Chinese'])
+
+    def test_substring_matches_follow_prefix_matches(self):
+        """Test names containing the query follow prefix matches"""
+        Tag.objects.create(user=self.user, name='Sweet potato')
+        Tag.objects.create(user=self.user, name='Sweets')
+        Tag.objects.create(user=self.user, name='Tomato')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'swe'})
+        self.assertEqual(self.names(res), ['Sweet potato', 'Sweets'])
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'pot'})
+        self.assertEqual(self.names(res), ['Sweet potato'])
+
+    def test_limit_capped(self):
+        """Test the number of suggestions is capped"""
+        for i in range(30):
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'tag', 'limit': 500})
+
+        self.assertEqual(len(res.data), settings.AUTOCOMPLETE_MAX_LIMIT)
+
+    def test_suggestions_limited_to_user(self):
+        """Test other users' names are not suggested"""
+        other = get_user_model().objects.create_user('o@app.com', 'pass')
+        Tag.objects.create(user=other, name='Vegan')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'veg'})
+
+        self.assertEqual(res.data, [])
+
+    def test_new_names_not_hidden_by_cache(self):
+        """Test cached suggestions are dropped when names change"""
+        self.client.get(AUTOCOMPLETE_URL, {'q': 'veg'})
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'veg'})
+
+        self.assertEqual(self.names(res), ['Vegan'])
+
+
+class TagQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """Test tag endpoints run a fixed number of queries"""
+
+    budgets = TagViewSet.query_budgets
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@app.com',
+            'password'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.names = []
+
+    def add_tags(self, count):
+        for _ in range(count):
+            recipe = Recipe.objects.create(
+                user=self.user, title='Soup', time_minutes=5, price=3.00
+            )
+            recipe.tags.add(Tag.objects.create(
+                user=self.user, name=f'Tag {recipe.id}'
+            ))
+
+    def add_names(self, count):
+        start = len(self.names)
+        self.names += [f'Name {i}' for i in range(start, start + count)]
+
+    def test_list_budget(self):
+        """Test listing tags does not query per tag"""
+        self.assertQueryBudget(
+            self.budgets['list'],
+            lambda: self.client.get(TAG_URL, {'assigned_only': 1}),
+            self.add_tags
+        )
+
+    def test_autocomplete_budget(self):
+        """Test suggestions do not query per matching name"""
+        self.assertQueryBudget(
+            self.budgets['autocomplete'],
+            lambda: self.client.get(
+                AUTOCOMPLETE_URL, {'q': 'tag', 'limit': 20}
+            ),
+            self.add_tags
+        )
+
+    def test_upsert_budget(self):
+        """Test upserting names does not query per name"""
+        self.assertQueryBudget(
+            self.budgets['upsert'],
+            lambda: self.client.post(
+                UPSERT_URL, {'names': self.names}, format='json'
+            ),
+            self.add_names
+        )
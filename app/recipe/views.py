@@ -1,18 +1,47 @@
+import re
+from decimal import Decimal, InvalidOperation
+from itertools import groupby
+from django.conf import settings
+from django.db import connection
+from django.db.models import prefetch_related_objects
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from core.models import Tag, Ingredient, Recipe
+from rest_framework.views import APIView
+from core.authentication import ExpiringTokenAuthentication
+from core.models import Tag, Ingredient, Recipe, SimilarRecipe, \
+    normalize_name
+from core.names import upsert_names
 from recipe import serializers
+from recipe.cache import bump_library_version, get_library_stats, \
+    get_recipe_count, get_recipe_fragments, get_suggestions, \
+    recipe_variant, set_recipe_count, set_recipe_fragments
+from recipe.importer import FORMATS, RecipeImporter, UnreadableFile, \
+    guess_format, read_rows
+from recipe.index import RecipeIndex, get_index
+from recipe.pagination import ApproximateCountPagination, KeysetPagination
+from recipe.search import suggest_names
+from recipe.stats import library_stats
+from recipe.sync import changes_since, decode_cursor
 
 
 class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin):
     """Base recipe attribute class"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = ApproximateCountPagination
+    filter_params = ('assigned_only',)
+    query_budgets = {'list': 3, 'create': 6, 'upsert': 5, 'autocomplete': 3}
+
+    orderings = {
+        'name': ('-name',),
+        'popular': ('-usage_count', '-name'),
+    }
 
     def get_queryset(self):
         """Return objects for current user"""
@@ -21,16 +50,71 @@ class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
             int(self.request.query_params.get('assigned_only', 0))
         )
         if assigned_true:
-            queryset = queryset.filter(recipe__isnull=False)
+            queryset = queryset.filter(usage_count__gt=0)
 
-        return queryset.filter(
-            user=self.request.user).order_by(
-                '-name'
-                ).distinct()
+        ordering = self.orderings.get(
+            self.request.query_params.get('ordering'),
+            self.orderings['name']
+        )
+        return queryset.filter(user=self.request.user).order_by(*ordering)
 
-    def perform_create(self, serializer):
-        """Create a new tag"""
-        serializer.save(user=self.request.user)
+    def create(self, request, *args, **kwargs):
+        """Create an object, or return the one that has the same name"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        name = serializer.validated_data['name']
+        obj, created = self.queryset.model.objects.get_or_create(
+            user=request.user,
+            normalized_name=normalize_name(name),
+            defaults={'name': name}
+        )
+        return Response(
+            self.get_serializer(obj).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+    @action(methods=['POST'], detail=False)
+    def upsert(self, request):
+        """Return objects for many names, creating the missing ones"""
+        serializer = serializers.NameListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        names = serializer.validated_data['names']
+
+        objects, created = upsert_names(
+            self.queryset.model, request.user, names
+        )
+        if created:
+            bump_library_version(request.user.id)
+        ordered = {}
+        for name in names:
+            key = normalize_name(name)
+            if key in objects:
+                ordered.setdefault(key, objects[key])
+        return Response(
+            self.get_serializer(ordered.values(), many=True).data,
+            status=status.HTTP_200_OK
+        )
+
+    @action(methods=['GET'], detail=False)
+    def autocomplete(self, request):
+        """Return the user's names matching a typed prefix"""
+        query = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get(
+                'limit', settings.AUTOCOMPLETE_LIMIT
+            ))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        limit = max(1, min(limit, settings.AUTOCOMPLETE_MAX_LIMIT))
+
+        model = self.queryset.model
+        return Response(get_suggestions(
+            request.user,
+            model._meta.model_name,
+            normalize_name(query),
+            limit,
+            lambda: suggest_names(model, request.user, query, limit)
+        ))
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
@@ -49,13 +133,128 @@ class RecipeViewSet(viewsets.ModelViewSet):
     """Manage recipes in db"""
     serializer_class = serializers.RecipeSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = ApproximateCountPagination
+    filter_params = ('tags', 'ingredients', 'max_time', 'min_price',
+                     'max_price')
+    ordering_fields = ('title', 'price', 'time_minutes', 'id')
+    range_filters = {
+        'max_time': ('time_minutes__lte', int),
+        'min_price': ('price__gte', Decimal),
+        'max_price': ('price__lte', Decimal),
+    }
+    query_budgets = {
+        'list': 5,
+        'retrieve': 4,
+        # Including a row lock per relation before counting its usage
+        'create': 19,
+        'update': 19,
+        'partial_update': 19,
+        'destroy': 10,
+        'stats': 4,
+        'pantry': 6,
+        # Until the first refresh, neighbours are found from the links
+        'similar': 16,
+        'shopping_list': 2,
+    }
+    versioned_actions = (
+        'retrieve', 'create', 'update', 'partial_update', 'upload_image'
+    )
+    expandable_fields = {
+        'tags': serializers.TagSerializer,
+        'ingredients': serializers.IngredientSerializer,
+    }
 
     def _params_to_int(self, param_string):
         """Convert query parameters to int id list"""
         return [int(id_) for id_ in param_string.split(',')]
 
+    def _params_to_sideload(self):
+        """Return whether expanded objects are side-loaded"""
+        value = self.request.query_params.get('sideload', '0').lower()
+        if value not in ('0', '1', 'false', 'true'):
+            raise ValidationError(
+                {'sideload': 'Must be one of 0, 1, false or true.'}
+            )
+        return value in ('1', 'true')
+
+    def _params_to_expand(self):
+        """Return the related fields requested through `expand`"""
+        if self.action != 'list':
+            return ()
+        param_string = self.request.query_params.get('expand')
+        if not param_string:
+            return ()
+        fields = tuple(
+            field for field in param_string.split(',') if field
+        )
+        unknown = set(fields) - set(self.expandable_fields)
+        if unknown:
+            raise ValidationError(
+                {'expand': f'Cannot expand {", ".join(sorted(unknown))}'}
+            )
+        return fields
+
+    @property
+    def paginator(self):
+        """Use keyset pagination when a page size or cursor is given"""
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if KeysetPagination.cursor_query_param in params or \
+                    KeysetPagination.page_size_query_param in params:
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def _params_to_ordering(self):
+        """Return the requested ordering with id as the tie breaker"""
+        ordering = self.request.query_params.get('ordering', '-id')
+        field = ordering.lstrip('-')
+        if field not in self.ordering_fields:
+            raise ValidationError({
+                'ordering': f'Order by one of '
+                            f'{", ".join(self.ordering_fields)}'
+            })
+        prefix = '-' if ordering.startswith('-') else ''
+        if field == 'id':
+            return (f'{prefix}id',)
+        return (f'{prefix}{field}', f'{prefix}id')
+
+    def _params_to_ranges(self):
+        """Return lookups for the range filters given"""
+        lookups = {}
+        for param, (lookup, convert) in self.range_filters.items():
+            value = self.request.query_params.get(param)
+            if value in (None, ''):
+                continue
+            try:
+                number = convert(value)
+            except (ValueError, InvalidOperation):
+                raise ValidationError({param: 'A valid number is required.'})
+            field = Recipe._meta.get_field(lookup.split('__')[0])
+            number = self._fit_to_column(field, number)
+            if number is None:
+                raise ValidationError({param: 'Number is out of range.'})
+            lookups[lookup] = number
+        return lookups
+
+    def _fit_to_column(self, field, number):
+        """Return number as its column stores it, None if it does not fit"""
+        if isinstance(number, Decimal):
+            limit = Decimal(10) ** (field.max_digits - field.decimal_places)
+            if not number.is_finite() or abs(number) >= limit:
+                return None
+            # Rounding to the column's places may carry into a new digit
+            number = number.quantize(Decimal(1).scaleb(-field.decimal_places))
+            return number if abs(number) < limit else None
+        # The portable column range; SQLite itself reports no bounds
+        low, high = connection.ops.integer_field_ranges[
+            field.get_internal_type()
+        ]
+        return number if low <= number <= high else None
+
     def get_queryset(self):
         """Retrieve recies for authenticated user"""
         params_tag = self.request.query_params.get('tags')
@@ -67,6 +266,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
         if params_ingredients:
             ids = self._params_to_int(params_ingredients)
             queryset = queryset.filter(ingredients__id__in=ids)
+        if self.action in ('retrieve', 'pantry', 'similar'):
+            queryset = queryset.prefetch_related('tags', 'ingredients')
+        if self.action == 'list':
+            queryset = queryset.filter(**self._params_to_ranges()).order_by(
+                *self._params_to_ordering()
+            )
+        else:
+            queryset = queryset.order_by('-id')
 
         return queryset.filter(user=self.request.user)
 
@@ -78,10 +285,258 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeImageSerializer
         return self.serializer_class
 
+    def estimate_count(self):
+        """Return the cached size of the user's library"""
+        return get_recipe_count(self.request.user.id)
+
+    def exact_count_seen(self, count):
+        """Remember an exact size of the user's library"""
+        set_recipe_count(self.request.user.id, count)
+
+    def _if_match(self):
+        """Return the recipe version an If-Match header requires, if any"""
+        header = self.request.META.get('HTTP_IF_MATCH', '').strip()
+        if header in ('', '*'):
+            return None
+        match = re.fullmatch(r'(?:W/)?"(\d+)"', header)
+        if match is None:
+            raise ValidationError(
+                {'If-Match': 'Must be a quoted version number.'}
+            )
+        return int(match.group(1))
+
+    def get_serializer_context(self):
+        """Pass requested expansions and version on to the serializer"""
+        context = super().get_serializer_context()
+        context['expand'] = self._params_to_expand()
+        if self.action in ('update', 'partial_update', 'upload_image'):
+            context['if_match'] = self._if_match()
+        return context
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Tag single recipe responses with their version"""
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        data = getattr(response, 'data', None)
+        if self.action in self.versioned_actions and \
+                status.is_success(response.status_code) and \
+                isinstance(data, dict) and 'version' in data:
+            response['ETag'] = f'"{data["version"]}"'
+        return response
+
+    def _render_recipes(self, recipes, variant, serializer_class, context):
+        """Return representations of recipes, reusing cached fragments"""
+        fragments = get_recipe_fragments(
+            [(recipe.id, recipe.version) for recipe in recipes], variant
+        )
+        missing = [recipe for recipe in recipes if recipe.id not in fragments]
+        if missing:
+            prefetch_related_objects(missing, 'tags', 'ingredients')
+            rendered = {
+                (recipe.id, recipe.version): (
+                    recipe.user_id,
+                    serializer_class(recipe, context=context).data
+                )
+                for recipe in missing
+            }
+            set_recipe_fragments(rendered, variant)
+            fragments.update(
+                (recipe_id, fragment)
+                for (recipe_id, _), fragment in rendered.items()
+            )
+        return [fragments[recipe.id][1] for recipe in recipes]
+
+    def list(self, request, *args, **kwargs):
+        """List recipes, side-loading expanded objects when asked to"""
+        sideload = self._params_to_sideload()
+        expand = self._params_to_expand()
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        recipes = list(queryset) if page is None else page
+
+        if sideload and expand:
+            prefetch_related_objects(recipes, *expand)
+            data = {'recipes': self._render_recipes(
+                recipes,
+                recipe_variant('list'),
+                serializers.RecipeSerializer,
+                {}
+            )}
+            for field in expand:
+                related = {}
+                for recipe in recipes:
+                    for obj in getattr(recipe, field).all():
+                        related[obj.id] = obj
+                serializer_class = self.expandable_fields[field]
+                data[field] = {
+                    id_: serializer_class(obj).data
+                    for id_, obj in related.items()
+                }
+        else:
+            data = self._render_recipes(
+                recipes,
+                recipe_variant('list', expand),
+                self.get_serializer_class(),
+                self.get_serializer_context()
+            )
+
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Return a recipe, from its cached fragment when there is one"""
+        version = self._current_version()
+        if version is not None:
+            pk = self.kwargs[self.lookup_field]
+            fragment = get_recipe_fragments([(pk, version)], 'detail').get(pk)
+            if fragment is not None and fragment[0] == request.user.id:
+                return Response(fragment[1])
+
+        instance = self.get_object()
+        data = self.get_serializer(instance).data
+        set_recipe_fragments(
+            {(instance.id, instance.version): (instance.user_id, data)},
+            'detail'
+        )
+        return Response(data)
+
+    def _current_version(self):
+        """Return the version of the requested recipe, if the user has it"""
+        try:
+            pk = int(self.kwargs[self.lookup_field])
+        except ValueError:
+            return None
+        return self.queryset.filter(
+            pk=pk,
+            user=self.request.user
+        ).values_list('version', flat=True).first()
+
     def perform_create(self, serializer):
         """Create new recipe"""
         serializer.save(user=self.request.user)
 
+    @action(methods=['GET'], detail=False)
+    def stats(self, request):
+        """Return aggregate statistics for the user's library"""
+        return Response(get_library_stats(request.user, library_stats))
+
+    @action(methods=['POST'], detail=False)
+    def pantry(self, request):
+        """Rank recipes by how well the given ingredients cover them"""
+        serializer = serializers.PantrySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ranked = get_index(request.user.id).rank_pantry(
+            serializer.validated_data['ingredients'],
+            serializer.validated_data['limit']
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in ranked]
+        )
+
+        context = self.get_serializer_context()
+        return Response([
+            {
+                'recipe': serializers.RecipeSerializer(
+                    recipes[recipe_id], context=context
+                ).data,
+                'matched': matched,
+                'missing': missing,
+                'coverage': round(matched / (matched + missing), 3),
+            }
+            for recipe_id, matched, missing in ranked
+            if recipe_id in recipes
+        ])
+
+    @action(methods=['POST'], detail=False, url_path='shopping-list')
+    def shopping_list(self, request):
+        """Return the ingredients of many recipes with where each is used"""
+        serializer = serializers.ShoppingListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        rows = Recipe.ingredients.through.objects.filter(
+            recipe_id__in=set(serializer.validated_data['recipes']),
+            recipe__user=request.user
+        ).order_by(
+            'ingredient__normalized_name', 'ingredient_id', 'recipe_id'
+        ).values_list('ingredient_id', 'ingredient__name', 'recipe_id')
+
+        return Response([
+            {
+                'id': ingredient_id,
+                'name': name,
+                'recipes': [recipe_id for _, _, recipe_id in group],
+            }
+            for (ingredient_id, name), group in groupby(
+                rows, key=lambda row: row[:2]
+            )
+        ])
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """Return the recipes sharing most tags and ingredients with one"""
+        recipe = self.get_object()
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        limit = max(1, min(limit, settings.SIMILAR_RECIPES_STORED))
+
+        ranked = list(SimilarRecipe.objects.filter(
+            recipe=recipe
+        ).order_by('-score').values_list('similar_id', 'score')[:limit])
+        if not ranked:
+            # Not built yet; the in-memory index answers the same question
+            ranked = RecipeIndex.build_around(
+                request.user.id, [recipe.id], settings.SIMILAR_MAX_POSTING
+            ).similar(recipe.id, limit, settings.SIMILAR_MAX_POSTING)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in ranked]
+        )
+
+        context = self.get_serializer_context()
+        return Response([
+            {
+                'recipe': serializers.RecipeSerializer(
+                    recipes[recipe_id], context=context
+                ).data,
+                'score': round(score, 3),
+            }
+            for recipe_id, score in ranked
+            if recipe_id in recipes
+        ])
+
+    @action(
+        methods=['POST'],
+        detail=False,
+        url_path='import',
+        parser_classes=(MultiPartParser,)
+    )
+    def import_recipes(self, request):
+        """Import recipes from an uploaded CSV or NDJSON file"""
+        upload = request.data.get('file')
+        if not hasattr(upload, 'name'):
+            raise ValidationError({'file': 'A file is required.'})
+        fmt = request.data.get('format') or guess_format(upload.name)
+        if fmt not in FORMATS:
+            raise ValidationError(
+                {'format': f'Format must be one of {", ".join(FORMATS)}'}
+            )
+
+        importer = RecipeImporter(
+            request.user,
+            chunk_size=settings.RECIPE_IMPORT_CHUNK_SIZE
+        )
+        try:
+            report = importer.run(read_rows(upload, fmt))
+        except UnreadableFile as exc:
+            raise ValidationError({
+                'file': [f'{exc} {importer.created} recipes before it '
+                         f'were imported.'],
+            })
+        return Response(report, status=status.HTTP_200_OK)
+
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
         """Upload image to db"""
@@ -102,3 +557,24 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 serializer.data,
                 status=status.HTTP_400_BAD_REQUEST
             )
+
+
+class ChangesView(APIView):
+    """Feed of changes to the user's library since a cursor"""
+    authentication_classes = (ExpiringTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    query_budgets = {'get': 7}
+
+    def get(self, request):
+        """Return one page of changes after the given cursor"""
+        cursor = request.query_params.get('cursor')
+        seq = decode_cursor(cursor) if cursor else 0
+        try:
+            limit = int(request.query_params.get(
+                'limit', settings.SYNC_PAGE_SIZE
+            ))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        limit = max(1, min(limit, settings.SYNC_PAGE_SIZE))
+
+        return Response(changes_since(request.user, seq, limit))
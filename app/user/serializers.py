@@ -37,6 +37,11 @@ class AuthTokenSerializer(serializers.Serializer):
         style={'input_type': 'password'},
         trim_whitespace=False
     )
+    name = serializers.CharField(
+        max_length=100,
+        required=False,
+        allow_blank=True
+    )
 
     def validate(self, attrs):
         """Validate and authenticate user"""
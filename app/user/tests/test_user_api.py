@@ -1,12 +1,16 @@
-from django.test import TestCase
+from datetime import timedelta
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
+from core.models import AuthToken
 
 
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
+CURRENT_TOKEN_URL = reverse('user:current-token')
 ME_URL = reverse('user:me')
 
 
@@ -151,3 +155,89 @@ class PrivateUserApiTest(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_delete_user_deactivates(self):
+        """Test deleting the user deactivates it and schedules a purge"""
+        res = self.client.delete(ME_URL)
+
+        self.user.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(self.user.is_active)
+        self.assertEqual(self.user.purge.email, self.user.email)
+
+
+class TokenAuthApiTest(TestCase):
+    """Test issuing and expiring auth tokens"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.payload = {'email': 'testuser@app.com', 'password': 'password'}
+        self.user = create_user(**self.payload)
+
+    def issue(self, **extra):
+        res = self.client.post(TOKEN_URL, {**self.payload, **extra})
+        return res.data['token']
+
+    def authorize(self, key):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+
+    def test_token_per_device(self):
+        """Test each login gets its own token and the others stay valid"""
+        phone = self.issue(name='phone')
+        laptop = self.issue(name='laptop')
+
+        self.assertNotEqual(phone, laptop)
+        for key in (phone, laptop):
+            self.authorize(key)
+            res = self.client.get(ME_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(AUTH_TOKEN_MAX_PER_USER=2)
+    def test_oldest_tokens_dropped(self):
+        """Test a user keeps only the most recent tokens"""
+        keys = [self.issue() for _ in range(3)]
+
+        self.assertEqual(
+            set(AuthToken.objects.values_list('key', flat=True)),
+            set(keys[1:])
+        )
+
+    def test_expired_token_rejected(self):
+        """Test a token unused past its expiry no longer authenticates"""
+        key = self.issue()
+        AuthToken.objects.update(expires=timezone.now())
+        self.authorize(key)
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_renewed_at_most_once_per_interval(self):
+        """Test use extends the expiry, but not on every request"""
+        key = self.issue()
+        token = AuthToken.objects.get()
+        self.authorize(key)
+
+        self.client.get(ME_URL)
+        self.assertEqual(AuthToken.objects.get().expires, token.expires)
+
+        stale = timezone.now() + timedelta(days=1)
+        AuthToken.objects.update(expires=stale)
+        self.client.get(ME_URL)
+
+        token.refresh_from_db()
+        self.assertGreater(token.expires, stale + timedelta(days=1))
+
+    def test_revoke_current_token(self):
+        """Test a device can sign out without affecting the others"""
+        phone = self.issue()
+        laptop = self.issue()
+        self.authorize(phone)
+
+        res = self.client.delete(CURRENT_TOKEN_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            list(AuthToken.objects.values_list('key', flat=True)),
+            [laptop]
+        )
@@ -8,5 +8,10 @@ app_name = 'user'
 urlpatterns = [
     path('create/', views.CreateUserView.as_view(), name='create'),
     path('token/', views.CreateTokenView.as_view(), name='token'),
+    path(
+        'token/current/',
+        views.CurrentTokenView.as_view(),
+        name='current-token'
+    ),
     path('me/', views.ManageUserView.as_view(), name='me'),
 ]
@@ -1,6 +1,11 @@
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions, status
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+from core.authentication import ExpiringTokenAuthentication
+from core.models import AuthToken
+from core.purge import request_purge
 from user.serializers import UserSerializer, AuthTokenSerializer
 
 
@@ -14,13 +19,44 @@ class CreateTokenView(ObtainAuthToken):
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
+    def post(self, request, *args, **kwargs):
+        """Issue a new token, one per device, keeping the user's others"""
+        serializer = self.serializer_class(
+            data=request.data,
+            context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        token = AuthToken.objects.issue(
+            serializer.validated_data['user'],
+            name=serializer.validated_data.get('name', '')
+        )
+        return Response({'token': token.key, 'expires': token.expires})
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+
+class CurrentTokenView(APIView):
+    """Revoke the token used to authenticate the request"""
+    authentication_classes = (ExpiringTokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def delete(self, request):
+        request.auth.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     """Manage authenticated user"""
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):
         """Retrieve and return authenitcated user"""
         return self.request.user
+
+    def destroy(self, request, *args, **kwargs):
+        """Deactivate the user now and delete their data in background"""
+        purge = request_purge(self.get_object())
+        return Response(
+            {'requested': purge.requested},
+            status=status.HTTP_202_ACCEPTED
+        )